@@ -0,0 +1,4 @@
+"""Benchmarks of the sync phases, against fake Notion and GCal APIs.
+
+Run them with ``python -m benchmarks.run`` (see `benchmarks.run`).
+"""
@@ -0,0 +1,104 @@
+"""Measure how long each form of date, or date and time, takes to parse.
+
+```bash
+python -m benchmarks.dates --number 100000
+```
+
+Each form that Notion and GCal send is parsed by:
+
+- ``cascade``: the formats that ncal tried one after another before `ncal.dates`
+  (a date, then a date and time with milliseconds, then with microseconds, with
+  the offset sliced off), falling back to ``isoparse``
+- ``isoparse``: `dateutil.parser.isoparse`, which GCal dates and times were
+  parsed with
+- ``parse``: `ncal.dates.parse`, without its memo
+- ``parse (memoised)``: `ncal.dates.parse`, parsing the same string again, as it
+  does for pages edited in the same minute, or events on the same day
+"""
+import datetime
+import json
+import timeit
+from dataclasses import asdict, dataclass
+from typing import Any, Callable, Final
+
+import dateutil.parser
+import typer
+
+from ncal import dates
+
+FORMS: Final = {
+    "date": "2022-03-01",
+    "notion datetime": "2022-03-01T10:00:00.000+01:00",
+    "gcal datetime": "2022-03-01T10:00:00+01:00",
+    "utc datetime": "2022-03-01T09:00:00.000Z",
+}
+
+
+def cascade(value: str) -> datetime.datetime:
+    """Parse a date, or date and time, as ncal did before `ncal.dates`."""
+    try:
+        return datetime.datetime.strptime(value, "%Y-%m-%d")
+    except ValueError:
+        pass
+    try:
+        return datetime.datetime.strptime(value[:-6], "%Y-%m-%dT%H:%M:%S.000")
+    except ValueError:
+        pass
+    try:
+        return datetime.datetime.strptime(value[:-6], "%Y-%m-%dT%H:%M:%S.%f")
+    except ValueError:
+        return dateutil.parser.isoparse(value)
+
+
+PARSERS: Final[dict[str, Callable[[str], Any]]] = {
+    "cascade": cascade,
+    "isoparse": dateutil.parser.isoparse,
+    "parse": dates.parse.__wrapped__,  # type: ignore
+    "parse (memoised)": dates.parse,
+}
+
+app = typer.Typer()
+
+
+@dataclass
+class Result:
+    """How long a parser took to parse a form.
+
+    Attributes:
+        form: The form that was parsed, one of `FORMS`
+        parser: What parsed it, one of `PARSERS`
+        seconds: The time each parse took, at best
+    """
+
+    form: str
+    parser: str
+    seconds: float
+
+
+def measure(form: str, parser: str, number: int, repeat: int = 5) -> Result:
+    """Time a parser, on one form."""
+    parse, value = PARSERS[parser], FORMS[form]
+    times = timeit.repeat(lambda: parse(value), number=number, repeat=repeat)
+    return Result(form, parser, min(times) / number)
+
+
+@app.command()
+def main(
+    number: int = typer.Option(20000, help="Parses in each timing"),
+    json_output: bool = typer.Option(False, "--json", help="Print json lines"),
+) -> None:
+    """Benchmark each date parser, on each form."""
+    if not json_output:
+        typer.echo(f"{'form':<16} {'parser':<17} {'ns per item':>11}")
+    for form in FORMS:
+        for parser in PARSERS:
+            result = measure(form, parser, number)
+            typer.echo(
+                json.dumps(asdict(result))
+                if json_output
+                else f"{form:<16} {parser:<17} {result.seconds * 1e9:11.0f}"
+            )
+
+
+if __name__ == "__main__":
+    app()
@@ -0,0 +1,458 @@
+"""In memory stand-ins for the Notion and Google Calendar API clients.
+
+They answer the requests that a sync pass makes straight away, so that a benchmark
+measures ncal's own work rather than the network. Their answers look like the real
+APIs' (e.g. Notion dates are reformatted, and GCal events are given an organizer),
+and are fresh copies, as if they had just been parsed from a response.
+
+Every request is counted by endpoint, in an `ApiCalls`:
+
+```python
+>>> notion = FakeNotion("db", [])
+>>> notion.databases.query("db")["results"]
+[]
+>>> notion.calls.counts()
+{'notion.databases.query': 1}
+
+```
+
+Recorded responses can be replayed by passing the recorded pages and events in.
+"""
+import itertools
+import json
+import threading
+from collections import Counter
+from types import SimpleNamespace
+from typing import Any, Callable, Final, Optional
+
+import arrow
+import httplib2  # type: ignore
+from googleapiclient.errors import HttpError  # type: ignore
+
+Page = dict[str, Any]
+Event = dict[str, Any]
+
+# the most results in one page of a Notion query
+NOTION_PAGE_SIZE: Final = 100
+NOTION_TIME_FORMAT: Final = "YYYY-MM-DDTHH:mm:ss.SSSZZ"
+
+
+class ApiCalls:
+    """A thread safe count of the requests made to each endpoint."""
+
+    def __init__(self) -> None:
+        """Start with no requests."""
+        self._lock = threading.Lock()
+        self._counts: Counter[str] = Counter()
+
+    def add(self, endpoint: str) -> None:
+        """Count a request."""
+        with self._lock:
+            self._counts[endpoint] += 1
+
+    def counts(self) -> dict[str, int]:
+        """Get the number of requests to each endpoint, by name."""
+        with self._lock:
+            return dict(sorted(self._counts.items()))
+
+    def reset(self) -> None:
+        """Forget the requests made so far."""
+        with self._lock:
+            self._counts.clear()
+
+
+def copy(value: Any) -> Any:
+    """Copy a response, as a client would get it from the json it was sent."""
+    return json.loads(json.dumps(value))
+
+
+def last_edited_now() -> str:
+    """Get the time now, as a Notion ``last_edited_time`` (to the minute)."""
+    return arrow.utcnow().floor("minute").format("YYYY-MM-DDTHH:mm:ss.SSS") + "Z"
+
+
+def notion_date(value: Optional[str]) -> Optional[str]:
+    """Format a date or date time the way that Notion sends them back.
+
+    ```python
+    >>> notion_date("2022-01-10T08:00:00")
+    '2022-01-10T08:00:00.000+00:00'
+    >>> notion_date("2022-01-10")
+    '2022-01-10'
+
+    ```
+    """
+    if value is None or "T" not in value:
+        return value
+    return arrow.get(value).format(NOTION_TIME_FORMAT)
+
+
+def notion_property(value: dict[str, Any]) -> dict[str, Any]:
+    """Fill in a property value, as written to Notion, the way Notion returns it."""
+    value = copy(value)
+    for rich_text_type in ("title", "rich_text"):
+        for item in value.get(rich_text_type) or []:
+            item.setdefault("type", "text")
+            item.setdefault("plain_text", item["text"]["content"])
+    if value.get("date"):
+        value["date"]["start"] = notion_date(value["date"]["start"])
+        value["date"]["end"] = notion_date(value["date"].get("end"))
+    return value
+
+
+class FakeNotion:
+    """A Notion client with one database.
+
+    Only the queries that a sync pass makes when it shares a
+    `ncal.snapshot.SyncSnapshot` are understood: every page, or the pages edited
+    since a time.
+
+    ``need_update_name`` is a formula property, worked out like the one in the ncal
+    Notion template: whether the page was last edited after ``last_updated_name``.
+
+    Attributes:
+        database_id: The id of the database
+        calls: The requests made so far
+    """
+
+    def __init__(
+        self,
+        database_id: str,
+        pages: list[Page],
+        titles: Optional[dict[str, str]] = None,
+        schema: Optional[dict[str, dict[str, Any]]] = None,
+        need_update_name: str = "NeedGCalUpdate",
+        last_updated_name: str = "Last Updated Time",
+    ) -> None:
+        """Fill the database.
+
+        Args:
+            database_id: The id of the database
+            pages: The pages in it
+            titles: {page id: title} of the pages outside of the database, for
+                relation properties
+            schema: {property name: empty value} of every property, for new pages
+        """
+        self.database_id = database_id
+        self.calls = ApiCalls()
+        self.need_update_name = need_update_name
+        self.last_updated_name = last_updated_name
+        self._pages = {page["id"]: copy(page) for page in pages}
+        self._titles = dict(titles or {})
+        self._schema = copy(schema or {})
+        self._ids = itertools.count(len(self._pages))
+        self._lock = threading.Lock()
+        self.databases = SimpleNamespace(query=self._counted("databases.query"))
+        self.pages = SimpleNamespace(
+            create=self._counted("pages.create"),
+            retrieve=self._counted("pages.retrieve"),
+            update=self._counted("pages.update"),
+            properties=SimpleNamespace(
+                retrieve=self._counted("pages.properties.retrieve")
+            ),
+        )
+
+    def _counted(self, endpoint: str) -> Callable[..., Any]:
+        method = getattr(self, "_" + endpoint.replace(".", "_"))
+
+        def call(*args: Any, **kwargs: Any) -> Any:
+            self.calls.add(f"notion.{endpoint}")
+            with self._lock:
+                return copy(method(*args, **kwargs))
+
+        return call
+
+    def all_pages(self) -> list[Page]:
+        """Get a copy of every page in the database."""
+        with self._lock:
+            return copy(list(self._pages.values()))
+
+    def _databases_query(
+        self,
+        database_id: str,
+        filter: Optional[dict[str, Any]] = None,
+        sorts: Optional[list[dict[str, Any]]] = None,
+        start_cursor: Optional[str] = None,
+        page_size: int = NOTION_PAGE_SIZE,
+    ) -> dict[str, Any]:
+        if database_id != self.database_id:
+            raise ValueError(f"There is no database {database_id!r}")
+        pages = list(self._pages.values())
+        if filter is not None:
+            if filter.get("timestamp") != "last_edited_time":
+                raise NotImplementedError(f"Unsupported filter: {filter}")
+            since = arrow.get(filter["last_edited_time"]["on_or_after"])
+            pages = [p for p in pages if arrow.get(p["last_edited_time"]) >= since]
+        if sorts:
+            pages.sort(key=lambda page: page["last_edited_time"])
+        start = int(start_cursor or 0)
+        end = start + min(page_size, NOTION_PAGE_SIZE)
+        return {
+            "object": "list",
+            "results": pages[start:end],
+            "next_cursor": str(end) if end < len(pages) else None,
+            "has_more": end < len(pages),
+        }
+
+    def _pages_create(
+        self, parent: dict[str, Any], properties: dict[str, Any]
+    ) -> dict[str, Any]:
+        if parent.get("database_id") != self.database_id:
+            raise ValueError(f"There is no database {parent!r}")
+        page_id = f"page-{next(self._ids)}"
+        page = {
+            "object": "page",
+            "id": page_id,
+            "parent": {"type": "database_id", "database_id": self.database_id},
+            "archived": False,
+            "properties": copy(self._schema),
+        }
+        self._pages[page_id] = page
+        return self._write(page, properties)
+
+    def _pages_retrieve(self, page_id: str) -> dict[str, Any]:
+        return self._pages[page_id]
+
+    def _pages_update(self, page_id: str, properties: dict[str, Any]) -> Page:
+        return self._write(self._pages[page_id], properties)
+
+    def _pages_properties_retrieve(
+        self, page_id: str, property_id: str
+    ) -> dict[str, Any]:
+        title = self._titles[page_id]
+        return {
+            "object": "list",
+            "results": [
+                {
+                    "object": "property_item",
+                    "type": "title",
+                    "title": {
+                        "type": "text",
+                        "text": {"content": title},
+                        "plain_text": title,
+                    },
+                }
+            ],
+            "next_cursor": None,
+            "has_more": False,
+        }
+
+    def _write(self, page: Page, properties: dict[str, Any]) -> Page:
+        for name, value in properties.items():
+            page["properties"].setdefault(name, {}).update(notion_property(value))
+        page["last_edited_time"] = last_edited_now()
+        last_updated = (page["properties"].get(self.last_updated_name) or {}).get(
+            "date"
+        )
+        if self.need_update_name in page["properties"]:
+            need_update = last_updated is None or arrow.get(
+                page["last_edited_time"]
+            ) > arrow.get(last_updated["start"]).floor("minute")
+            page["properties"][self.need_update_name]["formula"] = {
+                "type": "boolean",
+                "boolean": need_update,
+            }
+        return page
+
+
+def not_found(message: str) -> HttpError:
+    """Make the error that GCal gives for a missing event."""
+    content = {"error": {"code": 404, "message": message}}
+    return HttpError(
+        httplib2.Response({"status": 404, "reason": "Not Found"}),
+        json.dumps(content).encode(),
+    )
+
+
+def event_time(time: dict[str, str]) -> arrow.Arrow:
+    """Get the start or end of an event."""
+    if "dateTime" in time:
+        return arrow.get(time["dateTime"])
+    return arrow.get(time["date"])
+
+
+class FakeRequest:
+    """An unexecuted GCal request, which is counted when it is executed."""
+
+    def __init__(self, calendar: "FakeCalendar", endpoint: str, **kwargs: Any):
+        """Make a request to `endpoint` of `calendar`."""
+        self.calendar = calendar
+        self.endpoint = endpoint
+        self.kwargs = kwargs
+        # as googleapiclient names it
+        self.methodId = f"calendar.events.{endpoint}"
+
+    def execute(self) -> Any:
+        """Send the request."""
+        return self.calendar.execute(self.endpoint, self.kwargs)
+
+
+class FakeBatch:
+    """A GCal batch request."""
+
+    def __init__(self, calls: ApiCalls) -> None:
+        """Start an empty batch."""
+        self.calls = calls
+        self._requests: list[tuple[FakeRequest, Callable[..., None]]] = []
+
+    def add(self, request: FakeRequest, callback: Callable[..., None]) -> None:
+        """Add a request to the batch."""
+        self._requests.append((request, callback))
+
+    def execute(self) -> None:
+        """Send every request in one round trip."""
+        self.calls.add("gcal.batch")
+        for i, (request, callback) in enumerate(self._requests):
+            try:
+                response = request.execute()
+            except HttpError as e:
+                callback(str(i), None, e)
+            else:
+                callback(str(i), response, None)
+
+
+class FakeCalendar:
+    """A Google Calendar API client, for some calendars.
+
+    Events are listed like the real API does: a full listing leaves out cancelled
+    events, and each listing ends with a sync token, which lists only the events
+    changed since (cancelled ones too).
+
+    Requests that are sent in a batch are counted both on their own and as part of
+    a ``gcal.batch``, the real round trip.
+
+    Attributes:
+        calls: The requests made so far
+    """
+
+    def __init__(self, events: dict[str, list[Event]]) -> None:
+        """Fill the calendars.
+
+        Args:
+            events: {calendar id: its events}
+        """
+        self.calls = ApiCalls()
+        self._lock = threading.Lock()
+        self._versions = itertools.count(1)
+        self._ids = itertools.count(sum(map(len, events.values())))
+        # calendar id -> event id -> (event, version it was last changed at)
+        self._calendars: dict[str, dict[str, tuple[Event, int]]] = {}
+        for calendar_id, calendar_events in events.items():
+            self._calendars[calendar_id] = {}
+            for event in calendar_events:
+                self._store(calendar_id, event, event["id"])
+
+    def events(self) -> SimpleNamespace:
+        """Get the events resource."""
+        return SimpleNamespace(
+            **{
+                method: lambda method=method, **kwargs: FakeRequest(
+                    self, f"events.{method}", **kwargs
+                )
+                for method in ("list", "get", "insert", "update", "move", "delete")
+            }
+        )
+
+    def new_batch_http_request(self) -> FakeBatch:
+        """Start a batch of requests."""
+        return FakeBatch(self.calls)
+
+    def all_events(self, calendar_id: str) -> list[Event]:
+        """Get a copy of every (not cancelled) event on a calendar."""
+        with self._lock:
+            return [
+                copy(event)
+                for event, _ in self._calendars[calendar_id].values()
+                if event["status"] != "cancelled"
+            ]
+
+    def execute(self, endpoint: str, kwargs: dict[str, Any]) -> Any:
+        """Answer a request."""
+        self.calls.add(f"gcal.{endpoint}")
+        method = getattr(self, "_" + endpoint.replace(".", "_"))
+        with self._lock:
+            return copy(method(**kwargs))
+
+    def _store(self, calendar_id: str, body: Event, event_id: str) -> Event:
+        version = next(self._versions)
+        event = {
+            **copy(body),
+            "kind": "calendar#event",
+            "id": event_id,
+            "status": body.get("status", "confirmed"),
+            "etag": f'"{version}"',
+            "updated": arrow.utcnow().format("YYYY-MM-DDTHH:mm:ss.SSS") + "Z",
+            "organizer": {"email": calendar_id, "self": True},
+        }
+        for end in ("start", "end"):
+            time = event[end]
+            if "dateTime" in time:
+                tz = time.get("timeZone", "UTC")
+                time["dateTime"] = (
+                    arrow.get(time["dateTime"], tzinfo=tz).to(tz).isoformat()
+                )
+        self._calendars.setdefault(calendar_id, {})[event_id] = (event, version)
+        return event
+
+    def _find(self, calendar_id: str, event_id: str) -> Event:
+        try:
+            event, _ = self._calendars[calendar_id][event_id]
+        except KeyError:
+            raise not_found(f"No event {event_id} on {calendar_id}") from None
+        if event["status"] == "cancelled":
+            raise not_found(f"Event {event_id} was deleted")
+        return event
+
+    def _events_list(
+        self,
+        calendarId: str,
+        maxResults: int = 250,
+        pageToken: Optional[str] = None,
+        syncToken: Optional[str] = None,
+        timeMin: Optional[str] = None,
+        timeMax: Optional[str] = None,
+    ) -> dict[str, Any]:
+        events = self._calendars.get(calendarId, {}).values()
+        if syncToken is not None:
+            items = [event for event, version in events if version > int(syncToken)]
+        else:
+            start = arrow.get(timeMin) if timeMin else None
+            end = arrow.get(timeMax) if timeMax else None
+            items = [
+                event
+                for event, _ in events
+                if event["status"] != "cancelled"
+                and (start is None or event_time(event["end"]) > start)
+                and (end is None or event_time(event["start"]) < end)
+            ]
+        first = int(pageToken or 0)
+        last = first + maxResults
+        response: dict[str, Any] = {
+            "kind": "calendar#events",
+            "items": items[first:last],
+        }
+        if last < len(items):
+            response["nextPageToken"] = str(last)
+        else:
+            response["nextSyncToken"] = str(next(self._versions))
+        return response
+
+    def _events_get(self, calendarId: str, eventId: str) -> Event:
+        return self._find(calendarId, eventId)
+
+    def _events_insert(self, calendarId: str, body: Event) -> Event:
+        return self._store(calendarId, body, f"event{next(self._ids)}")
+
+    def _events_update(self, calendarId: str, eventId: str, body: Event) -> Event:
+        self._find(calendarId, eventId)
+        return self._store(calendarId, body, eventId)
+
+    def _events_move(self, calendarId: str, eventId: str, destination: str) -> Event:
+        event = self._find(calendarId, eventId)
+        self._store(calendarId, {**event, "status": "cancelled"}, eventId)
+        return self._store(destination, event, eventId)
+
+    def _events_delete(self, calendarId: str, eventId: str) -> str:
+        event = self._find(calendarId, eventId)
+        self._store(calendarId, {**event, "status": "cancelled"}, eventId)
+        return ""
@@ -0,0 +1,281 @@
+"""Measure how long each part of a sync takes, and what it asks of the APIs.
+
+```bash
+python -m benchmarks.run --pages 100 --pages 1000 --pages 10000 --calendars 3
+```
+
+For each size of database, the fetch of the database that the phases share, each
+phase in `ncal.phases.PHASES`, and the whole of `ncal.runner.sync` are run on a
+fresh workspace (see `benchmarks.workspace`), and measured for:
+
+- wall time
+- API requests, by endpoint
+- the peak memory allocated while it ran, from `tracemalloc` (in a second run, as
+  tracing slows everything down)
+
+No network is used, so the wall time is ncal's own work: the fake APIs answer
+straight away, and aren't rate limited. With ``--http``, the fake APIs are served
+over HTTP instead (see `benchmarks.servers`), with any latency and errors asked
+for, and ncal's own clients are used, so that the rate limits, retries and GCal
+batches are measured too:
+
+```bash
+python -m benchmarks.run --http --latency 0.05 --throttle-rate gcal.batch=0.1
+```
+
+The servers run in the same process, so their allocations count towards the peak
+memory.
+"""
+import asyncio
+import contextlib
+import io
+import json
+import time
+import tracemalloc
+from dataclasses import asdict, dataclass
+from typing import Any, Callable, Final, List, Optional
+
+import typer
+
+from benchmarks.servers import FakeServers, Faults, parse_rates
+from benchmarks.workspace import Workspace, make_workspace
+from ncal import core, phases, runner
+from ncal.notion_utils import relation_title_cache
+from ncal.snapshot import SyncSnapshot
+from ncal.state import SyncTokenStore
+
+SCENARIOS: Final = ("fetch", *phases.PHASES, "sync")
+
+app = typer.Typer()
+
+
+@dataclass
+class Result:
+    """The measurements of one scenario.
+
+    Attributes:
+        scenario: What was run, one of `SCENARIOS`
+        pages: The number of pages in the database
+        calendars: The number of calendars
+        seconds: Wall time
+        changes: The number of pages and events changed (or fetched, for "fetch")
+        calls: {endpoint: number of requests}
+        peak_memory: Bytes allocated at the peak, if it was measured
+    """
+
+    scenario: str
+    pages: int
+    calendars: int
+    seconds: float
+    changes: int
+    calls: dict[str, int]
+    peak_memory: Optional[int] = None
+
+
+def prepare(
+    scenario: str,
+    pages: int,
+    calendars: int,
+    seed: int = 0,
+    faults: Optional[Faults] = None,
+    requests_per_second: Optional[float] = None,
+    stack: Optional[contextlib.ExitStack] = None,
+) -> tuple[Workspace, Callable[[], int], Optional[FakeServers]]:
+    """Set up a workspace to run a scenario on.
+
+    A phase is given a snapshot of the database, as it is in a sync pass, which is
+    fetched here so that it isn't measured.
+
+    If `faults` are given, the workspace is served by `benchmarks.servers`, and
+    ncal's own API clients are used, so that rate limiting and retries are
+    measured too. The servers are stopped when `stack` is closed.
+
+    Returns:
+        (the workspace, a function which runs the scenario and returns the number
+        of changes, the servers if there are any)
+    """
+    workspace = make_workspace(pages, calendars, seed)
+    settings = workspace.settings
+    # stand in for a Resource and a notion_client.Client
+    service: Any = workspace.calendar
+    notion: Any = workspace.notion
+    servers = None
+    if faults is not None:
+        if stack is None:
+            raise ValueError("Serving a workspace needs a stack to stop it with")
+        servers = stack.enter_context(FakeServers(workspace, faults))
+        rates = {}
+        if requests_per_second is not None:
+            rates = {
+                "notion_requests_per_second": requests_per_second,
+                "gcal_requests_per_second": requests_per_second,
+            }
+        settings = servers.settings(**rates)
+        service, _, notion = core.setup_api_connections(
+            default_calendar_id=settings.default_calendar_id,
+            credentials_location=settings.credentials_location,
+            notion_api_token=settings.notion_api_token,
+            client_secret_location=settings.client_secret_location,
+            notion_requests_per_second=settings.notion_requests_per_second,
+            gcal_requests_per_second=settings.gcal_requests_per_second,
+            max_retries=settings.max_retries,
+            notion_api_url=settings.notion_api_url,
+            gcal_api_url=settings.gcal_api_url,
+        )
+    relation_title_cache.invalidate()
+
+    def run() -> int:
+        if scenario == "fetch":
+            return len(SyncSnapshot.fetch(notion, settings).pages)
+        if scenario == "sync":
+            # keep the progress bar out of the results
+            with contextlib.redirect_stdout(io.StringIO()):
+                return asyncio.run(
+                    runner.sync(settings, service, notion, SyncTokenStore(None))
+                )
+        return phases.PHASES[scenario](
+            settings,
+            service,
+            notion,
+            snapshot=snapshot,
+            sync_tokens=SyncTokenStore(None),
+        )
+
+    snapshot = (
+        SyncSnapshot.fetch(notion, settings) if scenario in phases.PHASES else None
+    )
+    workspace.notion.calls.reset()
+    if servers is not None:
+        servers.notion.failures.reset()
+    return workspace, run, servers
+
+
+def measure(
+    scenario: str,
+    pages: int,
+    calendars: int,
+    seed: int = 0,
+    memory: bool = True,
+    faults: Optional[Faults] = None,
+    requests_per_second: Optional[float] = None,
+) -> Result:
+    """Run a scenario, and measure it.
+
+    ```python
+    >>> result = measure("new N->G", pages=20, calendars=2, memory=False)
+    >>> result.calls["gcal.events.insert"] == result.changes
+    True
+
+    ```
+
+    Args:
+        scenario: One of `SCENARIOS`
+        pages: The number of pages in the database
+        calendars: The number of calendars
+        seed: Picks the workspace (see `benchmarks.workspace.make_workspace`)
+        memory: Whether to measure the peak memory too
+        faults: If given, the APIs are served over HTTP, misbehaving like this
+        requests_per_second: The rate limit of each API, when served over HTTP
+            (the limit in the settings if None)
+
+    Returns:
+        The measurements, with the requests that the servers failed on purpose
+        counted as ``"{endpoint} {status}"``
+    """
+    with contextlib.ExitStack() as stack:
+        workspace, run, servers = prepare(
+            scenario, pages, calendars, seed, faults, requests_per_second, stack
+        )
+        start = time.perf_counter()
+        changes = run()
+        seconds = time.perf_counter() - start
+        calls = {
+            **workspace.notion.calls.counts(),
+            **workspace.calendar.calls.counts(),
+        }
+        if servers is not None:
+            calls.update(servers.failures())
+
+    peak_memory = None
+    if memory:
+        with contextlib.ExitStack() as stack:
+            _, run, _ = prepare(
+                scenario, pages, calendars, seed, faults, requests_per_second, stack
+            )
+            tracemalloc.start()
+            try:
+                run()
+                _, peak_memory = tracemalloc.get_traced_memory()
+            finally:
+                tracemalloc.stop()
+    return Result(scenario, pages, calendars, seconds, changes, calls, peak_memory)
+
+
+def format_result(result: Result) -> str:
+    """Format a result as a line of a table."""
+    peak_memory = (
+        f"{result.peak_memory / 2**20:9.1f}" if result.peak_memory is not None else ""
+    )
+    calls = " ".join(f"{endpoint}={n}" for endpoint, n in result.calls.items())
+    return (
+        f"{result.pages:>6} {result.calendars:>4} {result.scenario:<14} "
+        f"{result.seconds:9.3f} {peak_memory:>9} {result.changes:>8}  {calls}"
+    )
+
+
+HEADER: Final = (
+    f"{'pages':>6} {'cals':>4} {'scenario':<14} {'seconds':>9} {'peak MiB':>9} "
+    f"{'changes':>8}  requests"
+)
+
+
+@app.command()
+def main(
+    pages: List[int] = typer.Option([100, 1000], help="Pages in the database"),
+    calendars: int = typer.Option(3, help="Calendars to sync"),
+    scenario: List[str] = typer.Option(
+        list(SCENARIOS), help=f"What to run: {', '.join(SCENARIOS)}"
+    ),
+    seed: int = typer.Option(0, help="Picks the workspace"),
+    memory: bool = typer.Option(True, help="Measure the peak memory"),
+    json_output: bool = typer.Option(False, "--json", help="Print json lines"),
+    http: bool = typer.Option(
+        False, help="Serve the APIs over HTTP, and use ncal's own clients"
+    ),
+    latency: List[str] = typer.Option([], help="With --http: [ENDPOINT=]SECONDS"),
+    throttle_rate: List[str] = typer.Option(
+        [], help="With --http: [ENDPOINT=]SHARE, sent 429s"
+    ),
+    error_rate: List[str] = typer.Option(
+        [], help="With --http: [ENDPOINT=]SHARE, sent 503s"
+    ),
+    requests_per_second: Optional[float] = typer.Option(
+        None, help="With --http: the rate limit of each API"
+    ),
+) -> None:
+    """Benchmark each sync phase against fake APIs."""
+    faults = None
+    if http:
+        faults = Faults(
+            parse_rates(latency),
+            parse_rates(throttle_rate),
+            parse_rates(error_rate),
+            seed,
+        )
+    unknown = set(scenario) - set(SCENARIOS)
+    if unknown:
+        raise typer.BadParameter(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+    if not json_output:
+        typer.echo(HEADER)
+    for n in pages:
+        for name in scenario:
+            result = measure(
+                name, n, calendars, seed, memory, faults, requests_per_second
+            )
+            typer.echo(
+                json.dumps(asdict(result)) if json_output else format_result(result)
+            )
+
+
+if __name__ == "__main__":
+    app()
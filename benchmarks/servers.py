@@ -0,0 +1,517 @@
+"""Local HTTP servers which stand in for the Notion and Google Calendar APIs.
+
+They serve the fake APIs of `benchmarks.fakes` over HTTP, so that a sync can be
+run through its real clients (rate limiting, retries, GCal batches and all) without
+touching a real account. Point ncal at them with the ``notion_api_url`` and
+``gcal_api_url`` settings (see `ncal.core.setup_api_connections`).
+
+Each server can be made to misbehave with `Faults`: a delay before each response,
+and a share of requests answered with 429 (throttled) or 5xx errors. Requests
+inside a GCal batch fail one by one, as they do on the real API.
+
+```python
+servers = FakeServers(make_workspace(pages=1000, calendars=3), Faults(
+    latency={"*": 0.05}, throttle_rate={"notion.pages.update": 0.1}
+))
+with servers:
+    settings = servers.settings()  # the workspace's settings, with the URLs
+    ...
+```
+
+Or, to sync with ``ncal sync`` (using the settings that are printed):
+
+```bash
+python -m benchmarks.servers --pages 1000 --calendars 3 --latency '*=0.05'
+```
+"""
+import abc
+import email.parser
+import json
+import logging
+import random
+import re
+import threading
+import time
+import urllib.parse
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Final, List, Optional
+
+import typer
+from googleapiclient.errors import HttpError  # type: ignore
+
+from benchmarks.fakes import ApiCalls, FakeCalendar, FakeNotion
+from benchmarks.workspace import Workspace, make_workspace
+from ncal.config import Settings
+
+# (status, headers, body); a body of None is sent as no content
+Response = tuple[int, dict[str, str], Optional[Any]]
+
+# how many seconds a throttled request is asked to wait for
+RETRY_AFTER: Final = 0.1
+
+
+@dataclass
+class Faults:
+    """How a fake server misbehaves.
+
+    Each is keyed by endpoint (as counted by `benchmarks.fakes.ApiCalls`, e.g.
+    ``"gcal.events.insert"`` or ``"gcal.batch"``), with ``"*"`` for the rest.
+
+    Attributes:
+        latency: Seconds to wait before responding
+        throttle_rate: The share of requests answered with a 429
+        error_rate: The share of requests answered with a 503
+        seed: Picks which requests fail
+    """
+
+    latency: dict[str, float] = field(default_factory=dict)
+    throttle_rate: dict[str, float] = field(default_factory=dict)
+    error_rate: dict[str, float] = field(default_factory=dict)
+    seed: int = 0
+
+    def __post_init__(self) -> None:
+        """Set up the random choice of failures."""
+        self._random = random.Random(self.seed)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _get(values: dict[str, float], endpoint: str) -> float:
+        return values.get(endpoint, values.get("*", 0))
+
+    def delay(self, endpoint: str) -> float:
+        """Get the latency of an endpoint."""
+        return self._get(self.latency, endpoint)
+
+    def failure(self, endpoint: str) -> Optional[int]:
+        """Pick whether a request fails.
+
+        ```python
+        >>> faults = Faults(
+        ...     throttle_rate={"*": 1}, error_rate={"notion.pages.update": 1}
+        ... )
+        >>> faults.failure("notion.pages.update"), faults.failure("gcal.events.get")
+        (503, 429)
+        >>> Faults().failure("gcal.events.get") is None
+        True
+
+        ```
+
+        Returns:
+            The status to fail with, or None if it succeeds
+        """
+        with self._lock:
+            roll = self._random.random()
+        error_rate = self._get(self.error_rate, endpoint)
+        if roll < error_rate:
+            return 503
+        if roll < error_rate + self._get(self.throttle_rate, endpoint):
+            return 429
+        return None
+
+
+class FakeServer(abc.ABC):
+    """An HTTP server for a fake API, in a background thread.
+
+    Attributes:
+        faults: How the server misbehaves
+        failures: The requests that were failed on purpose, as
+            ``"{endpoint} {status}"``
+        server: The underlying HTTP server
+    """
+
+    def __init__(
+        self, faults: Optional[Faults] = None, host: str = "127.0.0.1", port: int = 0
+    ) -> None:
+        """Set up the server, without starting it (the port is picked if 0)."""
+        self.faults = faults if faults is not None else Faults()
+        self.failures = ApiCalls()
+        self.host = host
+        self.server = ThreadingHTTPServer((host, port), self._make_handler())
+        self.server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        """Get the URL of the server."""
+        return f"http://{self.host}:{self.server.server_port}"
+
+    def _make_handler(self) -> type[BaseHTTPRequestHandler]:
+        fake_server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def handle_request(self) -> None:
+                length = int(self.headers.get("Content-Length") or 0)
+                body = self.rfile.read(length) if length else b""
+                status, headers, content = fake_server.respond(
+                    self.command, self.path, dict(self.headers), body
+                )
+                if not isinstance(content, bytes):
+                    content = (
+                        json.dumps(content).encode() if content is not None else b""
+                    )
+                    headers.setdefault("Content-Type", "application/json")
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header("Content-Length", str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+
+            do_GET = do_POST = do_PUT = do_PATCH = do_DELETE = handle_request
+
+            def log_message(self, format: str, *args) -> None:
+                logging.debug(format % args)
+
+        return Handler
+
+    @abc.abstractmethod
+    def respond(
+        self, method: str, path: str, headers: dict[str, str], body: bytes
+    ) -> Response:
+        """Answer a request (from one of the server's threads)."""
+
+    def misbehave(self, endpoint: str, wait: bool = True) -> Optional[int]:
+        """Wait for the endpoint's latency, then pick whether the request fails.
+
+        Args:
+            endpoint: The endpoint requested
+            wait: Whether to wait (requests in a batch only wait for the batch)
+        """
+        delay = self.faults.delay(endpoint) if wait else 0
+        if delay:
+            time.sleep(delay)
+        status = self.faults.failure(endpoint)
+        if status is not None:
+            self.failures.add(f"{endpoint} {status}")
+        return status
+
+    def start(self) -> None:
+        """Start serving, in a background thread."""
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        logging.info(f"Serving a fake API at {self.url}")
+
+    def stop(self) -> None:
+        """Stop serving."""
+        self.server.shutdown()
+        self.server.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+
+# (method, path pattern, endpoint)
+NOTION_ROUTES: Final = (
+    ("POST", r"/v1/databases/(?P<database_id>[^/]+)/query", "databases.query"),
+    ("POST", r"/v1/pages", "pages.create"),
+    ("GET", r"/v1/pages/(?P<page_id>[^/]+)", "pages.retrieve"),
+    ("PATCH", r"/v1/pages/(?P<page_id>[^/]+)", "pages.update"),
+    (
+        "GET",
+        r"/v1/pages/(?P<page_id>[^/]+)/properties/(?P<property_id>[^/]+)",
+        "pages.properties.retrieve",
+    ),
+)
+
+
+def notion_error(status: int, code: str, message: str) -> Response:
+    """Make a Notion error response."""
+    headers = {"Retry-After": str(RETRY_AFTER)} if status == 429 else {}
+    return (
+        status,
+        headers,
+        {"object": "error", "status": status, "code": code, "message": message},
+    )
+
+
+class FakeNotionServer(FakeServer):
+    """Serves a `benchmarks.fakes.FakeNotion`.
+
+    Attributes:
+        notion: The fake Notion API
+    """
+
+    def __init__(self, notion: FakeNotion, *args: Any, **kwargs: Any) -> None:
+        """Set up the server, without starting it."""
+        super().__init__(*args, **kwargs)
+        self.notion = notion
+
+    def respond(
+        self, method: str, path: str, headers: dict[str, str], body: bytes
+    ) -> Response:
+        """Answer a request to the Notion API."""
+        url = urllib.parse.urlsplit(path)
+        for route_method, pattern, endpoint in NOTION_ROUTES:
+            match = re.fullmatch(pattern, url.path)
+            if method == route_method and match:
+                break
+        else:
+            return notion_error(400, "invalid_request_url", f"No route for {path}")
+
+        status = self.misbehave(f"notion.{endpoint}")
+        if status == 429:
+            return notion_error(429, "rate_limited", "Slow down")
+        if status is not None:
+            return notion_error(status, "service_unavailable", "Try again later")
+
+        function: Any = self.notion
+        for name in endpoint.split("."):
+            function = getattr(function, name)
+        path_arguments = {
+            k: urllib.parse.unquote(v) for k, v in match.groupdict().items()
+        }
+        try:
+            return 200, {}, function(**path_arguments, **(json.loads(body or b"{}")))
+        except (KeyError, ValueError) as e:
+            return notion_error(404, "object_not_found", str(e))
+
+
+# (method, path pattern, endpoint)
+GCAL_ROUTES: Final = (
+    ("GET", r"/calendar/v3/calendars/(?P<calendarId>[^/]+)/events", "events.list"),
+    ("POST", r"/calendar/v3/calendars/(?P<calendarId>[^/]+)/events", "events.insert"),
+    (
+        "GET",
+        r"/calendar/v3/calendars/(?P<calendarId>[^/]+)/events/(?P<eventId>[^/]+)",
+        "events.get",
+    ),
+    (
+        "PUT",
+        r"/calendar/v3/calendars/(?P<calendarId>[^/]+)/events/(?P<eventId>[^/]+)",
+        "events.update",
+    ),
+    (
+        "POST",
+        r"/calendar/v3/calendars/(?P<calendarId>[^/]+)/events/(?P<eventId>[^/]+)/move",
+        "events.move",
+    ),
+    (
+        "DELETE",
+        r"/calendar/v3/calendars/(?P<calendarId>[^/]+)/events/(?P<eventId>[^/]+)",
+        "events.delete",
+    ),
+)
+# the query parameters which GCal methods take, and their types
+GCAL_PARAMETERS: Final = {
+    "maxResults": int,
+    "pageToken": str,
+    "syncToken": str,
+    "timeMin": str,
+    "timeMax": str,
+    "destination": str,
+}
+GCAL_BATCH_PATH: Final = "/batch/calendar/v3"
+
+
+def gcal_error(status: int, reason: str, message: str) -> Response:
+    """Make a GCal error response."""
+    headers = {"Retry-After": str(RETRY_AFTER)} if status == 429 else {}
+    error = {"domain": "global", "reason": reason, "message": message}
+    return (
+        status,
+        headers,
+        {"error": {"code": status, "message": message, "errors": [error]}},
+    )
+
+
+def gcal_failure(status: int) -> Response:
+    """Make the GCal error response for a request failed on purpose."""
+    if status == 429:
+        return gcal_error(429, "rateLimitExceeded", "Rate Limit Exceeded")
+    return gcal_error(status, "backendError", "Backend Error")
+
+
+class FakeCalendarServer(FakeServer):
+    """Serves a `benchmarks.fakes.FakeCalendar`, including batch requests.
+
+    Attributes:
+        calendar: The fake GCal API
+    """
+
+    def __init__(self, calendar: FakeCalendar, *args: Any, **kwargs: Any) -> None:
+        """Set up the server, without starting it."""
+        super().__init__(*args, **kwargs)
+        self.calendar = calendar
+
+    def respond(
+        self, method: str, path: str, headers: dict[str, str], body: bytes
+    ) -> Response:
+        """Answer a request to the Calendar API."""
+        if method == "POST" and urllib.parse.urlsplit(path).path == GCAL_BATCH_PATH:
+            return self.respond_to_batch(headers, body)
+        return self.respond_to_request(method, path, body)
+
+    def respond_to_request(
+        self, method: str, path: str, body: bytes, in_batch: bool = False
+    ) -> Response:
+        """Answer a single request, which may be part of a batch."""
+        url = urllib.parse.urlsplit(path)
+        for route_method, pattern, endpoint in GCAL_ROUTES:
+            match = re.fullmatch(pattern, url.path)
+            if method == route_method and match:
+                break
+        else:
+            return gcal_error(404, "notFound", f"No route for {method} {path}")
+
+        status = self.misbehave(f"gcal.{endpoint}", wait=not in_batch)
+        if status is not None:
+            return gcal_failure(status)
+
+        arguments: dict[str, Any] = {
+            k: urllib.parse.unquote(v) for k, v in match.groupdict().items()
+        }
+        for name, value in urllib.parse.parse_qsl(url.query):
+            if name in GCAL_PARAMETERS:
+                arguments[name] = GCAL_PARAMETERS[name](value)
+        if body:
+            arguments["body"] = json.loads(body)
+        try:
+            response = self.calendar.execute(endpoint, arguments)
+        except HttpError as e:
+            return e.resp.status, {}, json.loads(e.content)
+        if endpoint == "events.delete":
+            return 204, {}, None
+        return 200, {}, response
+
+    def respond_to_batch(self, headers: dict[str, str], body: bytes) -> Response:
+        """Answer a multipart batch, by answering each of its parts."""
+        status = self.misbehave("gcal.batch")
+        if status is not None:
+            return gcal_failure(status)
+        self.calendar.calls.add("gcal.batch")
+
+        content_type = headers.get("Content-Type") or headers["content-type"]
+        message = email.parser.BytesParser().parsebytes(
+            f"Content-Type: {content_type}\r\n\r\n".encode() + body
+        )
+        boundary = "batch_fake_server"
+        parts = []
+        requests: Any = message.get_payload()
+        for part in requests:
+            request_line, request = part.get_payload().split("\n", 1)
+            request_method, request_path, _ = request_line.split(" ")
+            request_body: Any = email.parser.Parser().parsestr(request).get_payload()
+            status, _, content = self.respond_to_request(
+                request_method, request_path, request_body.encode(), in_batch=True
+            )
+            reason = {200: "OK", 204: "No Content"}.get(status, "Error")
+            parts.append(
+                f"--{boundary}\r\n"
+                "Content-Type: application/http\r\n"
+                f"Content-ID: <response-{part['Content-ID'][1:]}\r\n\r\n"
+                f"HTTP/1.1 {status} {reason}\r\n"
+                "Content-Type: application/json; charset=UTF-8\r\n\r\n"
+                f"{json.dumps(content) if content is not None else ''}\r\n"
+            )
+        content = "".join(parts) + f"--{boundary}--\r\n"
+        return (
+            200,
+            {"Content-Type": f"multipart/mixed; boundary={boundary}"},
+            content.encode(),
+        )
+
+
+class FakeServers:
+    """Serve a workspace's database and calendars, while used as a context manager.
+
+    Attributes:
+        workspace: The database and calendars
+        notion: Serves the database
+        calendar: Serves the calendars
+    """
+
+    def __init__(self, workspace: Workspace, faults: Optional[Faults] = None):
+        """Set up both servers, with the same faults."""
+        self.workspace = workspace
+        self.notion = FakeNotionServer(workspace.notion, faults)
+        self.calendar = FakeCalendarServer(workspace.calendar, faults)
+
+    def __enter__(self) -> "FakeServers":
+        """Start both servers."""
+        self.notion.start()
+        self.calendar.start()
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        """Stop both servers."""
+        self.notion.stop()
+        self.calendar.stop()
+
+    def settings(self, **values: Any) -> Settings:
+        """Get the workspace's settings, to sync with these servers."""
+        return self.workspace.settings.copy(
+            update={
+                "notion_api_url": self.notion.url,
+                "gcal_api_url": self.calendar.url,
+                **values,
+            }
+        )
+
+    def failures(self) -> dict[str, int]:
+        """Get the number of requests that each server failed on purpose."""
+        return {**self.notion.failures.counts(), **self.calendar.failures.counts()}
+
+
+def parse_rates(values: List[str]) -> dict[str, float]:
+    """Parse ``endpoint=value`` options, where a bare value is for every endpoint.
+
+    ```python
+    >>> parse_rates(["0.1", "gcal.batch=0.5"])
+    {'*': 0.1, 'gcal.batch': 0.5}
+
+    ```
+    """
+    rates = {}
+    for value in values:
+        endpoint, _, rate = value.rpartition("=")
+        rates[endpoint or "*"] = float(rate)
+    return rates
+
+
+# the settings that a sync of a fake workspace needs, apart from its calendars
+SYNC_SETTINGS: Final = (
+    "notion_api_url",
+    "gcal_api_url",
+    "notion_api_token",
+    "database_id",
+    "url_root",
+    "timezone",
+    "default_calendar_name",
+    "default_calendar_id",
+    "delete_option",
+)
+
+app = typer.Typer()
+
+
+@app.command()
+def main(
+    pages: int = typer.Option(1000, help="Pages in the database"),
+    calendars: int = typer.Option(3, help="Calendars"),
+    seed: int = typer.Option(0, help="Picks the workspace, and the failures"),
+    latency: List[str] = typer.Option([], help="[ENDPOINT=]SECONDS"),
+    throttle_rate: List[str] = typer.Option([], help="[ENDPOINT=]SHARE, sent 429s"),
+    error_rate: List[str] = typer.Option([], help="[ENDPOINT=]SHARE, sent 503s"),
+) -> None:
+    """Serve fake Notion and GCal APIs until interrupted."""
+    faults = Faults(
+        parse_rates(latency), parse_rates(throttle_rate), parse_rates(error_rate), seed
+    )
+    with FakeServers(make_workspace(pages, calendars, seed), faults) as servers:
+        settings = servers.settings()
+        typer.echo("Sync with these settings (e.g. in a config file):\n")
+        for name in SYNC_SETTINGS:
+            typer.echo(f"{name} = {json.dumps(getattr(settings, name))}")
+        typer.echo("\n[calendar_dictionary]")
+        for calendar_name, calendar_id in settings.calendar_dictionary.items():
+            typer.echo(f"{json.dumps(calendar_name)} = {json.dumps(calendar_id)}")
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            typer.echo(f"Failed on purpose: {servers.failures()}")
+
+
+if __name__ == "__main__":
+    app()
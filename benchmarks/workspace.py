@@ -0,0 +1,239 @@
+"""Synthetic Notion databases and calendars, at any scale.
+
+A workspace holds every kind of page that a sync pass deals with, in roughly the
+proportions of a long-used database:
+
+- new pages, not on GCal yet (a quarter of them without a calendar)
+- pages changed in Notion since they were synced (some moved to another calendar)
+- synced pages (a third of them with their event moved on GCal)
+- done pages, whose events are to be deleted
+- and events made on GCal, which aren't in Notion yet
+
+```python
+>>> workspace = make_workspace(pages=20, calendars=2)
+>>> len(workspace.notion.all_pages())
+20
+>>> sorted(workspace.settings.calendar_dictionary)
+['Calendar 0', 'Calendar 1']
+
+```
+"""
+import random
+from dataclasses import dataclass
+from typing import Any, Final, Optional
+
+import arrow
+
+from benchmarks.fakes import Event, FakeCalendar, FakeNotion, Page
+from ncal.config import Settings, load_settings
+
+DATABASE_ID: Final = "benchmark-database"
+PROJECTS: Final = 20
+
+# kind of page: share of the database
+MIX: Final = {"new": 0.2, "changed": 0.15, "synced": 0.55, "done": 0.1}
+# events made on GCal, for every page in the database
+GCAL_ONLY: Final = 0.1
+
+
+@dataclass
+class Workspace:
+    """A database and its calendars, and the settings to sync them with.
+
+    Attributes:
+        settings: Configuration settings
+        notion: The Notion database
+        calendar: The calendars
+    """
+
+    settings: Settings
+    notion: FakeNotion
+    calendar: FakeCalendar
+
+
+def rich_text(content: str) -> list[dict[str, Any]]:
+    """Make a rich text value, as Notion returns it."""
+    return [{"type": "text", "text": {"content": content}, "plain_text": content}]
+
+
+def make_settings(calendars: int) -> Settings:
+    """Make the settings for a workspace with some calendars."""
+    calendar_dictionary = {
+        f"Calendar {i}": f"calendar{i}@group.calendar.google.com"
+        for i in range(calendars)
+    }
+    return load_settings(
+        use_env_vars=False,
+        notion_api_token="secret_benchmark",
+        database_id=DATABASE_ID,
+        url_root="https://www.notion.so/benchmark/",
+        timezone="UTC",
+        default_calendar_name="Calendar 0",
+        default_calendar_id=calendar_dictionary["Calendar 0"],
+        calendar_dictionary=calendar_dictionary,
+        delete_option=True,
+    )
+
+
+def schema(settings: Settings) -> dict[str, dict[str, Any]]:
+    """Get the empty value of every property in the database."""
+    return {
+        settings.task_notion_name: {"type": "title", "title": []},
+        settings.date_notion_name: {"type": "date", "date": None},
+        settings.initiative_notion_name: {"type": "relation", "relation": []},
+        settings.extrainfo_notion_name: {"type": "rich_text", "rich_text": []},
+        settings.on_gcal_notion_name: {"type": "checkbox", "checkbox": False},
+        settings.need_gcal_update_notion_name: {
+            "type": "formula",
+            "formula": {"type": "boolean", "boolean": True},
+        },
+        settings.gcal_event_id_notion_name: {"type": "rich_text", "rich_text": []},
+        settings.lastupdatedtime_notion_name: {"type": "date", "date": None},
+        settings.calendar_notion_name: {"type": "select", "select": None},
+        settings.current_calendar_id_notion_name: {
+            "type": "rich_text",
+            "rich_text": [],
+        },
+        settings.delete_notion_name: {"type": "checkbox", "checkbox": False},
+    }
+
+
+def event_times(start: arrow.Arrow, all_day: bool) -> tuple[dict, dict]:
+    """Make the start and end of an hour long, or all day, GCal event."""
+    if all_day:
+        return (
+            {"date": start.format("YYYY-MM-DD"), "timeZone": "UTC"},
+            {"date": start.shift(days=1).format("YYYY-MM-DD"), "timeZone": "UTC"},
+        )
+    return (
+        {"dateTime": start.format("YYYY-MM-DDTHH:mm:ss"), "timeZone": "UTC"},
+        {
+            "dateTime": start.shift(hours=1).format("YYYY-MM-DDTHH:mm:ss"),
+            "timeZone": "UTC",
+        },
+    )
+
+
+def make_workspace(pages: int, calendars: int = 1, seed: int = 0) -> Workspace:
+    """Make a workspace.
+
+    The same arguments always make the same workspace, apart from its dates, which
+    are in the weeks after today.
+
+    Args:
+        pages: The number of pages in the database
+        calendars: The number of calendars
+        seed: Picks the kinds, dates and calendars of the pages
+
+    Returns:
+        The workspace
+    """
+    rng = random.Random(seed)
+    settings = make_settings(calendars)
+    calendar_names = list(settings.calendar_dictionary)
+    today = arrow.utcnow().floor("day")
+    # pages changed since they were synced were edited after it, and the rest at it
+    last_edited = today.shift(days=-1).format("YYYY-MM-DDTHH:mm:ss.SSS") + "Z"
+    synced_at = {
+        "changed": today.shift(days=-2).format("YYYY-MM-DDTHH:mm:ss.SSSZZ"),
+        "synced": today.shift(days=-1).format("YYYY-MM-DDTHH:mm:ss.SSSZZ"),
+    }
+    events: dict[str, list[Event]] = {
+        calendar_id: [] for calendar_id in settings.calendar_dictionary.values()
+    }
+    event_ids = iter(range(pages + int(pages * GCAL_ONLY)))
+
+    def add_event(calendar_id: str, title: str, start: arrow.Arrow, all_day: bool):
+        event_start, event_end = event_times(start, all_day)
+        event = {
+            "id": f"event{next(event_ids)}",
+            "summary": title,
+            "description": "",
+            "start": event_start,
+            "end": event_end,
+        }
+        events[calendar_id].append(event)
+        return event["id"]
+
+    database: list[Page] = []
+    for i in range(pages):
+        kind = rng.choices(list(MIX), weights=list(MIX.values()))[0]
+        title = f"Task {i}"
+        all_day = rng.random() < 0.3
+        start = today.shift(days=rng.randint(1, 60), hours=0 if all_day else 9)
+        calendar_name: Optional[str] = rng.choice(calendar_names)
+        properties = schema(settings)
+        properties[settings.task_notion_name]["title"] = rich_text(title)
+        properties[settings.date_notion_name]["date"] = {
+            "start": start.format(
+                "YYYY-MM-DD" if all_day else "YYYY-MM-DDTHH:mm:ss.SSSZZ"
+            ),
+            "end": None,
+        }
+        properties[settings.initiative_notion_name]["relation"] = [
+            {"id": f"project-{rng.randrange(PROJECTS)}"}
+        ]
+        if kind == "new":
+            if rng.random() < 0.25:
+                calendar_name = None
+        else:
+            assert calendar_name is not None
+            calendar_id = settings.calendar_dictionary[calendar_name]
+            event_start = start
+            if kind == "synced" and rng.random() < 1 / 3:
+                event_start = start.shift(days=1)
+            if kind == "changed" and rng.random() < 0.1:
+                calendar_name = rng.choice(calendar_names)
+            event_title = f"{title} (old)" if kind == "changed" else title
+            event_id = add_event(calendar_id, event_title, event_start, all_day)
+            properties[settings.on_gcal_notion_name]["checkbox"] = True
+            properties[settings.need_gcal_update_notion_name]["formula"]["boolean"] = (
+                kind == "changed"
+            )
+            properties[settings.gcal_event_id_notion_name]["rich_text"] = rich_text(
+                event_id
+            )
+            properties[settings.current_calendar_id_notion_name][
+                "rich_text"
+            ] = rich_text(calendar_id)
+            properties[settings.lastupdatedtime_notion_name]["date"] = {
+                "start": synced_at.get(kind, synced_at["synced"]),
+                "end": None,
+            }
+            properties[settings.delete_notion_name]["checkbox"] = kind == "done"
+        if calendar_name is not None:
+            properties[settings.calendar_notion_name]["select"] = {
+                "name": calendar_name
+            }
+        database.append(
+            {
+                "object": "page",
+                "id": f"page-{i}",
+                "parent": {"type": "database_id", "database_id": DATABASE_ID},
+                "archived": False,
+                "last_edited_time": last_edited,
+                "properties": properties,
+            }
+        )
+
+    for i in range(int(pages * GCAL_ONLY)):
+        add_event(
+            rng.choice(list(settings.calendar_dictionary.values())),
+            f"Meeting {i}",
+            today.shift(days=rng.randint(1, 60), hours=rng.randint(8, 17)),
+            all_day=False,
+        )
+
+    titles = {f"project-{k}": f"Project {k}" for k in range(PROJECTS)}
+    return Workspace(
+        settings,
+        FakeNotion(
+            DATABASE_ID,
+            database,
+            titles,
+            schema(settings),
+            need_update_name=settings.need_gcal_update_notion_name,
+            last_updated_name=settings.lastupdatedtime_notion_name,
+        ),
+        FakeCalendar(events),
+    )
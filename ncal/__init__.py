@@ -1,4 +1,11 @@
 """A module to synchronise a Notion database with Google Calendar."""
-from importlib.metadata import version
+from typing import Any
 
-__version__ = version("ncal")
+
+def __getattr__(name: str) -> Any:
+    """Look up ``__version__`` when it is first used, as that is slow."""
+    if name == "__version__":
+        from importlib.metadata import version
+
+        return version("ncal")
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
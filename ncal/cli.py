@@ -1,186 +1,43 @@
-"""Command Line Interface for synchronising Google Calendar and Notion."""
-import asyncio
-import datetime
+"""Command Line Interface for synchronising Google Calendar and Notion.
+
+Only typer is imported up front, so that ``ncal --help`` and ``ncal --version``
+answer straight away. The API clients, and everything else that a sync needs, are
+imported by the commands that use them.
+
+The functions that run the syncs are in `ncal.runner`. They can still be imported
+from here too.
+"""
 import logging
 from pathlib import Path
-from typing import Callable, Coroutine, Optional
+from typing import Any, Optional
 
-import arrow
-import notion_client as nc
 import typer
-from googleapiclient.discovery import Resource  # type: ignore
-from pydantic import ValidationError
-
-from ncal import core
-from ncal.config import Settings, load_settings
-
-from . import __version__
 
 app = typer.Typer(help="CLI to sync a Notion database with Google Calendar.")
 state = {"verbose": False}
 
-
-async def scheduler(
-    timedelta: datetime.timedelta, function: Callable[..., Coroutine], f_args: dict
-) -> None:
-    """Schedule an async function.
-
-    Args:
-        timedelta:
-        function:
-        f_args: arguments to pass to the function
-    """
-    next_run = arrow.utcnow() + timedelta
-    print(f"next run: {next_run}")
-    while True:
-        now = arrow.utcnow()
-        if now >= next_run:
-            await function(**f_args)
-            next_run = timedelta + next_run
-            print(f"next run: {next_run}")
-        await asyncio.sleep(1)
+# moved to ncal.runner, and imported from there when they are first used
+_RUNNER_NAMES = frozenset(
+    {
+        "scheduler",
+        "sync",
+        "sync_calendars",
+        "collect_changes",
+        "push_sync",
+        "sync_pages",
+        "notion_event_sync",
+        "continuous_sync",
+    }
+)
 
 
-async def sync(settings: Settings, service: Resource, notion: nc.Client) -> None:
-    """Sync between Google Calendar and Notion.
-
-    Args:
-        settings: Configuration settings
-        service: A Google Calendar API Client
-        notion: A Notion API Client
-    """
-    num_steps = 4
-    if settings.delete_option:
-        num_steps += 1
-
-    with typer.progressbar(
-        range(num_steps), label="Synchronising", show_eta=False, show_pos=True
-    ) as progress:
-        today_date = arrow.utcnow().isoformat()
-
-        progress.label = "new N->G"
-        core.new_events_notion_to_gcal(
-            settings.database_id,
-            settings.url_root,
-            settings.default_calendar_name,
-            settings.calendar_dictionary,
-            settings.task_notion_name,
-            settings.date_notion_name,
-            settings.initiative_notion_name,
-            settings.extrainfo_notion_name,
-            settings.on_gcal_notion_name,
-            settings.gcal_event_id_notion_name,
-            settings.lastupdatedtime_notion_name,
-            settings.calendar_notion_name,
-            settings.current_calendar_id_notion_name,
-            settings.delete_notion_name,
-            notion,
-            service,
-            settings=settings,
-        )
-        progress.update(1)
-
-        progress.label = "modified N->G"
-        core.existing_events_notion_to_gcal(
-            settings.database_id,
-            settings.url_root,
-            settings.default_calendar_id,
-            settings.default_calendar_name,
-            settings.calendar_dictionary,
-            settings.task_notion_name,
-            settings.date_notion_name,
-            settings.initiative_notion_name,
-            settings.extrainfo_notion_name,
-            settings.on_gcal_notion_name,
-            settings.need_gcal_update_notion_name,
-            settings.gcal_event_id_notion_name,
-            settings.lastupdatedtime_notion_name,
-            settings.calendar_notion_name,
-            settings.current_calendar_id_notion_name,
-            settings.delete_notion_name,
-            notion,
-            today_date,
-            service,
-            settings=settings,
-        )
-        progress.update(1)
+def __getattr__(name: str) -> Any:
+    """Import the sync functions from `ncal.runner` when they are first used."""
+    if name in _RUNNER_NAMES:
+        from ncal import runner
 
-        progress.label = "modified G->N"
-        core.existing_events_gcal_to_notion(
-            settings.database_id,
-            settings.default_calendar_name,
-            settings.calendar_dictionary,
-            settings.date_notion_name,
-            settings.on_gcal_notion_name,
-            settings.need_gcal_update_notion_name,
-            settings.gcal_event_id_notion_name,
-            settings.lastupdatedtime_notion_name,
-            settings.calendar_notion_name,
-            settings.current_calendar_id_notion_name,
-            settings.delete_notion_name,
-            service,
-            notion,
-            today_date,
-            settings=settings,
-        )
-        progress.update(1)
-
-        progress.label = "new G->N"
-        core.new_events_gcal_to_notion(
-            settings.database_id,
-            settings.calendar_dictionary,
-            settings.task_notion_name,
-            settings.date_notion_name,
-            settings.extrainfo_notion_name,
-            settings.on_gcal_notion_name,
-            settings.gcal_event_id_notion_name,
-            settings.lastupdatedtime_notion_name,
-            settings.calendar_notion_name,
-            settings.current_calendar_id_notion_name,
-            settings.delete_notion_name,
-            service,
-            notion,
-            settings=settings,
-        )
-
-        if settings.delete_option:
-            progress.update(1)
-            progress.label = "delete done pages from GCal"
-            core.delete_done_pages(
-                notion=notion,
-                database_id=settings.database_id,
-                gcal_event_id_notion_name=settings.gcal_event_id_notion_name,
-                on_gcal_notion_name=settings.on_gcal_notion_name,
-                delete_notion_name=settings.delete_notion_name,
-                delete_option=settings.delete_option,
-                calendar_dictionary=settings.calendar_dictionary,
-                calendar_notion_name=settings.calendar_notion_name,
-                service=service,
-            )
-
-        progress.label = "Synchronised"
-        progress.update(1)
-        typer.echo(f"Synchronised at UTC {arrow.utcnow()}")
-
-
-async def continuous_sync(
-    interval: datetime.timedelta,
-    settings: Settings,
-    service: Resource,
-    notion: nc.Client,
-):
-    """Call sync continuously.
-
-    Args:
-        interval (datetime.timedelta):
-        settings (Settings):
-        service (Resource):
-        notion (nc.Client):
-    """
-    await sync(settings, service, notion)
-    await scheduler(
-        interval, sync, {"settings": settings, "service": service, "notion": notion}
-    )
+        return getattr(runner, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 @app.command("sync")
@@ -199,8 +56,30 @@ def cli_sync(
         "-d",
         help="delete pages which have been marked done",
     ),
+    profile: bool = typer.Option(
+        False,
+        "--profile/--no-profile",
+        help="profile each phase (one page or event at a time), and report on it",
+    ),
+    profile_output: Optional[Path] = typer.Option(
+        None, help="with --profile, write pstats and speedscope files here"
+    ),
 ):
     """CLI to sync a Notion database with Google Calendar."""
+    import asyncio
+    import datetime
+
+    from pydantic import ValidationError
+
+    from ncal import core
+    from ncal.config import load_settings
+    from ncal.metrics import MetricsServer
+    from ncal.notion_utils import relation_title_cache
+    from ncal.profiling import PhaseProfiler
+    from ncal.runner import continuous_sync, sync
+    from ncal.sharding import ShardedSync
+    from ncal.state import StateStore, SyncTokenStore
+
     typer.echo()
     typer.secho(
         "Synchronize Notion <-> GCal", bg=typer.colors.GREEN, fg="white", bold=True
@@ -239,20 +118,100 @@ def cli_sync(
         )
         raise typer.Exit(1)
     logging.info(settings)
+    profiler = None
+    if profile:
+        # the profiler only sees the thread that each phase runs in
+        settings = settings.copy(update={"concurrency_limit": 1, "sync_processes": 1})
+        profiler = PhaseProfiler(profile_output)
 
     typer.echo("Setting up API connections...")
-    service, calendar, notion = core.setup_api_connections(
+    service, _, notion = core.setup_api_connections(
         default_calendar_id=settings.default_calendar_id,
         credentials_location=settings.credentials_location,
         notion_api_token=settings.notion_api_token,
         client_secret_location=settings.client_secret_location,
+        notion_requests_per_second=settings.notion_requests_per_second,
+        gcal_requests_per_second=settings.gcal_requests_per_second,
+        max_retries=settings.max_retries,
+        discovery_cache_location=settings.discovery_cache_location,
+        notion_api_url=settings.notion_api_url,
+        gcal_api_url=settings.gcal_api_url,
     )
 
-    if repeat:
-        interval = datetime.timedelta(seconds=seconds)
-        asyncio.run(continuous_sync(interval, settings, service, notion))
-    else:
-        asyncio.run(sync(settings, service, notion))
+    sync_tokens = SyncTokenStore(settings.sync_token_location)
+    state_store = StateStore(settings.state_location)
+    relation_title_cache.ttl = settings.relation_cache_ttl
+    shards = ShardedSync(settings) if settings.sync_processes > 1 else None
+    metrics_server = None
+    if settings.metrics_port is not None:
+        metrics_server = MetricsServer(port=settings.metrics_port)
+        metrics_server.start()
+
+    try:
+        if repeat:
+            interval = datetime.timedelta(seconds=seconds)
+            asyncio.run(
+                continuous_sync(
+                    interval,
+                    settings,
+                    service,
+                    notion,
+                    sync_tokens,
+                    state_store,
+                    shards=shards,
+                    profiler=profiler,
+                )
+            )
+        else:
+            asyncio.run(
+                sync(
+                    settings,
+                    service,
+                    notion,
+                    sync_tokens,
+                    state_store,
+                    shards=shards,
+                    profiler=profiler,
+                )
+            )
+    finally:
+        if profiler is not None:
+            profiler.close()
+        if metrics_server is not None:
+            metrics_server.stop()
+        if shards is not None:
+            shards.close()
+        state_store.close()
+
+
+@app.command("fleet")
+def cli_fleet(
+    profiles: list[Path] = typer.Argument(
+        ..., help="toml profile files, each with one or more profiles"
+    ),
+    seconds: int = 10,
+    max_concurrent_syncs: int = typer.Option(
+        4, help="the most databases that are synced at once"
+    ),
+):
+    """Continuously sync many Notion databases, for many accounts, in one process."""
+    import asyncio
+    import datetime
+
+    from ncal.fleet import Fleet, load_profiles
+
+    try:
+        fleet = Fleet(load_profiles(profiles), max_concurrent_syncs)
+    except (ValueError, FileNotFoundError) as e:
+        typer.secho(f"invalid profiles: {e}", bg="white", fg="red")
+        raise typer.Exit(1)
+
+    typer.echo(f"Setting up API connections for {len(fleet.profiles)} databases...")
+    try:
+        fleet.connect()
+        asyncio.run(fleet.run(datetime.timedelta(seconds=seconds)))
+    finally:
+        fleet.close()
 
 
 @app.callback(invoke_without_command=True, no_args_is_help=True)
@@ -265,5 +224,7 @@ def main(
         state["verbose"] = True
         logging.basicConfig(level=20)
     if version:
+        from ncal import __version__
+
         typer.echo(f"ncal version: {__version__}")
         raise typer.Exit()
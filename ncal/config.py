@@ -4,6 +4,7 @@ Functions and classes to manage configuration are in this file.
 Configuration can operate through toml, .env, environment variables, or the command
 line.
 """
+import datetime
 from os import environ
 from pathlib import Path
 from typing import Any, Dict, Literal, Optional
@@ -33,6 +34,13 @@ class Settings(pydantic.BaseModel):
     credentials_location: Path = Path("user_token.json")
     # gcal API client secrets file
     client_secret_location: Path = Path("client_secret.json")
+    # json file used to remember where the last GCal -> Notion pass got up to
+    sync_token_location: Path = Path("sync_tokens.json")
+    # SQLite database used to remember what has already been synced
+    state_location: Path = Path("ncal_state.sqlite3")
+    # copy of the GCal API discovery document, only used if googleapiclient doesn't
+    # come with one
+    discovery_cache_location: Path = Path("calendar_discovery.json")
 
     default_event_length: int = 60  # Default event length in minutes
     # http://www.timezoneconverter.com/cgi-bin/zonehelp.tzc  TODO: make this unnecessary
@@ -73,6 +81,62 @@ class Settings(pydantic.BaseModel):
     # gCal event and the Notion Event will be checked off.
     # set at False if you want nothing deleted
 
+    # only sync events from this many days ago up to this many days ahead (None for
+    # no limit), to keep old history from costing API calls on every sync
+    sync_window_past: Optional[float] = None
+    sync_window_future: Optional[float] = None
+
+    # how many pages/events each sync phase works on at once (1 means one at a time)
+    concurrency_limit: int = 4
+    # how many worker processes each sync is split across, by calendar (1 to sync in
+    # this process); for very large databases, see ncal.sharding
+    sync_processes: int = 1
+    # how many GCal requests are sent together in each batch (at most 50)
+    gcal_batch_size: int = 50
+    # how many seconds the titles of related pages (e.g. projects) are cached for,
+    # which is how long it can take for a renamed one to show up on GCal, unless
+    # Notion webhook events are received for it
+    relation_cache_ttl: float = 3600
+    # the most requests per second sent to each API; slowed down if throttled
+    notion_requests_per_second: float = 3
+    gcal_requests_per_second: float = 10
+    # how many times a throttled or failed request is retried
+    max_retries: int = 5
+    # send API requests to these URLs instead of to Notion and Google, e.g. to the
+    # fake servers in benchmarks.servers for load testing (GCal requests are then
+    # sent without credentials)
+    notion_api_url: Optional[str] = None
+    gcal_api_url: Optional[str] = None
+
+    # with `ncal sync --repeat`: what to do when a sync is still running when the
+    # next one is due (see ncal.scheduler.Scheduler), up to how many seconds of
+    # random delay to add to each wait, and the longest that the interval can grow
+    # to while nothing is changing (None to keep the interval fixed)
+    sync_overlap: Literal["skip", "queue", "coalesce"] = "skip"
+    sync_jitter: float = 0
+    max_sync_interval: Optional[float] = None
+    # with `ncal sync --repeat`, each sync only fetches the pages edited since the
+    # last one, and the whole database is fetched this often (in seconds)
+    full_query_interval: float = 3600
+
+    # GCal push notifications, with `ncal sync --repeat`: the public HTTPS URL that
+    # forwards to port `push_port`, and a secret to check notifications with (random
+    # if not set)
+    push_address: Optional[str] = None
+    push_port: int = 8000
+    push_token: Optional[str] = None
+    # Notion change events, with `ncal sync --repeat`: the port to receive Notion
+    # webhook events on, the webhook's verification token to check them with, and/or
+    # a directory that event json files are dropped into
+    notion_webhook_port: Optional[int] = None
+    notion_webhook_secret: Optional[str] = None
+    notion_drop_directory: Optional[Path] = None
+    # once GCal or Notion changes are pushed, a full sync only runs this often
+    push_poll_interval: float = 3600
+    # with `ncal sync`: serve Prometheus metrics of the syncs and API requests at
+    # http://localhost:<metrics_port>/metrics (see ncal.metrics)
+    metrics_port: Optional[int] = None
+
     # DATABASE SPECIFIC EDITS
     # There needs to be a few properties on the Notion Database for this to work.
     # Replace the values of each variable with the string of what the variable is
@@ -111,6 +175,37 @@ def load_config_file(path_to_file: Path) -> Dict[str, Any]:
         return tomli_dictionary
 
 
+def sync_window(
+    settings: Settings, now: Optional[datetime.datetime] = None
+) -> tuple[Optional[datetime.datetime], Optional[datetime.datetime]]:
+    """Get the window of time that is synced.
+
+    ```python
+    >>> settings = Settings(
+    ...     notion_api_token="a", database_id="b", url_root="c", sync_window_past=7
+    ... )
+    >>> sync_window(settings, datetime.datetime(2022, 1, 10))
+    (datetime.datetime(2022, 1, 3, 0, 0), None)
+
+    ```
+
+    Args:
+        settings: Configuration settings
+        now: The current time (defaults to now, in UTC)
+
+    Returns:
+        (start, end) of the window, either of which is None if it is unbounded
+    """
+    if now is None:
+        now = datetime.datetime.now(datetime.timezone.utc)
+    start = end = None
+    if settings.sync_window_past is not None:
+        start = now - datetime.timedelta(days=settings.sync_window_past)
+    if settings.sync_window_future is not None:
+        end = now + datetime.timedelta(days=settings.sync_window_future)
+    return start, end
+
+
 def env_var_names_dict(prefix: str) -> Dict[str, str]:
     """
     Args:
@@ -120,7 +215,7 @@ def env_var_names_dict(prefix: str) -> Dict[str, str]:
 
     ```python
     >>> env_var_names_dict("PREFIX_")
-    {'notion_api_token': 'prefix_notion_api_token', 'database_id': 'prefix_database_id', 'url_root': 'prefix_url_root', 'credentials_location': 'prefix_credentials_location', 'client_secret_location': 'prefix_client_secret_location', 'default_event_length': 'prefix_default_event_length', 'timezone': 'prefix_timezone', 'default_event_start': 'prefix_default_event_start', 'all_day_event_option': 'prefix_all_day_event_option', 'default_calendar_id': 'prefix_default_calendar_id', 'default_calendar_name': 'prefix_default_calendar_name', 'delete_option': 'prefix_delete_option', 'task_notion_name': 'prefix_task_notion_name', 'date_notion_name': 'prefix_date_notion_name', 'initiative_notion_name': 'prefix_initiative_notion_name', 'initiative_notion_type': 'prefix_initiative_notion_type', 'extrainfo_notion_name': 'prefix_extrainfo_notion_name', 'on_gcal_notion_name': 'prefix_on_gcal_notion_name', 'need_gcal_update_notion_name': 'prefix_need_gcal_update_notion_name', 'gcal_event_id_notion_name': 'prefix_gcal_event_id_notion_name', 'lastupdatedtime_notion_name': 'prefix_lastupdatedtime_notion_name', 'calendar_notion_name': 'prefix_calendar_notion_name', 'current_calendar_id_notion_name': 'prefix_current_calendar_id_notion_name', 'delete_notion_name': 'prefix_delete_notion_name', 'calendar_dictionary': 'prefix_calendar_dictionary'}
+    {'notion_api_token': 'prefix_notion_api_token', 'database_id': 'prefix_database_id', 'url_root': 'prefix_url_root', 'credentials_location': 'prefix_credentials_location', 'client_secret_location': 'prefix_client_secret_location', 'sync_token_location': 'prefix_sync_token_location', 'state_location': 'prefix_state_location', 'discovery_cache_location': 'prefix_discovery_cache_location', 'default_event_length': 'prefix_default_event_length', 'timezone': 'prefix_timezone', 'default_event_start': 'prefix_default_event_start', 'all_day_event_option': 'prefix_all_day_event_option', 'default_calendar_id': 'prefix_default_calendar_id', 'default_calendar_name': 'prefix_default_calendar_name', 'delete_option': 'prefix_delete_option', 'sync_window_past': 'prefix_sync_window_past', 'sync_window_future': 'prefix_sync_window_future', 'concurrency_limit': 'prefix_concurrency_limit', 'sync_processes': 'prefix_sync_processes', 'gcal_batch_size': 'prefix_gcal_batch_size', 'relation_cache_ttl': 'prefix_relation_cache_ttl', 'notion_requests_per_second': 'prefix_notion_requests_per_second', 'gcal_requests_per_second': 'prefix_gcal_requests_per_second', 'max_retries': 'prefix_max_retries', 'notion_api_url': 'prefix_notion_api_url', 'gcal_api_url': 'prefix_gcal_api_url', 'sync_overlap': 'prefix_sync_overlap', 'sync_jitter': 'prefix_sync_jitter', 'max_sync_interval': 'prefix_max_sync_interval', 'full_query_interval': 'prefix_full_query_interval', 'push_address': 'prefix_push_address', 'push_port': 'prefix_push_port', 'push_token': 'prefix_push_token', 'notion_webhook_port': 'prefix_notion_webhook_port', 'notion_webhook_secret': 'prefix_notion_webhook_secret', 'notion_drop_directory': 'prefix_notion_drop_directory', 'push_poll_interval': 'prefix_push_poll_interval', 'metrics_port': 'prefix_metrics_port', 'task_notion_name': 'prefix_task_notion_name', 'date_notion_name': 'prefix_date_notion_name', 'initiative_notion_name': 'prefix_initiative_notion_name', 'initiative_notion_type': 'prefix_initiative_notion_type', 'extrainfo_notion_name': 'prefix_extrainfo_notion_name', 'on_gcal_notion_name': 'prefix_on_gcal_notion_name', 'need_gcal_update_notion_name': 'prefix_need_gcal_update_notion_name', 'gcal_event_id_notion_name': 'prefix_gcal_event_id_notion_name', 'lastupdatedtime_notion_name': 'prefix_lastupdatedtime_notion_name', 'calendar_notion_name': 'prefix_calendar_notion_name', 'current_calendar_id_notion_name': 'prefix_current_calendar_id_notion_name', 'delete_notion_name': 'prefix_delete_notion_name', 'calendar_dictionary': 'prefix_calendar_dictionary'}
 
     ```
     """  # noqa
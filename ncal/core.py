@@ -1,18 +1,33 @@
 """Core functionality for synchronisation."""
+import asyncio
 import datetime
+import functools
 import logging
-import time
-from typing import Any, Final
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, AsyncIterator, Callable, Final, Iterable, Iterator, Optional
 
 import arrow
-import dateutil.parser
 import googleapiclient.discovery  # type: ignore
+import httpx
 import notion_client as nc  # type: ignore
 from googleapiclient.errors import HttpError  # type: ignore
 
-from ncal import config, notion_utils
+from ncal import (
+    config,
+    dates,
+    engine,
+    gcal_batch,
+    model,
+    notion_utils,
+    rate_limit,
+    state,
+    write_buffer,
+)
 from ncal.gcal_setup import setup_google_api
-from ncal.notion_utils import get_property_text
+from ncal.notion_utils import get_property_text  # noqa: F401
+from ncal.snapshot import SyncSnapshot
 
 DATE_AND_TIME_FORMAT_STRING: Final = "%Y-%m-%dT%H:%M:%S"
 
@@ -22,13 +37,41 @@ def setup_api_connections(
     credentials_location,
     notion_api_token: str,
     client_secret_location,
+    notion_requests_per_second: float = rate_limit.NOTION_REQUESTS_PER_SECOND,
+    gcal_requests_per_second: float = rate_limit.GCAL_REQUESTS_PER_SECOND,
+    max_retries: int = rate_limit.MAX_RETRIES,
+    notion_transport: Optional[httpx.BaseTransport] = None,
+    gcal_connections: Optional[threading.local] = None,
+    discovery_document: Optional[dict[str, Any]] = None,
+    discovery_cache_location: Optional[Path] = None,
+    notion_api_url: Optional[str] = None,
+    gcal_api_url: Optional[str] = None,
 ) -> tuple[googleapiclient.discovery.Resource, Any, nc.Client]:
     """Set up the API connections to Google Calendar and notion.
 
+    Both clients keep to a rate limit, and retry requests that are throttled (see
+    `ncal.rate_limit`).
+
+    The last three arguments let several sets of connections (e.g. one for each
+    account, see `ncal.fleet`) share connection pools and the GCal discovery
+    document.
+
     Args:
         default_calendar_id: gcal calendar Id
         credentials_location: location of the credentials pickle file
         notion_api_token: token from the notion api
+        notion_requests_per_second: The most requests per second sent to Notion
+        gcal_requests_per_second: The most requests per second sent to GCal
+        max_retries: How many times throttled requests are retried
+        notion_transport: The httpx transport (and so connection pool) that the
+            Notion client sends requests through
+        gcal_connections: Each thread's GCal http connection
+        discovery_document: The GCal discovery document to build the service from
+        discovery_cache_location: Where to keep a copy of the discovery document,
+            if it isn't given and googleapiclient doesn't come with one
+        notion_api_url: Send Notion requests here instead
+        gcal_api_url: Send GCal requests here instead, without credentials (see
+            `ncal.gcal_setup.setup_google_api`)
     Returns:
         (google api service, calendar, notion client)
     """
@@ -37,9 +80,26 @@ def setup_api_connections(
         calendar_id=default_calendar_id,
         token_file=str(credentials_location),
         client_secret_file=str(client_secret_location),
+        limiter=rate_limit.RateLimiter(gcal_requests_per_second),
+        max_retries=max_retries,
+        discovery_document=discovery_document,
+        connections=gcal_connections,
+        discovery_cache_file=discovery_cache_location,
+        root_url=gcal_api_url,
     )
     # This is where we set up the connection with the Notion API
-    notion = nc.Client(auth=notion_api_token)
+    options = {"base_url": notion_api_url} if notion_api_url is not None else {}
+    notion = rate_limit.RateLimitedNotionClient(
+        limiter=rate_limit.RateLimiter(notion_requests_per_second),
+        max_retries=max_retries,
+        auth=notion_api_token,
+        client=(
+            httpx.Client(transport=notion_transport)
+            if notion_transport is not None
+            else None
+        ),
+        **options,
+    )
     return service, calendar, notion
 
 
@@ -55,18 +115,375 @@ def paginated_database_query(
     Returns:
         List of notion pages matching the query
     """
-    matching_pages = []
+    return list(iter_database_query(notion_client, database_id, **query))
+
+
+def _database_query_page(
+    notion_client: nc.Client, database_id: str, query: dict[str, Any]
+) -> Callable[[Optional[str]], dict[str, Any]]:
+    """Make a function which gets one page of results for a query, from a cursor."""
+
+    def query_page(cursor: Optional[str]) -> dict[str, Any]:
+        page_query = dict(query)
+        if cursor:
+            page_query["start_cursor"] = cursor
+        return notion_client.databases.query(database_id, **page_query)  # type: ignore
+
+    return query_page
+
+
+def iter_database_query(
+    notion_client: nc.Client, database_id: str, prefetch: bool = True, **query: Any
+) -> Iterator[dict[str, Any]]:
+    """Stream the pages matching a query, as each batch of results arrives.
+
+    Unlike `paginated_database_query`, the caller can start work on the first batch
+    straight away. While it does, the next batch is fetched in the background.
+
+    Args:
+        notion_client:
+        database_id:
+        prefetch: Whether to fetch the next batch while the caller works on this one
+        **query: A query such as would be used for the normal notion_client query
+    Yields:
+        Each notion page matching the query
+    """
+    query_page = _database_query_page(notion_client, database_id, query)
+    cursor = query.pop("start_cursor", None)
+    if not prefetch:
+        while True:
+            response = query_page(cursor)
+            yield from response["results"]
+            cursor = response["next_cursor"]
+            if not cursor:
+                return
+
+    executor = ThreadPoolExecutor(max_workers=1)
+    try:
+        future: Optional[Future] = executor.submit(query_page, cursor)
+        while future is not None:
+            response = future.result()
+            cursor = response["next_cursor"]
+            future = executor.submit(query_page, cursor) if cursor else None
+            yield from response["results"]
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+async def aiter_database_query(
+    notion_client: nc.Client, database_id: str, **query: Any
+) -> AsyncIterator[dict[str, Any]]:
+    """Stream the pages matching a query, without blocking the event loop.
+
+    Like `iter_database_query`, the next batch of results is fetched while the
+    caller works on this one.
+
+    Args:
+        notion_client:
+        database_id:
+        **query: A query such as would be used for the normal notion_client query
+    Yields:
+        Each notion page matching the query
+    """
+    query_page = _database_query_page(notion_client, database_id, query)
+    cursor = query.pop("start_cursor", None)
+    task: Optional[asyncio.Task] = asyncio.ensure_future(
+        asyncio.to_thread(query_page, cursor)
+    )
+    try:
+        while task is not None:
+            response = await task
+            cursor = response["next_cursor"]
+            task = (
+                asyncio.ensure_future(asyncio.to_thread(query_page, cursor))
+                if cursor
+                else None
+            )
+            for page in response["results"]:
+                yield page
+    finally:
+        if task is not None:
+            task.cancel()
+
+
+def date_window_filters(
+    date_notion_name: str, settings: config.Settings
+) -> list[dict[str, Any]]:
+    """Make Notion query filters for the pages in the sync window.
+
+    Args:
+        date_notion_name: The name of the date property
+        settings: Configuration settings, with the sync window
+    Returns:
+        Filters to add to an ``"and"`` filter (none if the window is unbounded)
+    """
+    start, end = config.sync_window(settings)
+    filters: list[dict[str, Any]] = []
+    if start is not None:
+        filters.append(
+            {"property": date_notion_name, "date": {"on_or_after": start.isoformat()}}
+        )
+    if end is not None:
+        filters.append(
+            {"property": date_notion_name, "date": {"on_or_before": end.isoformat()}}
+        )
+    return filters
+
+
+def page_decoder(
+    settings: Optional[config.Settings], **names: str
+) -> model.PageDecoder:
+    """Make a decoder for the properties named in the settings, and in `names`.
+
+    Args:
+        settings: Configuration settings (None to decode only the `names`)
+        **names: {field of `ncal.model.FIELDS`: the name of its property}, which
+            take the place of the names in the settings
+    """
+    if settings is None:
+        return model.PageDecoder(names)
+    decoder = model.PageDecoder.from_settings(settings)
+    return model.PageDecoder({**decoder.names, **names}, decoder.initiative_type)
+
+
+def update_page(
+    notion: nc.Client, page: model.SyncPage, properties: dict[str, Any]
+) -> None:
+    """Update the properties of a Notion page, and the local copy of the page.
+
+    To merge several updates to a page into one write, use a
+    `ncal.write_buffer.PageWriteBuffer` instead.
+
+    Keeping the local copy up to date means that a `SyncSnapshot` containing the page
+    reflects the change for the later phases of a sync pass, and that the page's
+    ``last_edited_time`` is the one after the update (see `ncal.state.StateStore`).
+
+    Args:
+        notion: A Notion API Client
+        page: The page
+        properties: The properties to update, as they would be passed to the API
+    """
+    writes = write_buffer.PageWriteBuffer(notion)
+    writes.stage(page, properties)
+    writes.flush()
+
+
+def record_sync_state(
+    state_store: Optional[state.StateStore],
+    page: model.SyncPage,
+    event: Optional[model.SyncEvent] = None,
+    event_body: Optional[dict[str, Any]] = None,
+) -> None:
+    """Record what has just been synced for a page, if a state store is in use.
+
+    Args:
+        state_store: Where to record the state
+        page: The page, after any updates (see `update_page`)
+        event: The GCal event, as returned by the API
+        event_body: The event body that was sent to GCal
+    """
+    if state_store is None:
+        return
+    values = {
+        "last_edited_time": page.last_edited_time,
+        "page_hash": state.page_hash(page),
+    }
+    if event is not None:
+        values["event_id"] = event.id
+        values["event_etag"] = event.etag
+        values["event_updated"] = event.updated
+    if event_body is not None:
+        values["content_hash"] = state.content_hash(event_body)
+    state_store.record(page.id, **values)
+
+
+def list_calendar_events(
+    service,
+    calendar_id: str,
+    time_min: str,
+    sync_tokens: Optional[state.SyncTokenStore] = None,
+) -> list[dict[str, Any]]:
+    """List the events on a calendar, incrementally if a sync token is available.
+
+    Without a stored sync token, every event ending after `time_min` is listed. With
+    one, only the events that have changed since the token was issued are listed.
+    If Google reports that the token has expired (410 Gone), a full listing is done
+    instead. The new ``nextSyncToken`` is put into `sync_tokens` but not saved.
+
+    Args:
+        service: A Google Calendar API Client
+        calendar_id: gcal calendar Id
+        time_min: isoformat datetime, events ending before this are ignored
+        sync_tokens: store of the sync token for each calendar
+    Returns:
+        List of (not cancelled) gcal events
+    """
+    sync_token = sync_tokens.get(calendar_id) if sync_tokens is not None else None
+    events: list[dict[str, Any]] = []
+    page_token = None
 
     while True:
-        # this query will return a dictionary that we will parse
-        # for information that we want
-        response = notion_client.databases.query(database_id, **query)
-        matching_pages.extend(response["results"])  # type: ignore
-        if response["next_cursor"]:  # type: ignore
-            query["start_cursor"] = response["next_cursor"]  # type: ignore
+        if sync_token:
+            query = {"syncToken": sync_token}
         else:
+            query = {"timeMin": time_min}
+        try:
+            response = (
+                service.events()
+                .list(
+                    calendarId=calendar_id,
+                    maxResults=2000,
+                    pageToken=page_token,
+                    **query,
+                )
+                .execute()
+            )
+        except HttpError as e:
+            if sync_token and e.resp.status == 410:
+                logging.info(f"Sync token expired for {calendar_id}, doing full sync")
+                sync_tokens.drop(calendar_id)  # type: ignore
+                sync_token = None
+                events = []
+                page_token = None
+                continue
+            raise
+        events.extend(response["items"])
+        page_token = response.get("nextPageToken")
+        if not page_token:
             break
-    return matching_pages
+
+    if sync_tokens is not None and response.get("nextSyncToken"):
+        sync_tokens.set(calendar_id, response["nextSyncToken"])
+
+    # Incremental results include deleted events and events from any time
+    utc = datetime.timezone.utc
+    time_min_datetime = dates.parse(time_min, utc)
+    return [
+        event
+        for event in events
+        if event.get("status") != "cancelled"
+        and dates.parse(event["end"].get("dateTime", event["end"].get("date")), utc)
+        > time_min_datetime
+    ]
+
+
+def index_calendar_events(
+    service,
+    calendar_dictionary: dict[str, str],
+    time_min: Optional[datetime.datetime] = None,
+    time_max: Optional[datetime.datetime] = None,
+) -> dict[str, tuple[str, dict[str, Any]]]:
+    """Index the confirmed events on each calendar by their event id.
+
+    This takes one paginated list request per calendar, rather than probing every
+    calendar for every event. If an event is on several calendars, the last
+    calendar in `calendar_dictionary` wins.
+
+    Args:
+        service: A Google Calendar API Client
+        calendar_dictionary: {calendar name: calendar id}
+        time_min: If given, events ending before this are left out
+        time_max: If given, events starting after this are left out
+    Returns:
+        {event id: (calendar name, event)}
+    """
+    window = {}
+    if time_min is not None:
+        window["timeMin"] = arrow.get(time_min).isoformat()
+    if time_max is not None:
+        window["timeMax"] = arrow.get(time_max).isoformat()
+    event_index: dict[str, tuple[str, dict[str, Any]]] = {}
+    for calendar_name, calendar_id in calendar_dictionary.items():
+        page_token = None
+        while True:
+            response = (
+                service.events()
+                .list(
+                    calendarId=calendar_id,
+                    maxResults=2500,
+                    pageToken=page_token,
+                    **window,
+                )
+                .execute()
+            )
+            for event in response["items"]:
+                if event.get("status") != "cancelled":
+                    event_index[event["id"]] = (calendar_name, event)
+            page_token = response.get("nextPageToken")
+            if not page_token:
+                break
+    return event_index
+
+
+def last_calendar_id(page: model.SyncPage, settings: config.Settings) -> Optional[str]:
+    """Get the id of the calendar that a page's event was last seen on.
+
+    That is the page's current calendar id, or if it hasn't got one, the calendar
+    selected for it (or the default calendar). None if the calendar isn't one of
+    `settings.calendar_dictionary`.
+    """
+    if page.current_calendar_id:
+        return page.current_calendar_id
+    return settings.calendar_dictionary.get(
+        page.calendar_name or settings.default_calendar_name
+    )
+
+
+def find_calendar_events(
+    service,
+    calendar_dictionary: dict[str, str],
+    event_calendars: dict[str, Optional[str]],
+    batch_size: int = gcal_batch.MAX_BATCH_SIZE,
+    max_retries: int = rate_limit.MAX_RETRIES,
+) -> dict[str, tuple[str, dict[str, Any]]]:
+    """Get events by their ids, from whichever calendar they are on.
+
+    This finds the events that `index_calendar_events` leaves out, e.g. because
+    they have been moved out of the sync window. Each event is looked for on the
+    calendar it was last seen on first, and then on the others, with one batch of
+    requests per round.
+
+    Args:
+        service: A Google Calendar API Client
+        calendar_dictionary: {calendar name: calendar id}
+        event_calendars: {event id: the id of the calendar it was last seen on,
+            if it is known}
+        batch_size: The number of requests per batch
+        max_retries: How many times throttled requests are retried
+    Returns:
+        {event id: (calendar name, event)}, for the events found (and not deleted)
+    """
+    calendar_names: dict[str, str] = {}
+    for name, calendar_id in calendar_dictionary.items():
+        calendar_names.setdefault(calendar_id, name)
+    # the calendar each event was last seen on first, then the others
+    candidates = {
+        event_id: ([hint] if hint in calendar_names else [])
+        + [c for c in calendar_names if c != hint]
+        for event_id, hint in event_calendars.items()
+    }
+    found: dict[str, tuple[str, dict[str, Any]]] = {}
+
+    def event_found(event_id: str, calendar_id: str, event: dict[str, Any]) -> None:
+        if event.get("status") != "cancelled":
+            found[event_id] = (calendar_names[calendar_id], event)
+
+    def log_not_found(event_id: str, calendar_id: str, exception: HttpError) -> None:
+        if exception.resp.status != 404:
+            logging.warning(f"Failed to get {event_id} from {calendar_id}: {exception}")
+
+    for attempt in range(len(calendar_names)):
+        with gcal_batch.EventBatch(service, batch_size, max_retries) as batch:
+            for event_id, calendar_ids in candidates.items():
+                if event_id in found:
+                    continue
+                calendar_id = calendar_ids[attempt]
+                batch.add(
+                    service.events().get(calendarId=calendar_id, eventId=event_id),
+                    callback=functools.partial(event_found, event_id, calendar_id),
+                    errback=functools.partial(log_not_found, event_id, calendar_id),
+                )
+    return found
 
 
 def new_events_notion_to_gcal(
@@ -87,13 +504,23 @@ def new_events_notion_to_gcal(
     notion,
     service,
     settings: config.Settings,
-):
+    snapshot: Optional[SyncSnapshot] = None,
+    state_store: Optional[state.StateStore] = None,
+) -> int:
     """
     Take Notion Events not on GCal and move them over to GCal.
 
     If you just want all Notion events to be on GCal, then you'll have to edit the
     query so it is only checking the 'On GCal?' property
+
+    If a `snapshot` is given, its pages are used instead of querying the database.
+    If a `state_store` is given, the new page <-> event mappings are recorded in it.
+    All of the changes to each page are written to Notion together, at the end.
+
+    Returns:
+        The number of events added to GCal
     """
+    writes = write_buffer.PageWriteBuffer(notion)
 
     def get_new_notion_pages(
         database_id: str,
@@ -101,11 +528,23 @@ def new_events_notion_to_gcal(
         date_notion_name: str,
         delete_notion_name: str,
         notion: nc.Client,
-    ) -> list:
+    ) -> list[model.SyncPage]:
         """Get new pages from notion (with pagination!)."""
-        matching_pages = []
+        decoder = page_decoder(
+            settings,
+            title=task_notion_name,
+            date=date_notion_name,
+            initiative=initiative_notion_name,
+            extra_info=extra_info_notion_name,
+            on_gcal=on_gcal_notion_name,
+            gcal_event_id=gcal_event_id_notion_name,
+            last_updated_time=last_updated_time_notion_name,
+            calendar=calendar_notion_name,
+            current_calendar_id=current_calendar_id_notion_name,
+            done=delete_notion_name,
+        )
 
-        query = {
+        query: dict[str, Any] = {
             # "database_id": database_id,
             "filter": {
                 "and": [
@@ -114,16 +553,26 @@ def new_events_notion_to_gcal(
                         "checkbox": {"equals": False},
                     },
                     {"property": delete_notion_name, "checkbox": {"equals": False}},
+                    *date_window_filters(date_notion_name, settings),
                 ]
             },
         }
 
-        matching_pages = paginated_database_query(notion, database_id, **query)
-        return matching_pages
+        return [
+            decoder.decode(page)
+            for page in iter_database_query(notion, database_id, **query)
+        ]
 
-    result_list = get_new_notion_pages(
-        database_id, on_gcal_notion_name, date_notion_name, delete_notion_name, notion
-    )
+    if snapshot is not None:
+        result_list = snapshot.new_pages()
+    else:
+        result_list = get_new_notion_pages(
+            database_id,
+            on_gcal_notion_name,
+            date_notion_name,
+            delete_notion_name,
+            notion,
+        )
 
     # logging.info(len(result_list))
 
@@ -132,188 +581,114 @@ def new_events_notion_to_gcal(
     except IndexError:
         logging.info("index error")
 
-    task_names = []
-    start_dates = []
-    end_times = []
-    initiatives = []
-    extra_info = []
-    url_list = []
-    cal_event_id_list = []
-    calendar_list = []
-
-    if len(result_list) > 0:
-        for i, el in enumerate(result_list):
-            logging.info(el)
-
-            task_names.append(
-                notion_utils.collapse_rich_text_property(
-                    el["properties"][task_notion_name]["title"]
-                )
-            )
-            start_dates.append(el["properties"][date_notion_name]["date"]["start"])
-
-            if el["properties"][date_notion_name]["date"]["end"] is not None:
-                end_times.append(el["properties"][date_notion_name]["date"]["end"])
-            else:
-                end_times.append(el["properties"][date_notion_name]["date"]["start"])
-
-            try:
-                initiatives.append(
-                    get_property_text(
-                        notion=notion,
-                        notion_page=el,
-                        property_name=initiative_notion_name,
-                        property_type=settings.initiative_notion_type,
-                    )
-                )
-            except ValueError:
-                initiatives.append("")
+    def prepare_new_event(el: model.SyncPage) -> tuple[dict, str]:
+        """Work out the GCal event for a single new Notion page.
 
-            try:
-                extra_info.append(
-                    el["properties"][extra_info_notion_name]["rich_text"][0]["text"][
-                        "content"
-                    ]
-                )
-            except IndexError:
-                extra_info.append("")
-            url_list.append(make_task_url(el["id"], url_root))
-
-            try:
-                calendar_list.append(
-                    calendar_dictionary[
-                        el["properties"][calendar_notion_name]["select"]["name"]
-                    ]
-                )
-            # keyerror occurs when there's nothing put into the calendar in the first
-            # place
-            except (KeyError, TypeError):
-                calendar_list.append(calendar_dictionary[default_calendar_name])
-
-            page_id = el["id"]
-            # This checks off that the event has been put on Google Calendar
-            notion.pages.update(
-                **{
-                    "page_id": page_id,
-                    "properties": {
-                        on_gcal_notion_name: {"checkbox": True},
-                        last_updated_time_notion_name: {
-                            "date": {
-                                "start": arrow.utcnow().isoformat(),
-                                "end": None,
-                            }
-                        },
-                    },
-                },
-            )
-            logging.info(calendar_list)
-
-            def create_gcal_event(
-                task_name,
-                initiative,
-                extra_info,
-                start,
-                end,
-                url,
-                calendar,
-                service,
-                settings: config.Settings,
-            ):
-                # 2 Cases: Start and End are  both either date or date+time
-                # Have restriction that the calendar events don't cross days
-                try:
-                    # start and end are both dates
-                    cal_event_id = make_cal_event(
-                        task_name,
-                        make_event_description(initiative, extra_info),
-                        datetime.datetime.strptime(start, "%Y-%m-%d"),
-                        url,
-                        datetime.datetime.strptime(end, "%Y-%m-%d"),
-                        calendar,
-                        service,
-                        settings,
-                    )
-                except ValueError:
-                    try:
-                        # start and end are both date+time
-                        cal_event_id = make_cal_event(
-                            task_name,
-                            make_event_description(initiative, extra_info),
-                            dateutil.parser.isoparse(start),
-                            url,
-                            dateutil.parser.isoparse(end),
-                            calendar,
-                            service,
-                            settings,
-                        )
-                    except ValueError:
-                        cal_event_id = make_cal_event(
-                            task_name,
-                            make_event_description(initiative, extra_info),
-                            dateutil.parser.isoparse(start),
-                            url,
-                            dateutil.parser.isoparse(end),
-                            calendar,
-                            service,
-                            settings,
-                        )
-                return cal_event_id
-
-            cal_event_id = create_gcal_event(
-                task_names[i],
-                initiatives[i],
-                extra_info[i],
-                start_dates[i],
-                end_times[i],
-                url_list[i],
-                calendar_list[i],
-                service,
-                settings,
+        Returns:
+            (event body, calendar id)
+        """
+        logging.info(el)
+
+        task_name = el.title
+        start_date = el.start
+        end_time = el.end if el.end is not None else el.start
+
+        try:
+            initiative = notion_utils.initiative_text(
+                notion, el, settings.initiative_notion_type
             )
-            cal_event_id_list.append(cal_event_id)
-
-            if (
-                calendar_list[i] == calendar_dictionary[default_calendar_name]
-            ):  # this means that there is no calendar assigned on Notion
-                # This puts the the GCal Id into the Notion Dashboard
-                notion.pages.update(
-                    **{
-                        "page_id": page_id,
-                        "properties": {
-                            gcal_event_id_notion_name: {
-                                "rich_text": [
-                                    {"text": {"content": cal_event_id_list[i]}}
-                                ]
-                            },
-                            current_calendar_id_notion_name: {
-                                "rich_text": [{"text": {"content": calendar_list[i]}}]
-                            },
-                            calendar_notion_name: {
-                                "select": {"name": default_calendar_name},
-                            },
-                        },
-                    },
-                )
-            else:  # just a regular update
-                notion.pages.update(
-                    **{
-                        "page_id": page_id,
-                        "properties": {
-                            gcal_event_id_notion_name: {
-                                "rich_text": [
-                                    {"text": {"content": cal_event_id_list[i]}}
-                                ]
-                            },
-                            current_calendar_id_notion_name: {
-                                "rich_text": [{"text": {"content": calendar_list[i]}}]
-                            },
-                        },
-                    },
-                )
+        except ValueError:
+            initiative = ""
 
-    else:
+        extra_info = el.extra_info or ""
+        url = make_task_url(el.id, url_root)
+
+        # pages without a (known) calendar go on the default calendar
+        calendar = calendar_dictionary.get(
+            el.calendar_name, calendar_dictionary[default_calendar_name]
+        )
+
+        logging.info(calendar)
+
+        # 2 Cases: Start and End are  both either date or date+time
+        # Have restriction that the calendar events don't cross days
+        start, end = parse_notion_dates(start_date, end_time)  # type: ignore
+        event = make_event_body(
+            task_name,
+            make_event_description(initiative, extra_info),
+            start,
+            url,
+            end,
+            settings,
+        )
+        logging.info(f"Adding this event to calendar: {task_name}")
+        return event, calendar
+
+    def record_event_id(
+        el: model.SyncPage, calendar: str, event: dict, response: model.SyncEvent
+    ) -> None:
+        cal_event_id = response.id
+        # This checks off that the event has been put on Google Calendar, and puts
+        # the GCal Id into the Notion Dashboard. Only pages whose events were
+        # inserted are checked off, so the others are tried again next time.
+        properties: dict[str, Any] = {
+            on_gcal_notion_name: {"checkbox": True},
+            last_updated_time_notion_name: {
+                "date": {
+                    "start": arrow.utcnow().isoformat(),
+                    "end": None,
+                }
+            },
+            gcal_event_id_notion_name: {
+                "rich_text": [{"text": {"content": cal_event_id}}]
+            },
+            current_calendar_id_notion_name: {
+                "rich_text": [{"text": {"content": calendar}}]
+            },
+        }
+        if (
+            calendar == calendar_dictionary[default_calendar_name]
+        ):  # this means that there is no calendar assigned on Notion
+            properties[calendar_notion_name] = {
+                "select": {"name": default_calendar_name},
+            }
+        writes.stage(el, properties)
+
+    if len(result_list) == 0:
         logging.info("Nothing new added to GCal")
-    return
+        return 0
+
+    prepared = engine.map_concurrently(
+        prepare_new_event, result_list, settings.concurrency_limit
+    )
+    inserted: list[tuple[model.SyncPage, str, dict, model.SyncEvent]] = []
+
+    def event_inserted(
+        el: model.SyncPage, calendar: str, event: dict, response: dict
+    ) -> None:
+        inserted.append((el, calendar, event, model.SyncEvent.decode(response)))
+
+    def log_failure(el: model.SyncPage, exception: HttpError) -> None:
+        logging.error(f"Failed to add {el.id} to GCal: {exception}")
+
+    with gcal_batch.EventBatch(
+        service, settings.gcal_batch_size, settings.max_retries
+    ) as batch:
+        for el, (event, calendar) in zip(result_list, prepared):
+            batch.add(
+                service.events().insert(calendarId=calendar, body=event),
+                callback=functools.partial(event_inserted, el, calendar, event),
+                errback=functools.partial(log_failure, el),
+            )
+
+    for item in inserted:
+        record_event_id(*item)
+    writes.flush(settings.concurrency_limit)
+    for el, calendar, event, response in inserted:
+        record_sync_state(state_store, el, response, event)
+    if state_store is not None:
+        state_store.commit()
+    return len(inserted)
 
 
 def existing_events_notion_to_gcal(
@@ -337,220 +712,248 @@ def existing_events_notion_to_gcal(
     today_date,
     service,
     settings: config.Settings,
-):
+    snapshot: Optional[SyncSnapshot] = None,
+    state_store: Optional[state.StateStore] = None,
+) -> int:
     """
     Update GCal Events that Need To Be Updated.
 
     (Changed on Notion but need to be changed on GCal)
+
+    If a `snapshot` is given, its pages are used instead of querying the database.
+    If a `state_store` is given, pages that haven't been edited since they were last
+    synced are skipped, and so are GCal updates that wouldn't change the event.
+    All of the changes to each page are written to Notion together, at the end.
+
+    Returns:
+        The number of events updated on GCal
     """
+    writes = write_buffer.PageWriteBuffer(notion)
+    decoder = page_decoder(
+        settings,
+        title=task_notion_name,
+        date=date_notion_name,
+        initiative=initiative_notion_name,
+        extra_info=extra_info_notion_name,
+        on_gcal=on_gcal_notion_name,
+        need_gcal_update=need_gcal_update_notion_name,
+        gcal_event_id=gcal_event_id_notion_name,
+        last_updated_time=last_updated_time_notion_name,
+        calendar=calendar_notion_name,
+        current_calendar_id=current_calendar_id_notion_name,
+        done=delete_notion_name,
+    )
     # In case people deleted the Calendar Variable, this queries items where
     # the Calendar select thing is empty
-    query = {
-        "filter": {
-            "and": [
-                {"property": calendar_notion_name, "select": {"is_empty": True}},
-                {"property": delete_notion_name, "checkbox": {"equals": False}},
-            ]
-        },
-    }
-    result_list = paginated_database_query(
-        notion_client=notion, database_id=database_id, **query
-    )
-
-    if len(result_list) > 0:
-        for i, el in enumerate(result_list):
-            page_id = el["id"]
-
-            # This checks off that the event has been put on Google Calendar
-            notion.pages.update(
-                **{
-                    "page_id": page_id,
-                    "properties": {
-                        calendar_notion_name: {
-                            "select": {"name": default_calendar_name},
-                        },
-                        last_updated_time_notion_name: {
-                            "date": {
-                                "start": arrow.utcnow().isoformat(),
-                                "end": None,
-                            }
-                        },
-                    },
-                },
+    if snapshot is not None:
+        result_list = snapshot.no_calendar_pages()
+    else:
+        query: dict[str, Any] = {
+            "filter": {
+                "and": [
+                    {"property": calendar_notion_name, "select": {"is_empty": True}},
+                    {"property": delete_notion_name, "checkbox": {"equals": False}},
+                    *date_window_filters(date_notion_name, settings),
+                ]
+            },
+        }
+        result_list = [
+            decoder.decode(page)
+            for page in iter_database_query(
+                notion_client=notion, database_id=database_id, **query
             )
+        ]
+
+    def set_default_calendar(el: model.SyncPage) -> None:
+        # This checks off that the event has been put on Google Calendar
+        writes.stage(
+            el,
+            {
+                calendar_notion_name: {
+                    "select": {"name": default_calendar_name},
+                },
+                last_updated_time_notion_name: {
+                    "date": {
+                        "start": arrow.utcnow().isoformat(),
+                        "end": None,
+                    }
+                },
+            },
+        )
+
+    engine.map_concurrently(
+        set_default_calendar, result_list, settings.concurrency_limit
+    )
+    if snapshot is None:
+        # the query below has to see the default calendars
+        writes.flush(settings.concurrency_limit)
 
     # Filter events that have been updated since the GCal event has been made
 
     # this query will return a dictionary that we will parse for information that
     # we want
     # look for events that are today or in the next week
-    query = {
-        "filter": {
-            "and": [
-                {
-                    "property": need_gcal_update_notion_name,
-                    "checkbox": {"equals": True},
-                },
-                {"property": on_gcal_notion_name, "checkbox": {"equals": True}},
-                {"property": delete_notion_name, "checkbox": {"equals": False}},
-            ]
-        },
-    }
-    result_list = paginated_database_query(notion, database_id, **query)
-
-    updating_notion_page_ids = []
-    updating_cal_event_ids = []
-
-    for result in result_list:
-        logging.info(result)
-        logging.info("\n")
-        page_id = result["id"]
-        updating_notion_page_ids.append(page_id)
-        logging.info("\n")
-        logging.info(result)
-        logging.info("\n")
+    if snapshot is not None:
+        result_list = snapshot.need_update_pages()
+    else:
+        query = {
+            "filter": {
+                "and": [
+                    {
+                        "property": need_gcal_update_notion_name,
+                        "checkbox": {"equals": True},
+                    },
+                    {"property": on_gcal_notion_name, "checkbox": {"equals": True}},
+                    {"property": delete_notion_name, "checkbox": {"equals": False}},
+                    *date_window_filters(date_notion_name, settings),
+                ]
+            },
+        }
+        result_list = [
+            decoder.decode(page)
+            for page in iter_database_query(notion, database_id, **query)
+        ]
+
+    if state_store is not None:
+        result_list = [el for el in result_list if not state_store.page_unchanged(el)]
+
+    def prepare_event_update(el: model.SyncPage) -> tuple[dict, str, str, str]:
+        """Work out the GCal event update for a single Notion page.
+
+        Returns:
+            (event body, event id, current calendar id, new calendar id)
+        """
+        logging.info(el)
+        cal_event_id = el.gcal_event_id or default_calendar_id
+        logging.info(cal_event_id)
+
+        task_name = el.title
+        start_date = el.start
+        end_time = el.end if el.end is not None else el.start
+
         try:
-            cal_id = result["properties"][gcal_event_id_notion_name]["rich_text"][0][
-                "text"
-            ]["content"]
-        except IndexError:
-            cal_id = default_calendar_id
-        logging.info(cal_id)
-        updating_cal_event_ids.append(cal_id)
-
-    task_names = []
-    start_dates = []
-    end_times = []
-    initiatives = []
-    extra_info = []
-    url_list = []
-    calendar_list = []
-    current_cal_list = []
-
-    if len(result_list) > 0:
-        for i, el in enumerate(result_list):
-            logging.info("\n")
-            logging.info(el)
-            logging.info("\n")
-
-            task_names.append(
-                notion_utils.collapse_rich_text_property(
-                    el["properties"][task_notion_name]["title"]
-                )
+            initiative = notion_utils.initiative_text(
+                notion, el, settings.initiative_notion_type
             )
-            start_dates.append(el["properties"][date_notion_name]["date"]["start"])
-
-            if el["properties"][date_notion_name]["date"]["end"] is not None:
-                end_times.append(el["properties"][date_notion_name]["date"]["end"])
-            else:
-                end_times.append(el["properties"][date_notion_name]["date"]["start"])
-
-            try:
-                initiatives.append(
-                    get_property_text(
-                        notion=notion,
-                        notion_page=el,
-                        property_name=initiative_notion_name,
-                        property_type=settings.initiative_notion_type,
-                    )
-                )
-            except ValueError:
-                initiatives.append("")
+        except ValueError:
+            initiative = ""
 
-            try:
-                extra_info.append(
-                    el["properties"][extra_info_notion_name]["rich_text"][0]["text"][
-                        "content"
-                    ]
-                )
-            except IndexError:
-                extra_info.append("")
-            url_list.append(make_task_url(el["id"], url_root))
-
-            logging.info(el)
-            # CalendarList.append(calendar_dictionary[el['properties'][Calendar_Notion_Name]['select']['name']])
-            try:
-                calendar_list.append(
-                    calendar_dictionary[
-                        el["properties"][calendar_notion_name]["select"]["name"]
-                    ]
-                )
-            # keyerror occurs when there's nothing put into the calendar in the first
-            # place
-            except KeyError:
-                calendar_list.append(calendar_dictionary[default_calendar_name])
-
-            current_cal_list.append(
-                el["properties"][current_calendar_id_notion_name]["rich_text"][0][
-                    "text"
-                ]["content"]
-            )
+        extra_info = el.extra_info or ""
+        url = make_task_url(el.id, url_root)
 
-            page_id = el["id"]
-
-            # depending on the format of the dates, we'll update the gcal event as
-            # necessary
-            try:
-                update_calendar_event(
-                    task_names[i],
-                    make_event_description(initiatives[i], extra_info[i]),
-                    datetime.datetime.strptime(start_dates[i], "%Y-%m-%d"),
-                    url_list[i],
-                    updating_cal_event_ids[i],
-                    datetime.datetime.strptime(end_times[i], "%Y-%m-%d"),
-                    current_cal_list[i],
-                    calendar_list[i],
-                    service,
-                    settings,
-                )
-            except ValueError:
-                try:
-                    update_calendar_event(
-                        task_names[i],
-                        make_event_description(initiatives[i], extra_info[i]),
-                        dateutil.parser.isoparse(start_dates[i]),
-                        url_list[i],
-                        updating_cal_event_ids[i],
-                        dateutil.parser.isoparse(end_times[i]),
-                        current_cal_list[i],
-                        calendar_list[i],
-                        service,
-                        settings,
-                    )
-                except ValueError:
-                    update_calendar_event(
-                        task_names[i],
-                        make_event_description(initiatives[i], extra_info[i]),
-                        dateutil.parser.isoparse(start_dates[i]),
-                        url_list[i],
-                        updating_cal_event_ids[i],
-                        dateutil.parser.isoparse(end_times[i]),
-                        current_cal_list[i],
-                        calendar_list[i],
-                        service,
-                        settings,
-                    )
-
-            # This updates the last time that the page in Notion was updated by the code
-            notion.pages.update(
-                **{
-                    "page_id": page_id,
-                    "properties": {
-                        last_updated_time_notion_name: {
-                            "date": {
-                                "start": arrow.utcnow().isoformat(),
-                                "end": None,
-                            }
-                        },
-                        current_calendar_id_notion_name: {
-                            "rich_text": [{"text": {"content": calendar_list[i]}}]
-                        },
-                    },
+        # pages without a (known) calendar go on the default calendar
+        calendar = calendar_dictionary.get(
+            el.calendar_name, calendar_dictionary[default_calendar_name]
+        )
+
+        # an event without a recorded calendar is taken to be on the right one
+        current_cal = el.current_calendar_id or calendar
+
+        # depending on the format of the dates, we'll update the gcal event as
+        # necessary
+        start, end = parse_notion_dates(start_date, end_time)  # type: ignore
+        event = make_event_body(
+            task_name,
+            make_event_description(initiative, extra_info),
+            start,
+            url,
+            end,
+            settings,
+        )
+        logging.info(f"Updating this event to calendar: {task_name}")
+        return event, cal_event_id, current_cal, calendar
+
+    def record_event_update(
+        el: model.SyncPage,
+        calendar: str,
+        event: dict,
+        response: Optional[model.SyncEvent],
+    ) -> None:
+        # This updates the last time that the page in Notion was updated by the code
+        writes.stage(
+            el,
+            {
+                last_updated_time_notion_name: {
+                    "date": {
+                        "start": arrow.utcnow().isoformat(),
+                        "end": None,
+                    }
                 },
-            )
+                current_calendar_id_notion_name: {
+                    "rich_text": [{"text": {"content": calendar}}]
+                },
+            },
+        )
 
-    else:
+    def event_unchanged(el: model.SyncPage, event: dict) -> bool:
+        if state_store is None:
+            return False
+        page_state = state_store.get(el.id)
+        return page_state is not None and page_state.content_hash == state.content_hash(
+            event
+        )
+
+    if len(result_list) == 0:
         logging.info("Nothing new updated to GCal")
+        writes.flush(settings.concurrency_limit)
+        return 0
+
+    prepared = engine.map_concurrently(
+        prepare_event_update, result_list, settings.concurrency_limit
+    )
+    failed: set[str] = set()
+    updated: list[tuple[model.SyncPage, str, dict, Optional[model.SyncEvent]]] = []
+
+    def event_updated(
+        el: model.SyncPage, calendar: str, event: dict, response: dict
+    ) -> None:
+        updated.append((el, calendar, event, model.SyncEvent.decode(response)))
+
+    def log_failure(el: model.SyncPage, exception: HttpError) -> None:
+        logging.error(f"Failed to update the GCal event for {el.id}: {exception}")
+        failed.add(el.id)
+
+    # When we have to move the event to a new calendar, we must move the event
+    # over to the new calendar and then update the information on the event
+    with gcal_batch.EventBatch(
+        service, settings.gcal_batch_size, settings.max_retries
+    ) as batch:
+        for el, (event, event_id, current_cal, calendar) in zip(result_list, prepared):
+            if current_cal != calendar:
+                logging.info(f"Moving {event_id} from {current_cal} to {calendar}")
+                batch.add(
+                    service.events().move(
+                        calendarId=current_cal, eventId=event_id, destination=calendar
+                    ),
+                    errback=functools.partial(log_failure, el),
+                )
+
+    with gcal_batch.EventBatch(
+        service, settings.gcal_batch_size, settings.max_retries
+    ) as batch:
+        for el, (event, event_id, current_cal, calendar) in zip(result_list, prepared):
+            if el.id in failed:
+                continue
+            if current_cal == calendar and event_unchanged(el, event):
+                logging.info(f"GCal event {event_id} is already up to date")
+                updated.append((el, calendar, event, None))
+                continue
+            batch.add(
+                service.events().update(
+                    calendarId=calendar, eventId=event_id, body=event
+                ),
+                callback=functools.partial(event_updated, el, calendar, event),
+                errback=functools.partial(log_failure, el),
+            )
+
+    for item in updated:
+        record_event_update(*item)
+    writes.flush(settings.concurrency_limit)
+    for el, calendar, event, response in updated:
+        record_sync_state(state_store, el, response, event)
+    if state_store is not None:
+        state_store.commit()
+    return sum(response is not None for *_, response in updated)
 
 
 def existing_events_gcal_to_notion(
@@ -569,13 +972,22 @@ def existing_events_gcal_to_notion(
     notion,
     today_date,
     settings: config.Settings,
-):
+    snapshot: Optional[SyncSnapshot] = None,
+    state_store: Optional[state.StateStore] = None,
+) -> int:
     """Sync GCal event updates for events already in Notion back to Notion.
 
     Query notion tasks already in Gcal, don't have to be updated, and are today or
-    in the future.
+    in the future. If a `snapshot` is given, its pages are used instead of querying
+    the database. If a `state_store` is given, pages whose page and event are both
+    unchanged since they were last synced are skipped. The date and calendar changes
+    to each page are written to Notion together, and only if they change it.
+
+    Returns:
+        The number of pages updated from GCal
     """
-    query = {
+    writes = write_buffer.PageWriteBuffer(notion)
+    query: dict[str, Any] = {
         "filter": {
             "and": [
                 {
@@ -583,446 +995,115 @@ def existing_events_gcal_to_notion(
                     "formula": {"checkbox": {"equals": False}},
                 },
                 {"property": on_gcal_notion_name, "checkbox": {"equals": True}},
-                # {
-                #     "or": [
-                #         {
-                #             "property": date_notion_name,
-                #             "date": {"equals": todayDate},
-                #         },
-                #         {"property": date_notion_name, "date": {"next_week": {}}},
-                #     ]
-                # },
                 {"property": delete_notion_name, "checkbox": {"equals": False}},
+                *date_window_filters(date_notion_name, settings),
             ]
         },
     }
 
-    result_list = paginated_database_query(notion, database_id, **query)
+    if snapshot is not None:
+        result_list = snapshot.synced_pages()
+    else:
+        decoder = page_decoder(
+            settings,
+            date=date_notion_name,
+            on_gcal=on_gcal_notion_name,
+            need_gcal_update=need_gcal_update_notion_name,
+            gcal_event_id=gcal_event_id_notion_name,
+            last_updated_time=last_updated_time_notion_name,
+            calendar=calendar_notion_name,
+            current_calendar_id=current_calendar_id_notion_name,
+            done=delete_notion_name,
+        )
+        result_list = [
+            decoder.decode(page)
+            for page in iter_database_query(notion, database_id, **query)
+        ]
 
     # Comparison section:
     # We need to see what times between GCal and Notion are not the same, so we are
     # going to convert all of the notion date/times into datetime values and then
     # compare that against the datetime value of the GCal event.
     # If they are not the same, then we change the Notion event as appropriate.
-    notion_ids_list = []
-    notion_start_datetimes = []
-    notion_end_datetimes = []
-    notion_gcal_ids = []  # we will be comparing this against the gcal_datetimes
-    gcal_start_datetimes = []
-    gcal_end_datetimes = []
-
-    notion_gcal_cal_ids = (
-        []
-    )  # going to fill this in from the select option, not the text option.
-    notion_gcal_cal_names = []
-    gcal_cal_ids = []
-
-    for result in result_list:
-        notion_ids_list.append(result["id"])
-        notion_start_datetimes.append(
-            result["properties"][date_notion_name]["date"]["start"]
-        )
-        notion_end_datetimes.append(
-            result["properties"][date_notion_name]["date"]["end"]
-        )
-        notion_gcal_ids.append(
-            result["properties"][gcal_event_id_notion_name]["rich_text"][0]["text"][
-                "content"
-            ]
-        )
-        try:
-            notion_gcal_cal_ids.append(
-                calendar_dictionary[
-                    result["properties"][calendar_notion_name]["select"]["name"]
-                ]
-            )
-            notion_gcal_cal_names.append(
-                result["properties"][calendar_notion_name]["select"]["name"]
-            )
-        # keyerror occurs when there's nothing put into the calendar in the first place
-        except KeyError:
-            notion_gcal_cal_ids.append(calendar_dictionary[default_calendar_name])
-            notion_gcal_cal_names.append(
-                result["properties"][calendar_notion_name]["select"]["name"]
-            )
+    def sync_page_from_event(result: model.SyncPage) -> Optional[model.SyncEvent]:
+        """Bring the GCal changes for a single Notion page back to Notion.
+
+        Returns:
+            The page's GCal event, if the page was synced
+        """
+        gcal_id = result.gcal_event_id
 
-    # the reason we take off the last 6 characters is so we can focus in on just the
-    # date and time instead of any extra info
-    for i in range(len(notion_start_datetimes)):
+        # We use the gcalId from the Notion dashboard to look up the gcal event, and
+        # which of the calendars of interest it is on
         try:
-            notion_start_datetimes[i] = datetime.datetime.strptime(
-                notion_start_datetimes[i], "%Y-%m-%d"
-            )
-        except ValueError:
-            try:
-                notion_start_datetimes[i] = datetime.datetime.strptime(
-                    notion_start_datetimes[i][:-6], "%Y-%m-%dT%H:%M:%S.000"
-                )
-            except ValueError:
-                notion_start_datetimes[i] = datetime.datetime.strptime(
-                    notion_start_datetimes[i][:-6], "%Y-%m-%dT%H:%M:%S.%f"
-                )
+            gcal_cal_id, value = event_index[gcal_id]  # type: ignore
+        except KeyError:
+            logging.info(f"No event found on GCal for {gcal_id}")
+            return None
+        logging.info(value)
+        event = model.SyncEvent.decode(value)
 
-    for i in range(len(notion_end_datetimes)):
-        if notion_end_datetimes[i] is not None:
-            try:
-                notion_end_datetimes[i] = datetime.datetime.strptime(
-                    notion_end_datetimes[i], "%Y-%m-%d"
-                )
-            except ValueError:
-                try:
-                    notion_end_datetimes[i] = datetime.datetime.strptime(
-                        notion_end_datetimes[i][:-6], "%Y-%m-%dT%H:%M:%S.000"
-                    )
-                except ValueError:
-                    notion_end_datetimes[i] = datetime.datetime.strptime(
-                        notion_end_datetimes[i][:-6], "%Y-%m-%dT%H:%M:%S.%f"
-                    )
+        if (
+            state_store is not None
+            and state_store.page_unchanged(result)
+            and state_store.event_unchanged(result.id, event)
+        ):
+            logging.info(f"Skipping {gcal_id}, unchanged since the last sync")
+            return None
+
+        notion_start_datetime = dates.parse(result.start)  # type: ignore
+        if result.end is not None:
+            notion_end_datetime = dates.parse(result.end)
         else:
             # the reason we're doing this weird ass thing is because when we put the
             # end time into the update or make GCal event, it'll be representative of
             # the date
-            notion_end_datetimes[i] = notion_start_datetimes[i]
-
-    # We use the gcalId from the Notion dashboard to get retrieve the start Time from
-    # the gcal event
-    value = ""
-    for gcal_id in notion_gcal_ids:
-        # just check all of the calendars of interest for info about the event
-        for calendar_id in calendar_dictionary.keys():
-            logging.info("Trying " + calendar_id + " for " + gcal_id)
-            try:
-                x = (
-                    service.events()
-                    .get(calendarId=calendar_dictionary[calendar_id], eventId=gcal_id)
-                    .execute()
-                )
-            except HttpError:
-                logging.info("Event not found")
-                x = {"status": "unconfirmed"}
-            if x["status"] == "confirmed":
-                gcal_cal_ids.append(calendar_id)
-                value = x
-            else:
-                continue
+            notion_end_datetime = notion_start_datetime
 
-        logging.info(value)
-        logging.info("\n")
-        try:
-            gcal_start_datetimes.append(
-                dateutil.parser.isoparse(value["start"]["dateTime"])  # type: ignore
-            )
-        except KeyError:
-            date = datetime.datetime.strptime(value["start"]["date"], "%Y-%m-%d")  # type: ignore # noqa
-            gcal_start_datetimes.append(date)
-        try:
-            gcal_end_datetimes.append(
-                dateutil.parser.isoparse(value["end"]["dateTime"])  # type: ignore
-            )
-        except KeyError:
-            date = datetime.datetime.strptime(value["end"]["date"], "%Y-%m-%d")  # type: ignore # noqa
-            x = datetime.datetime(
-                date.year, date.month, date.day, 0, 0, 0
-            ) - datetime.timedelta(days=1)
-            gcal_end_datetimes.append(x)
-
-    # Now we iterate and compare the time on the Notion Dashboard and the start time of
-    # the GCal event
-    # If the datetimes don't match up,  then the Notion  Dashboard must be updated
-
-    new_notion_start_datetimes: list[None | datetime.datetime] = []
-    new_notion_end_datetimes: list[None | datetime.datetime] = []
-
-    for i in range(len(notion_start_datetimes)):
-        if notion_start_datetimes[i] != gcal_start_datetimes[i]:
-            new_notion_start_datetimes.append(gcal_start_datetimes[i])
+        gcal_start_datetime = event.start
+        if event.all_day:
+            # GCal gives the day after an all day event ends
+            gcal_end_datetime = event.end - datetime.timedelta(days=1)
         else:
-            new_notion_start_datetimes.append(None)
+            gcal_end_datetime = event.end
 
-        if notion_end_datetimes[i] != gcal_end_datetimes[i]:
-            # this means that there is no end time in notion
-            new_notion_end_datetimes.append(gcal_end_datetimes[i])
-        else:
-            new_notion_end_datetimes.append(None)
-
-    logging.info("test")
-    logging.info(new_notion_start_datetimes)
-    logging.info(new_notion_end_datetimes)
-    logging.info("\n")
-    for i in range(len(notion_gcal_ids)):
-        logging.info(
-            notion_start_datetimes[i], gcal_start_datetimes[i], notion_gcal_ids[i]
-        )
+        logging.info(f"{notion_start_datetime} {gcal_start_datetime} {gcal_id}")
 
-    for i, (new_start, new_end) in enumerate(
-        zip(new_notion_start_datetimes, new_notion_end_datetimes)
-    ):
+        # Now we compare the time on the Notion Dashboard and the start time of the
+        # GCal event
+        # If the datetimes don't match up,  then the Notion  Dashboard must be updated
         if (
-            new_start is not None and new_end is not None
-        ):  # both start and end time need to be updated
-            start: datetime.datetime = new_start
-            end: datetime.datetime = new_end
-
-            # you're given 12 am dateTimes so you want to enter them as dates (not
-            # datetimes) into Notion
-            if start.hour == 0 and start.minute == 0 and start == end:
-                # update the notion dashboard with the new datetime and update the last
-                # updated time
-                notion.pages.update(
-                    **{
-                        "page_id": notion_ids_list[i],
-                        "properties": {
-                            date_notion_name: {
-                                "date": {
-                                    "start": start.strftime("%Y-%m-%d"),
-                                    "end": None,
-                                }
-                            },
-                            last_updated_time_notion_name: {
-                                "date": {
-                                    "start": arrow.utcnow().isoformat(),
-                                    "end": None,
-                                }
-                            },
-                        },
-                    },
-                )
-            elif (
-                start.hour == 0
-                and start.minute == 0
-                and end.hour == 0
-                and end.minute == 0
-            ):
-                # you're given 12 am dateTimes so you want to enter them as dates (not
-                # datetimes) into Notion
-                # update the notion dashboard with the new datetime and update the last
-                # updated time
-                notion.pages.update(
-                    **{
-                        "page_id": notion_ids_list[i],
-                        "properties": {
-                            date_notion_name: {
-                                "date": {
-                                    "start": start.strftime("%Y-%m-%d"),
-                                    "end": end.strftime("%Y-%m-%d"),
-                                }
-                            },
-                            last_updated_time_notion_name: {
-                                "date": {
-                                    "start": arrow.utcnow().isoformat(),
-                                    "end": None,
-                                }
-                            },
-                        },
-                    },
-                )
-            else:  # update Notion using datetime format
-                notion.pages.update(
-                    # update the notion dashboard with the new datetime and update the
-                    # last updated time
-                    **{
-                        "page_id": notion_ids_list[i],
-                        "properties": {
-                            date_notion_name: {
-                                "date": {
-                                    "start": start.isoformat(),
-                                    "end": end.isoformat(),
-                                }
-                            },
-                            last_updated_time_notion_name: {
-                                "date": {
-                                    "start": arrow.utcnow().isoformat(),
-                                    "end": None,
-                                }
-                            },
-                        },
-                    },
-                )
-        elif new_start is not None:  # only start time need to be updated
-            start = new_start
-            end = notion_end_datetimes[i]
+            notion_start_datetime != gcal_start_datetime
+            or notion_end_datetime != gcal_end_datetime
+        ):
+            start: datetime.datetime = gcal_start_datetime
+            end: datetime.datetime = gcal_end_datetime
 
             if start.hour == 0 and start.minute == 0 and start == end:
                 # you're given 12 am dateTimes so you want to enter them as dates (not
                 # datetimes) into Notion
-                # update the notion dashboard with the new datetime and update the last
-                # updated time
-                notion.pages.update(
-                    **{
-                        "page_id": notion_ids_list[i],
-                        "properties": {
-                            date_notion_name: {
-                                "date": {
-                                    "start": start.strftime("%Y-%m-%d"),
-                                    "end": None,
-                                }
-                            },
-                            last_updated_time_notion_name: {
-                                "date": {
-                                    "start": arrow.utcnow().isoformat(),
-                                    "end": None,
-                                }
-                            },
-                        },
-                    },
-                )
+                date_property = {"start": start.strftime("%Y-%m-%d"), "end": None}
             elif (
                 start.hour == 0
                 and start.minute == 0
                 and end.hour == 0
                 and end.minute == 0
             ):
-                # you're given 12 am dateTimes so you want to enter them as dates
-                # (not datetimes) into Notion
-                notion.pages.update(
-                    # update the notion dashboard with the new datetime and update the
-                    # last updated time
-                    **{
-                        "page_id": notion_ids_list[i],
-                        "properties": {
-                            date_notion_name: {
-                                "date": {
-                                    "start": start.strftime("%Y-%m-%d"),
-                                    "end": end.strftime("%Y-%m-%d"),
-                                }
-                            },
-                            last_updated_time_notion_name: {
-                                "date": {
-                                    "start": arrow.utcnow().isoformat(),
-                                    "end": None,
-                                }
-                            },
-                        },
-                    },
-                )
-            else:
-                # update Notion using datetime format
-                notion.pages.update(
-                    # update the notion dashboard with the new datetime and update the
-                    # last updated time
-                    **{
-                        "page_id": notion_ids_list[i],
-                        "properties": {
-                            date_notion_name: {
-                                "date": {
-                                    "start": start.isoformat(),
-                                    "end": end.isoformat(),
-                                }
-                            },
-                            last_updated_time_notion_name: {
-                                "date": {
-                                    "start": arrow.utcnow().isoformat(),
-                                    "end": None,
-                                }
-                            },
-                        },
-                    },
-                )
-        elif new_end is not None:  # only end time needs to be updated
-            start = notion_start_datetimes[i]
-            end = new_end
-
-            if start.hour == 0 and start.minute == 0 and start == end:
                 # you're given 12 am dateTimes so you want to enter them as dates (not
                 # datetimes) into Notion
-                notion.pages.update(
-                    # update the notion dashboard with the new datetime and update the
-                    # last updated time
-                    **{
-                        "page_id": notion_ids_list[i],
-                        "properties": {
-                            date_notion_name: {
-                                "date": {
-                                    "start": start.strftime("%Y-%m-%d"),
-                                    "end": None,
-                                }
-                            },
-                            last_updated_time_notion_name: {
-                                "date": {
-                                    "start": arrow.utcnow().isoformat(),
-                                    "end": None,
-                                }
-                            },
-                        },
-                    },
-                )
-            elif (
-                start.hour == 0
-                and start.minute == 0
-                and end.hour == 0
-                and end.minute == 0
-            ):
-                # update the notion dashboard with the new datetime and update the last
-                # updated time
-                notion.pages.update(
-                    **{
-                        "page_id": notion_ids_list[i],
-                        "properties": {
-                            date_notion_name: {
-                                "date": {
-                                    "start": start.strftime("%Y-%m-%d"),
-                                    "end": end.strftime("%Y-%m-%d"),
-                                }
-                            },
-                            last_updated_time_notion_name: {
-                                "date": {
-                                    "start": arrow.utcnow().isoformat(),
-                                    "end": None,
-                                }
-                            },
-                        },
-                    },
-                )
-            else:
-                # update Notion using datetime format
-                notion.pages.update(
-                    # update the notion dashboard with the new datetime and update the
-                    # last updated time
-                    **{
-                        "page_id": notion_ids_list[i],
-                        "properties": {
-                            date_notion_name: {
-                                "date": {
-                                    "start": start.isoformat(),
-                                    "end": end.isoformat(),
-                                }
-                            },
-                            last_updated_time_notion_name: {
-                                "date": {
-                                    "start": arrow.utcnow().isoformat(),
-                                    "end": None,
-                                }
-                            },
-                        },
-                    },
-                )
-        else:  # nothing needs to be updated here
-            continue
-
-    logging.info(notion_ids_list)
-    logging.info("\n")
-    logging.info(gcal_cal_ids)
-
-    cal_names = list(calendar_dictionary.keys())
-    cal_ids = list(calendar_dictionary.values())
-
-    for i, gcal_id in enumerate(gcal_cal_ids):
-        # instead of checking, just update the notion datebase with whatever calendar
-        # the event is on
-        logging.info("GcalId: " + gcal_id)
-        notion.pages.update(
-            # This puts the the GCal Id into the Notion Dashboard
-            **{
-                "page_id": notion_ids_list[i],
-                "properties": {
-                    current_calendar_id_notion_name: {  # this is the text
-                        "rich_text": [
-                            {"text": {"content": cal_ids[cal_names.index(gcal_id)]}}
-                        ]
-                    },
-                    calendar_notion_name: {  # this is the select
-                        "select": {"name": gcal_id},
-                    },
+                date_property = {
+                    "start": start.strftime("%Y-%m-%d"),
+                    "end": end.strftime("%Y-%m-%d"),
+                }
+            else:  # update Notion using datetime format
+                date_property = {"start": start.isoformat(), "end": end.isoformat()}
+
+            # update the notion dashboard with the new datetime and update the last
+            # updated time
+            writes.stage(
+                result,
+                {
+                    date_notion_name: {"date": date_property},
                     last_updated_time_notion_name: {
                         "date": {
                             "start": arrow.utcnow().isoformat(),
@@ -1030,8 +1111,72 @@ def existing_events_gcal_to_notion(
                         }
                     },
                 },
+            )
+
+        # update the notion database with whatever calendar the event is on, if
+        # that isn't the one it has
+        logging.info("GcalId: " + gcal_cal_id)
+        if (
+            result.current_calendar_id == calendar_dictionary[gcal_cal_id]
+            and result.calendar_name == gcal_cal_id
+        ):
+            return event
+        writes.stage(
+            result,
+            {
+                current_calendar_id_notion_name: {  # this is the text
+                    "rich_text": [
+                        {"text": {"content": calendar_dictionary[gcal_cal_id]}}
+                    ]
+                },
+                calendar_notion_name: {  # this is the select
+                    "select": {"name": gcal_cal_id},
+                },
+                last_updated_time_notion_name: {
+                    "date": {
+                        "start": arrow.utcnow().isoformat(),
+                        "end": None,
+                    }
+                },
+            },
+        )
+        return event
+
+    if len(result_list) == 0:
+        return 0
+
+    window_start, window_end = config.sync_window(settings)
+    event_index = index_calendar_events(
+        service, calendar_dictionary, window_start, window_end
+    )
+    # events which have been moved out of the window aren't in the index, so they
+    # are looked for, but only those last seen on the calendars being synced
+    event_index.update(
+        find_calendar_events(
+            service,
+            calendar_dictionary,
+            {
+                page.gcal_event_id: calendar_id
+                for page in result_list
+                if page.gcal_event_id and page.gcal_event_id not in event_index
+                for calendar_id in [last_calendar_id(page, settings)]
+                if calendar_id in calendar_dictionary.values()
             },
+            settings.gcal_batch_size,
+            settings.max_retries,
         )
+    )
+    events = engine.map_concurrently(
+        sync_page_from_event, result_list, settings.concurrency_limit
+    )
+    updated = len(writes)
+    writes.flush(settings.concurrency_limit)
+    for result, event in zip(result_list, events):
+        if event is not None:
+            record_sync_state(state_store, result, event)
+    if state_store is not None:
+        state_store.commit()
+    return updated
 
 
 def new_events_gcal_to_notion(
@@ -1049,286 +1194,172 @@ def new_events_gcal_to_notion(
     service,
     notion,
     settings: config.Settings,
-):
-    """
-    Bring events (not in Notion already) from GCal to Notion.
-
-    First, we get a list of all of the GCal Event Ids from the Notion Dashboard.
-    """
-    my_page = paginated_database_query(
-        notion,
-        database_id,
-        **{
-            "filter": {
-                "and": [
-                    {
-                        "property": gcal_event_id_notion_name,
-                        "text": {"is_not_empty": True},
-                    },
-                    {"property": delete_notion_name, "checkbox": {"equals": False}},
-                ]
-            },
-        },
-    )
+    sync_tokens: Optional[state.SyncTokenStore] = None,
+    snapshot: Optional[SyncSnapshot] = None,
+    state_store: Optional[state.StateStore] = None,
+) -> int:
+    """
+    Bring events (not in Notion already) from GCal to Notion.
 
-    my_page = paginated_database_query(
-        notion,
-        database_id,
-        **{
-            "filter": {
-                "property": gcal_event_id_notion_name,
-                "text": {"is_not_empty": True},
-            },
-        },
-    )
+    First, we get a list of all of the GCal Event Ids from the Notion Dashboard (from
+    the `snapshot`, if one is given).
 
-    result_list = my_page
+    If `sync_tokens` is given, only the GCal events that have changed since the last
+    pass are fetched, and the new sync tokens are saved once the pass has finished.
+    If a `state_store` is given, the new page <-> event mappings are recorded in it.
 
+    Returns:
+        The number of pages added to Notion
+    """
     all_notion_gcal_ids = []
 
-    for result in result_list:
-        all_notion_gcal_ids.append(
-            result["properties"][gcal_event_id_notion_name]["rich_text"][0]["text"][
-                "content"
-            ]
-        )
+    if snapshot is not None:
+        all_notion_gcal_ids = snapshot.gcal_event_ids()
+    else:
+        decoder = model.PageDecoder({"gcal_event_id": gcal_event_id_notion_name})
+        for result in iter_database_query(
+            notion,
+            database_id,
+            filter={
+                "property": gcal_event_id_notion_name,
+                "text": {"is_not_empty": True},
+            },
+        ):
+            all_notion_gcal_ids.append(decoder.decode(result).gcal_event_id or "")
 
     # Get the GCal Ids and other Event Info from Google Calendar
 
-    events = []
-    # get all the events from all calendars of interest
+    events: list[model.SyncEvent] = []
+    # get all the (changed) events from all calendars of interest
+    time_min = arrow.utcnow().isoformat()
     for key, value in calendar_dictionary.items():
-        x = (
-            service.events()
-            .list(calendarId=value, maxResults=2000, timeMin=arrow.utcnow().isoformat())
-            .execute()
+        events.extend(
+            model.SyncEvent.decode(event)
+            for event in list_calendar_events(service, value, time_min, sync_tokens)
         )
-        events.extend(x["items"])
-        time.sleep(0.1)
 
     logging.info(events)
 
-    cal_items = events
-
-    cal_name = [item["summary"] for item in cal_items]
-
-    gcal_calendar_id = [
-        item["organizer"]["email"] for item in cal_items
-    ]  # this is to get all of the calendarIds for each event
-
-    cal_names = list(calendar_dictionary.keys())
-    cal_ids = list(calendar_dictionary.values())
-    gcal_calendar_name = [cal_names[cal_ids.index(x)] for x in gcal_calendar_id]
-
-    cal_start_dates = []
-    cal_end_dates = []
-    for el in cal_items:
-        try:
-            cal_start_dates.append(dateutil.parser.isoparse(el["start"]["dateTime"]))
-        except KeyError:
-            date = datetime.datetime.strptime(el["start"]["date"], "%Y-%m-%d")
-            x = datetime.datetime(date.year, date.month, date.day, 0, 0, 0)
-            cal_start_dates.append(x)
-        try:
-            cal_end_dates.append(dateutil.parser.isoparse(el["end"]["dateTime"]))
-        except KeyError:
-            date = datetime.datetime.strptime(el["end"]["date"], "%Y-%m-%d")
-            x = datetime.datetime(date.year, date.month, date.day, 0, 0, 0)
-            cal_end_dates.append(x)
-
-    cal_ids = [item["id"] for item in cal_items]
-    cal_descriptions = []
-    for item in cal_items:
-        try:
-            cal_descriptions.append(item["description"])
-        except KeyError:
-            cal_descriptions.append(" ")
+    created_pages = page_decoder(
+        settings,
+        title=task_notion_name,
+        date=date_notion_name,
+        extra_info=extra_info_notion_name,
+        on_gcal=on_gcal_notion_name,
+        gcal_event_id=gcal_event_id_notion_name,
+        last_updated_time=last_updated_time_notion_name,
+        calendar=calendar_notion_name,
+        current_calendar_id=current_calendar_id_notion_name,
+        done=delete_notion_name,
+    )
+    # calendar id: the (first) name it has in the calendar dictionary
+    calendar_names: dict[str, str] = {}
+    for name, calendar_id in calendar_dictionary.items():
+        calendar_names.setdefault(calendar_id, name)
 
     # Now, we compare the Ids from Notion and Ids from GCal. If the Id from GCal is
     # not in the list from Notion, then we know that the event does not exist in
     # Notion yet, so we should bring that over.
+    def create_notion_page(event: model.SyncEvent) -> None:
+        """Create a new Notion page for a GCal event."""
+        if event.start == event.end - datetime.timedelta(
+            days=1
+        ):  # only add in the start DATE
+            date_property = {
+                "start": event.start.strftime("%Y-%m-%d"),
+                "end": None,
+            }
+        elif (
+            event.start.hour == 0
+            and event.start.minute == 0
+            and event.end.hour == 0
+            and event.end.minute == 0
+        ):  # add start and end in DATE format
+            end = event.end - datetime.timedelta(days=1)
+            date_property = {
+                "start": event.start.strftime("%Y-%m-%d"),
+                "end": end.strftime("%Y-%m-%d"),
+            }
+        else:  # regular datetime stuff
+            date_property = {
+                "start": event.start.isoformat(),
+                "end": event.end.isoformat(),
+            }
 
-    for i in range(len(cal_ids)):
-        if cal_ids[i] not in all_notion_gcal_ids:
-            if cal_start_dates[i] == cal_end_dates[i] - datetime.timedelta(
-                days=1
-            ):  # only add in the start DATE
-                # Here, we create a new page for every new GCal event
-                end = cal_end_dates[i] - datetime.timedelta(days=1)
-                my_page = notion.pages.create(
-                    **{
-                        "parent": {
-                            "database_id": database_id,
-                        },
-                        "properties": {
-                            task_notion_name: {
-                                "type": "title",
-                                "title": [
-                                    {
-                                        "type": "text",
-                                        "text": {
-                                            "content": cal_name[i],
-                                        },
-                                    },
-                                ],
-                            },
-                            date_notion_name: {
-                                "type": "date",
-                                "date": {
-                                    "start": cal_start_dates[i].strftime("%Y-%m-%d"),
-                                    "end": None,
-                                },
-                            },
-                            last_updated_time_notion_name: {
-                                "type": "date",
-                                "date": {
-                                    "start": arrow.utcnow().isoformat(),
-                                    "end": None,
+        # Here, we create a new page for every new GCal event
+        notion_page = notion.pages.create(
+            **{
+                "parent": {
+                    "database_id": database_id,
+                },
+                "properties": {
+                    task_notion_name: {
+                        "type": "title",
+                        "title": [
+                            {
+                                "type": "text",
+                                "text": {
+                                    "content": event.summary,
                                 },
                             },
-                            extra_info_notion_name: {
-                                "type": "rich_text",
-                                "rich_text": [
-                                    {"text": {"content": cal_descriptions[i]}}
-                                ],
-                            },
-                            gcal_event_id_notion_name: {
-                                "type": "rich_text",
-                                "rich_text": [{"text": {"content": cal_ids[i]}}],
-                            },
-                            on_gcal_notion_name: {"type": "checkbox", "checkbox": True},
-                            current_calendar_id_notion_name: {
-                                "rich_text": [
-                                    {"text": {"content": gcal_calendar_id[i]}}
-                                ]
-                            },
-                            calendar_notion_name: {
-                                "select": {"name": gcal_calendar_name[i]},
-                            },
-                        },
+                        ],
                     },
-                )
-
-            elif (
-                cal_start_dates[i].hour == 0
-                and cal_start_dates[i].minute == 0
-                and cal_end_dates[i].hour == 0
-                and cal_end_dates[i].minute == 0
-            ):  # add start and end in DATE format
-                # Here, we create a new page for every new GCal event
-                end = cal_end_dates[i] - datetime.timedelta(days=1)
-
-                my_page = notion.pages.create(
-                    **{
-                        "parent": {
-                            "database_id": database_id,
-                        },
-                        "properties": {
-                            task_notion_name: {
-                                "type": "title",
-                                "title": [
-                                    {
-                                        "type": "text",
-                                        "text": {
-                                            "content": cal_name[i],
-                                        },
-                                    },
-                                ],
-                            },
-                            date_notion_name: {
-                                "type": "date",
-                                "date": {
-                                    "start": cal_start_dates[i].strftime("%Y-%m-%d"),
-                                    "end": end.strftime("%Y-%m-%d"),
-                                },
-                            },
-                            last_updated_time_notion_name: {
-                                "type": "date",
-                                "date": {
-                                    "start": arrow.utcnow().isoformat(),
-                                    "end": None,
-                                },
-                            },
-                            extra_info_notion_name: {
-                                "type": "rich_text",
-                                "rich_text": [
-                                    {"text": {"content": cal_descriptions[i]}}
-                                ],
-                            },
-                            gcal_event_id_notion_name: {
-                                "type": "rich_text",
-                                "rich_text": [{"text": {"content": cal_ids[i]}}],
-                            },
-                            on_gcal_notion_name: {"type": "checkbox", "checkbox": True},
-                            current_calendar_id_notion_name: {
-                                "rich_text": [
-                                    {"text": {"content": gcal_calendar_id[i]}}
-                                ]
-                            },
-                            calendar_notion_name: {
-                                "select": {"name": gcal_calendar_name[i]},
-                            },
-                        },
+                    date_notion_name: {
+                        "type": "date",
+                        "date": date_property,
                     },
-                )
-
-            else:  # regular datetime stuff
-                # Here, we create a new page for every new GCal event
-                my_page = notion.pages.create(
-                    **{
-                        "parent": {
-                            "database_id": database_id,
+                    last_updated_time_notion_name: {
+                        "type": "date",
+                        "date": {
+                            "start": arrow.utcnow().isoformat(),
+                            "end": None,
                         },
-                        "properties": {
-                            task_notion_name: {
-                                "type": "title",
-                                "title": [
-                                    {
-                                        "type": "text",
-                                        "text": {
-                                            "content": cal_name[i],
-                                        },
-                                    },
-                                ],
-                            },
-                            date_notion_name: {
-                                "type": "date",
-                                "date": {
-                                    "start": cal_start_dates[i].isoformat(),
-                                    "end": cal_end_dates[i].isoformat(),
-                                },
-                            },
-                            last_updated_time_notion_name: {
-                                "type": "date",
-                                "date": {
-                                    "start": arrow.utcnow().isoformat(),
-                                    "end": None,
-                                },
-                            },
-                            extra_info_notion_name: {
-                                "type": "rich_text",
-                                "rich_text": [
-                                    {"text": {"content": cal_descriptions[i]}}
-                                ],
-                            },
-                            gcal_event_id_notion_name: {
-                                "type": "rich_text",
-                                "rich_text": [{"text": {"content": cal_ids[i]}}],
-                            },
-                            on_gcal_notion_name: {"type": "checkbox", "checkbox": True},
-                            current_calendar_id_notion_name: {
-                                "rich_text": [
-                                    {"text": {"content": gcal_calendar_id[i]}}
-                                ]
-                            },
-                            calendar_notion_name: {
-                                "select": {"name": gcal_calendar_name[i]},
-                            },
+                    },
+                    extra_info_notion_name: {
+                        "type": "rich_text",
+                        "rich_text": [
+                            {
+                                "text": {
+                                    "content": (
+                                        event.description
+                                        if event.description is not None
+                                        else " "
+                                    )
+                                }
+                            }
+                        ],
+                    },
+                    gcal_event_id_notion_name: {
+                        "type": "rich_text",
+                        "rich_text": [{"text": {"content": event.id}}],
+                    },
+                    on_gcal_notion_name: {"type": "checkbox", "checkbox": True},
+                    current_calendar_id_notion_name: {
+                        "rich_text": [{"text": {"content": event.organizer}}]
+                    },
+                    calendar_notion_name: {
+                        "select": {
+                            "name": calendar_names[event.organizer]  # type: ignore
                         },
                     },
-                )
+                },
+            },
+        )
 
-            logging.info(f"Added this event to Notion: {cal_name[i]}")
+        logging.info(f"Added this event to Notion: {event.summary}")
+        record_sync_state(
+            state_store, created_pages.decode(notion_page), event  # type: ignore
+        )
+
+    known_ids = set(all_notion_gcal_ids)
+    new_events = [event for event in events if event.id not in known_ids]
+    engine.map_concurrently(create_notion_page, new_events, settings.concurrency_limit)
+
+    if sync_tokens is not None:
+        sync_tokens.save()
+    if state_store is not None:
+        state_store.commit()
+    return len(new_events)
 
 
 def delete_done_pages(
@@ -1341,47 +1372,111 @@ def delete_done_pages(
     calendar_dictionary,
     calendar_notion_name,
     service,
-):
+    snapshot: Optional[SyncSnapshot] = None,
+    batch_size: int = gcal_batch.MAX_BATCH_SIZE,
+    state_store: Optional[state.StateStore] = None,
+    settings: Optional[config.Settings] = None,
+) -> int:
     """Sync/delete Done pages.
 
     - If marked *Done* in Notion, then it will delete the GCal event
     (and the Notion event once Python API updates)
+
+    If a `snapshot` is given, its pages are used instead of querying the database.
+    The events are deleted in batches of `batch_size`. If a `state_store` is given,
+    the pages whose events are deleted (or were already gone) are recorded in it,
+    and aren't deleted again until they change. If `settings` are given, only the
+    pages in their sync window are queried.
+
+    Returns:
+        The number of events deleted from GCal
     """
-    result_list = paginated_database_query(
-        notion,
-        database_id,
-        **{
-            "filter": {
-                "and": [
-                    {
-                        "property": gcal_event_id_notion_name,
-                        "text": {"is_not_empty": True},
-                    },
-                    {"property": on_gcal_notion_name, "checkbox": {"equals": True}},
-                    {"property": delete_notion_name, "checkbox": {"equals": True}},
-                ]
-            },
-        },
-    )
+    result_list: Iterable[model.SyncPage]
+    if snapshot is not None:
+        result_list = snapshot.done_pages()
+    elif delete_option:
+        decoder = page_decoder(
+            settings,
+            gcal_event_id=gcal_event_id_notion_name,
+            on_gcal=on_gcal_notion_name,
+            done=delete_notion_name,
+            calendar=calendar_notion_name,
+        )
+        # deletes are sent while the rest of the results are still arriving
+        result_list = map(
+            decoder.decode,
+            iter_database_query(
+                notion,
+                database_id,
+                filter={
+                    "and": [
+                        {
+                            "property": gcal_event_id_notion_name,
+                            "text": {"is_not_empty": True},
+                        },
+                        {
+                            "property": on_gcal_notion_name,
+                            "checkbox": {"equals": True},
+                        },
+                        {
+                            "property": delete_notion_name,
+                            "checkbox": {"equals": True},
+                        },
+                        *(
+                            date_window_filters(settings.date_notion_name, settings)
+                            if settings is not None
+                            else []
+                        ),
+                    ]
+                },
+            ),
+        )
+    else:
+        result_list = []
+
+    deleted: list[str] = []
+
+    def record_deleted(page: model.SyncPage) -> None:
+        if state_store is not None:
+            state_store.forget(page.id)
+            state_store.record(page.id, page_hash=state.page_hash(page))
+
+    def log_deleted(
+        page: model.SyncPage, calendar_id: str, event_id: str, response: Any
+    ) -> None:
+        logging.info(f"deleted: {calendar_id} {event_id}")
+        deleted.append(event_id)
+        record_deleted(page)
+
+    def log_not_deleted(
+        page: model.SyncPage, event_id: str, exception: HttpError
+    ) -> None:
+        if exception.resp.status in (404, 410):
+            logging.info(f"{event_id} was already deleted")
+            record_deleted(page)
+        else:
+            logging.info(f"Failed to delete {event_id}: {exception}")
 
     # delete gcal event (and Notion task once the Python API is updated)
-    if delete_option and len(result_list) > 0:
-        for i, el in enumerate(result_list):
-            calendar_id = calendar_dictionary[
-                el["properties"][calendar_notion_name]["select"]["name"]
-            ]
-            event_id = el["properties"][gcal_event_id_notion_name]["rich_text"][0][
-                "text"
-            ]["content"]
-
-            try:
-                service.events().delete(
-                    calendarId=calendar_id, eventId=event_id
-                ).execute()
-                logging.info(f"deleted: {calendar_id} {event_id}")
-            except HttpError:
-                continue
-            time.sleep(0.1)
+    if delete_option:
+        max_retries = (
+            settings.max_retries if settings is not None else rate_limit.MAX_RETRIES
+        )
+        with gcal_batch.EventBatch(service, batch_size, max_retries) as batch:
+            for el in result_list:
+                if state_store is not None and state_store.page_unchanged(el):
+                    continue
+                calendar_id = calendar_dictionary[el.calendar_name]
+                event_id: str = el.gcal_event_id  # type: ignore
+
+                batch.add(
+                    service.events().delete(calendarId=calendar_id, eventId=event_id),
+                    callback=functools.partial(log_deleted, el, calendar_id, event_id),
+                    errback=functools.partial(log_not_deleted, el, event_id),
+                )
+        if state_store is not None:
+            state_store.commit()
+    return len(deleted)
 
 
 def make_event_description(initiative, info):
@@ -1409,17 +1504,25 @@ def make_task_url(ending: str, url_root: str):
     return url_root + url_id
 
 
-def make_cal_event(
+def parse_notion_dates(
+    start: str, end: str
+) -> tuple[datetime.datetime, datetime.datetime]:
+    """Parse the start and end of a Notion date property.
+
+    2 Cases: Start and End are both either date or date+time (see `ncal.dates`)
+    """
+    return dates.parse(start), dates.parse(end)
+
+
+def make_event_body(
     event_name,
     event_description,
     event_start_time,
     source_url,
     event_end_time,
-    cal_id,
-    service,
     config: config.Settings,
-):
-    """Make a calendar event."""
+) -> dict[str, Any]:
+    """Make the body of a calendar event, as used for inserts and updates."""
     if (
         event_start_time.hour == 0
         and event_start_time.minute == 0
@@ -1476,7 +1579,7 @@ def make_cal_event(
         and event_end_time.hour == 0
         and event_end_time.minute == 0
         and event_start_time != event_end_time
-    ):
+    ):  # it's a multiple day event
 
         event_end_time = event_end_time + datetime.timedelta(
             days=1
@@ -1499,7 +1602,7 @@ def make_cal_event(
             },
         }
 
-    else:
+    else:  # just 2 datetimes passed in
         if event_start_time.hour == 0 and event_start_time.minute == 0:
             if event_end_time == event_start_time:
                 # if the datetime fed into this is only a date or is at 12 AM,
@@ -1534,6 +1637,28 @@ def make_cal_event(
                 "url": source_url,
             },
         }
+    return event
+
+
+def make_cal_event(
+    event_name,
+    event_description,
+    event_start_time,
+    source_url,
+    event_end_time,
+    cal_id,
+    service,
+    config: config.Settings,
+):
+    """Make a calendar event."""
+    event = make_event_body(
+        event_name,
+        event_description,
+        event_start_time,
+        source_url,
+        event_end_time,
+        config,
+    )
     logging.info(f"Adding this event to calendar: {event_name}")
 
     logging.info(event)
@@ -1570,123 +1695,14 @@ def update_calendar_event(
     Returns:
         _type_: _description_
     """
-    if (
-        event_start_time.hour == 0
-        and event_start_time.minute == 0
-        and event_end_time == event_start_time
-    ):  # you're given a single date
-        if config.all_day_event_option == 1:
-            event_start_time = datetime.datetime.combine(
-                event_start_time, datetime.datetime.min.time()
-            ) + datetime.timedelta(
-                hours=config.default_event_start
-            )  # make the events pop up at 8 am instead of 12 am
-            event_end_time = event_start_time + datetime.timedelta(
-                minutes=config.default_event_length
-            )
-            event = {
-                "summary": event_name,
-                "description": event_description,
-                "start": {
-                    "dateTime": event_start_time.strftime(DATE_AND_TIME_FORMAT_STRING),
-                    "timeZone": config.timezone,
-                },
-                "end": {
-                    "dateTime": event_end_time.strftime(DATE_AND_TIME_FORMAT_STRING),
-                    "timeZone": config.timezone,
-                },
-                "source": {
-                    "title": "Notion Link",
-                    "url": source_url,
-                },
-            }
-        else:
-            event_end_time = event_end_time + datetime.timedelta(
-                days=1
-            )  # gotta make it to 12AM the day after
-            event = {
-                "summary": event_name,
-                "description": event_description,
-                "start": {
-                    "date": event_start_time.strftime("%Y-%m-%d"),
-                    "timeZone": config.timezone,
-                },
-                "end": {
-                    "date": event_end_time.strftime("%Y-%m-%d"),
-                    "timeZone": config.timezone,
-                },
-                "source": {
-                    "title": "Notion Link",
-                    "url": source_url,
-                },
-            }
-    elif (
-        event_start_time.hour == 0
-        and event_start_time.minute == 0
-        and event_end_time.hour == 0
-        and event_end_time.minute == 0
-        and event_start_time != event_end_time
-    ):  # it's a multiple day event
-
-        event_end_time = event_end_time + datetime.timedelta(
-            days=1
-        )  # gotta make it to 12AM the day after
-
-        event = {
-            "summary": event_name,
-            "description": event_description,
-            "start": {
-                "date": event_start_time.strftime("%Y-%m-%d"),
-                "timeZone": config.timezone,
-            },
-            "end": {
-                "date": event_end_time.strftime("%Y-%m-%d"),
-                "timeZone": config.timezone,
-            },
-            "source": {
-                "title": "Notion Link",
-                "url": source_url,
-            },
-        }
-
-    else:  # just 2 datetimes passed in
-        if event_start_time.hour == 0 and event_start_time.minute == 0:
-            if event_end_time != event_start_time:
-                # Start on Notion is 12 am and end is also given on Notion
-                pass
-            else:
-                # if the datetime fed into this is only a date or is at 12 AM,
-                # then the event will fall under here
-                event_start_time = datetime.datetime.combine(
-                    event_start_time, datetime.datetime.min.time()
-                ) + datetime.timedelta(
-                    hours=config.default_event_start
-                )  # make the events pop up at 8 am instead of 12 am
-                event_end_time = event_start_time + datetime.timedelta(
-                    minutes=config.default_event_length
-                )
-        elif event_end_time == event_start_time:
-            # this would meant that only 1 datetime was actually on the notion dashboard
-            event_end_time = event_start_time + datetime.timedelta(
-                minutes=config.default_event_length
-            )
-
-        event = {
-            "summary": event_name,
-            "description": event_description,
-            "start": {
-                "dateTime": event_start_time.strftime(DATE_AND_TIME_FORMAT_STRING),
-                "timeZone": config.timezone,
-            },
-            "end": {
-                "dateTime": event_end_time.strftime(DATE_AND_TIME_FORMAT_STRING),
-                "timeZone": config.timezone,
-            },
-            "source": {
-                "title": "Notion Link",
-                "url": source_url,
-            },
-        }
+    event = make_event_body(
+        event_name,
+        event_description,
+        event_start_time,
+        source_url,
+        event_end_time,
+        config,
+    )
     logging.info(f"Updating this event to calendar: {event_name}")
 
     if current_cal_id == cal_id:
@@ -0,0 +1,29 @@
+"""Run the independent parts of a sync phase concurrently."""
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable, TypeVar
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+def map_concurrently(
+    function: Callable[[T], R], items: Iterable[T], limit: int
+) -> list[R]:
+    """Call a function on each item, with at most `limit` calls running at once.
+
+    The calls are made from a pool of threads, so `function` must only use thread
+    safe API clients (see `ncal.gcal_setup.setup_google_api`).
+
+    Args:
+        function: The function to call
+        items: The items to call the function on
+        limit: The maximum number of concurrent calls. 1 runs the calls in order,
+            without any extra threads.
+    Returns:
+        The results, in the same order as `items`
+    """
+    items = list(items)
+    if limit <= 1 or len(items) <= 1:
+        return [function(item) for item in items]
+    with ThreadPoolExecutor(max_workers=min(limit, len(items))) as executor:
+        return list(executor.map(function, items))
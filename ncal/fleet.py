@@ -0,0 +1,303 @@
+"""Sync many databases, for many accounts, in one process.
+
+Each tenant of a fleet is a `Settings` profile. A profile file is either the same
+as the config file for `ncal sync`, or holds several profiles in a ``profiles``
+array, with any settings outside of the array shared by all of them:
+
+```toml
+url_root = "https://www.notion.so/"
+
+[[profiles]]
+name = "work"
+notion_api_token = "secret_..."
+database_id = "..."
+
+[[profiles]]
+name = "home"
+notion_api_token = "secret_..."
+database_id = "..."
+credentials_location = "home_user_token.json"
+```
+
+Every tenant keeps its own rate limits, sync state and schedule, but they share
+the Notion and GCal connection pools, the GCal discovery document and the cache of
+related page titles. Their syncs take turns on one event loop: at most
+`max_concurrent_syncs` run at once, and the rest wait in the order they became due.
+
+Each tenant that receives GCal push notifications or Notion webhook events serves
+them itself, so those tenants need their own ports, push addresses and drop
+directories (see `check_endpoints`).
+"""
+import asyncio
+import datetime
+import logging
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Iterable, Optional
+
+import httpx
+import notion_client as nc  # type: ignore
+from googleapiclient.discovery import Resource  # type: ignore
+
+from ncal import core, gcal_setup, runner
+from ncal.config import Settings, load_config_file, load_settings
+from ncal.notion_utils import relation_title_cache
+from ncal.state import StateStore, SyncTokenStore
+
+
+def profile_settings(name: str, values: dict[str, Any]) -> Settings:
+    """Make the settings for a profile.
+
+    Unless they are set in the profile, each tenant gets its own sync state files,
+    named after it, so that tenants don't overwrite each other's state.
+
+    ```python
+    >>> settings = profile_settings(
+    ...     "work", {"notion_api_token": "a", "database_id": "b", "url_root": "c"}
+    ... )
+    >>> settings.state_location, settings.sync_token_location
+    (PosixPath('ncal_state.work.sqlite3'), PosixPath('sync_tokens.work.json'))
+
+    ```
+
+    Args:
+        name: The name of the tenant
+        values: The settings from its profile
+
+    Returns:
+        The tenant's settings (environment variables are not used)
+    """
+    values = {
+        "state_location": Path(f"ncal_state.{name}.sqlite3"),
+        "sync_token_location": Path(f"sync_tokens.{name}.json"),
+        **values,
+    }
+    return load_settings(use_env_vars=False, **values)
+
+
+def endpoints(settings: Settings) -> list[tuple[str, Any]]:
+    """Get what a tenant listens on, or is sent events at, as (kind, value) pairs.
+
+    ```python
+    >>> settings = profile_settings(
+    ...     "work",
+    ...     {
+    ...         "notion_api_token": "a",
+    ...         "database_id": "b",
+    ...         "url_root": "c",
+    ...         "push_address": "https://example.com/work",
+    ...         "notion_webhook_port": 8001,
+    ...     },
+    ... )
+    >>> endpoints(settings)
+    [('port', 8000), ('push address', 'https://example.com/work'), ('port', 8001)]
+
+    ```
+    """
+    found: list[tuple[str, Any]] = []
+    if settings.push_address is not None:
+        found += [("port", settings.push_port), ("push address", settings.push_address)]
+    if settings.notion_webhook_port is not None:
+        found.append(("port", settings.notion_webhook_port))
+    if settings.notion_drop_directory is not None:
+        found.append(("drop directory", settings.notion_drop_directory.resolve()))
+    return found
+
+
+def check_endpoints(profiles: dict[str, Settings]) -> None:
+    """Check that no two tenants listen on, or are sent events at, the same place.
+
+    Raises:
+        ValueError: If two tenants share a port, push address or drop directory
+    """
+    owners: dict[tuple[str, Any], str] = {}
+    for name, settings in profiles.items():
+        for endpoint in dict.fromkeys(endpoints(settings)):
+            owner = owners.setdefault(endpoint, name)
+            if owner != name:
+                kind, value = endpoint
+                raise ValueError(
+                    f"Profiles {owner!r} and {name!r} both use the {kind} {value}"
+                )
+
+
+def load_profiles(paths: Iterable[Path]) -> dict[str, Settings]:
+    """Load the settings of each tenant from profile files.
+
+    A profile is named by its ``name`` setting, or else by its file name (and
+    position in the file's ``profiles`` array).
+
+    Args:
+        paths: toml profile files
+
+    Returns:
+        {tenant name: settings}
+
+    Raises:
+        ValueError: If two profiles have the same name, or share a port, push
+            address or drop directory (see `check_endpoints`)
+    """
+    profiles: dict[str, Settings] = {}
+    for path in paths:
+        values = load_config_file(path)
+        shared = {key: value for key, value in values.items() if key != "profiles"}
+        if "profiles" in values:
+            named = [
+                (f"{Path(path).stem}-{i}", {**shared, **profile})
+                for i, profile in enumerate(values["profiles"])
+            ]
+        else:
+            named = [(Path(path).stem, shared)]
+        for default_name, profile in named:
+            name = str(profile.pop("name", default_name))
+            if name in profiles:
+                raise ValueError(f"More than one profile is named {name!r}")
+            profiles[name] = profile_settings(name, profile)
+    check_endpoints(profiles)
+    return profiles
+
+
+class TenantLock:
+    """Held while a tenant syncs, so that its syncs don't overlap.
+
+    Also takes one of the fleet's sync slots, so that only so many tenants sync at
+    once. Tenants are given slots in the order that they asked for them.
+    """
+
+    def __init__(self, slots: asyncio.Semaphore) -> None:
+        """Make a lock which shares `slots` with the other tenants' locks."""
+        self._lock = asyncio.Lock()
+        self._slots = slots
+
+    async def __aenter__(self) -> None:
+        """Wait for the tenant's other syncs, then for a slot."""
+        await self._lock.acquire()
+        try:
+            await self._slots.acquire()
+        except BaseException:
+            self._lock.release()
+            raise
+
+    async def __aexit__(self, *exc_info: Any) -> None:
+        """Give the slot back, and let the tenant's next sync go."""
+        self._slots.release()
+        self._lock.release()
+
+
+@dataclass
+class Tenant:
+    """One database, and the connections used to sync it.
+
+    Attributes:
+        name: Used to tell tenants apart in the logs
+        settings: Configuration settings
+        service: A Google Calendar API Client
+        notion: A Notion API Client
+        sync_tokens: GCal sync tokens
+        state_store: What was last synced
+    """
+
+    name: str
+    settings: Settings
+    service: Resource
+    notion: nc.Client
+    sync_tokens: SyncTokenStore
+    state_store: StateStore
+
+
+class Fleet:
+    """Run the syncs of many tenants together.
+
+    Attributes:
+        profiles: {tenant name: settings}
+        max_concurrent_syncs: The most tenants that sync at once
+        tenants: The tenants, once connected
+    """
+
+    def __init__(
+        self, profiles: dict[str, Settings], max_concurrent_syncs: int = 4
+    ) -> None:
+        """Set up the shared connection pools, without connecting any tenants."""
+        if max_concurrent_syncs < 1:
+            raise ValueError("max_concurrent_syncs must be at least 1")
+        self.profiles = profiles
+        self.max_concurrent_syncs = max_concurrent_syncs
+        self.tenants: list[Tenant] = []
+        self._notion_transport = httpx.HTTPTransport()
+        self._gcal_connections = threading.local()
+        self._discovery_document: Optional[dict[str, Any]] = None
+
+    def connect(self) -> list[Tenant]:
+        """Set up the API connections and sync state of every tenant."""
+        if self._discovery_document is None and self.profiles:
+            self._discovery_document = gcal_setup.load_discovery_document(
+                next(iter(self.profiles.values())).discovery_cache_location
+            )
+        for name, settings in self.profiles.items():
+            logging.info(f"Setting up API connections for {name}")
+            service, _, notion = core.setup_api_connections(
+                default_calendar_id=settings.default_calendar_id,
+                credentials_location=settings.credentials_location,
+                notion_api_token=settings.notion_api_token,
+                client_secret_location=settings.client_secret_location,
+                notion_requests_per_second=settings.notion_requests_per_second,
+                gcal_requests_per_second=settings.gcal_requests_per_second,
+                max_retries=settings.max_retries,
+                notion_transport=self._notion_transport,
+                gcal_connections=self._gcal_connections,
+                discovery_document=self._discovery_document,
+                notion_api_url=settings.notion_api_url,
+                gcal_api_url=settings.gcal_api_url,
+            )
+            self.tenants.append(
+                Tenant(
+                    name,
+                    settings,
+                    service,
+                    notion,
+                    SyncTokenStore(settings.sync_token_location),
+                    StateStore(settings.state_location),
+                )
+            )
+        # the cache is shared, so keep titles for as long as the strictest tenant
+        relation_title_cache.ttl = min(
+            settings.relation_cache_ttl for settings in self.profiles.values()
+        )
+        return self.tenants
+
+    async def run(self, interval: datetime.timedelta) -> None:
+        """Sync every tenant continuously (see `ncal.runner.continuous_sync`).
+
+        A tenant whose sync fails is restarted after `interval`, without stopping
+        the others.
+        """
+        slots = asyncio.Semaphore(self.max_concurrent_syncs)
+        await asyncio.gather(
+            *(self._run_tenant(tenant, interval, slots) for tenant in self.tenants)
+        )
+
+    async def _run_tenant(
+        self, tenant: Tenant, interval: datetime.timedelta, slots: asyncio.Semaphore
+    ) -> None:
+        lock = TenantLock(slots)
+        while True:
+            try:
+                await runner.continuous_sync(
+                    interval,
+                    tenant.settings,
+                    tenant.service,
+                    tenant.notion,
+                    tenant.sync_tokens,
+                    tenant.state_store,
+                    lock=lock,
+                )
+            except Exception:
+                logging.exception(f"Sync of {tenant.name} failed, restarting it")
+                await asyncio.sleep(interval.total_seconds())
+
+    def close(self) -> None:
+        """Close every tenant's sync state, and the shared connection pools."""
+        for tenant in self.tenants:
+            tenant.state_store.close()
+        self._notion_transport.close()
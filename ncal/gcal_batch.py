@@ -0,0 +1,181 @@
+"""Send Google Calendar requests in batches, to save on round trips."""
+import functools
+import logging
+import time
+from typing import Any, Callable, Final, Optional
+
+from googleapiclient.errors import HttpError  # type: ignore
+from googleapiclient.http import HttpRequest  # type: ignore
+
+from ncal import metrics, rate_limit
+
+# The most requests that the Calendar API accepts in a single batch
+MAX_BATCH_SIZE: Final = 50
+
+Callback = Callable[[Any], None]
+Errback = Callable[[HttpError], None]
+QueuedRequest = tuple[HttpRequest, Optional[Callback], Optional[Errback]]
+
+
+class EventBatch:
+    """Queue up GCal requests and send them in batches.
+
+    The queue is sent when it is full, when `flush` is called, and when the batch
+    is used as a context manager and the block exits without an exception:
+
+    ```python
+    with EventBatch(service) as batch:
+        for page, event in events:
+            batch.add(
+                service.events().insert(calendarId=calendar_id, body=event),
+                callback=lambda response, page=page: ...,
+            )
+    ```
+
+    Callbacks are run in the thread that sends the batch. If a request fails and
+    it has no errback, the error is raised once the rest of its batch has been
+    handled. Requests which GCal throttles are sent again in a later batch (see
+    `ncal.rate_limit`), a whole batch which is throttled is sent again, and
+    requests made by a rate limited service keep to its limit.
+
+    Attributes:
+        service: A Google Calendar API Client
+        batch_size: The number of requests per batch. With a size of 1, requests
+            are sent on their own rather than as a batch.
+        max_retries: How many times throttled requests, and throttled batches, are
+            sent again
+    """
+
+    def __init__(
+        self,
+        service,
+        batch_size: int = MAX_BATCH_SIZE,
+        max_retries: int = rate_limit.MAX_RETRIES,
+    ) -> None:
+        """Set up an empty queue."""
+        self.service = service
+        self.batch_size = max(1, min(batch_size, MAX_BATCH_SIZE))
+        self.max_retries = max_retries
+        self._queue: list[QueuedRequest] = []
+
+    def __enter__(self) -> "EventBatch":
+        """Use the batch as a context manager."""
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        """Send anything left in the queue, unless an exception was raised."""
+        if exc_type is None:
+            self.flush()
+
+    def add(
+        self,
+        request: HttpRequest,
+        callback: Optional[Callback] = None,
+        errback: Optional[Errback] = None,
+    ) -> None:
+        """Queue a request.
+
+        Args:
+            request: An unexecuted request, e.g. ``service.events().insert(...)``
+            callback: Called with the response, if the request succeeds
+            errback: Called with the error, if the request fails
+        """
+        self._queue.append((request, callback, errback))
+        if len(self._queue) >= self.batch_size:
+            self.flush()
+
+    def flush(self) -> None:
+        """Send every queued request."""
+        queue, self._queue = self._queue, []
+        errors: list[HttpError] = []
+
+        # throttled requests to send again, and how long GCal asked to wait
+        retries: list[tuple[QueuedRequest, float]] = []
+
+        def handle(
+            item: QueuedRequest,
+            can_retry: bool,
+            request_id: Optional[str],
+            response: Any,
+            exception: Optional[HttpError],
+        ) -> None:
+            request, callback, errback = item
+            endpoint = rate_limit.gcal_endpoint(request)
+            if exception is None:
+                rate_limit.record_request("gcal", endpoint, "ok")
+                if callback is not None:
+                    callback(response)
+                return
+            rate_limit.record_request("gcal", endpoint, "error")
+            wait = rate_limit.gcal_retry_after(
+                exception, rate_limit.gcal_idempotent(request)
+            )
+            if can_retry and wait is not None:
+                metrics.API_RETRIES.inc(api="gcal", endpoint=endpoint)
+                retries.append((item, wait))
+            elif errback is not None:
+                errback(exception)
+            else:
+                errors.append(exception)
+
+        if self.batch_size == 1:
+            # each request retries itself, if it is rate limited
+            for item in queue:
+                try:
+                    response = item[0].execute()
+                except HttpError as e:
+                    handle(item, False, None, None, e)
+                else:
+                    handle(item, False, None, response, None)
+        else:
+            attempt = 0
+            while queue:
+                can_retry = attempt < self.max_retries
+                for start in range(0, len(queue), self.batch_size):
+                    chunk = queue[start : start + self.batch_size]
+                    batch = self.service.new_batch_http_request()
+                    for item in chunk:
+                        limiter = getattr(item[0], "limiter", None)
+                        if limiter is not None:
+                            limiter.acquire()
+                        batch.add(
+                            item[0],
+                            callback=functools.partial(handle, item, can_retry),
+                        )
+                    logging.info(f"Sending a batch of {len(chunk)} GCal requests")
+                    # the batch as a whole can be throttled, before any of its
+                    # requests are answered
+                    rate_limit.call_with_retry(
+                        batch.execute,
+                        None,
+                        functools.partial(
+                            rate_limit.gcal_retry_after,
+                            idempotent=all(
+                                rate_limit.gcal_idempotent(item[0]) for item in chunk
+                            ),
+                        ),
+                        self.max_retries,
+                        sleep=time.sleep,
+                        api="gcal",
+                        endpoint="batch",
+                    )
+                queue = [item for item, _ in retries]
+                if retries:
+                    for limiter in {
+                        getattr(item[0], "limiter", None) for item in queue
+                    }:
+                        if limiter is not None:
+                            limiter.throttled()
+                    delay = max(
+                        max(wait for _, wait in retries),
+                        rate_limit.backoff_delay(attempt),
+                    )
+                    logging.warning(
+                        f"Retrying {len(queue)} throttled GCal requests in {delay:.1f}s"
+                    )
+                    time.sleep(delay)
+                retries.clear()
+                attempt += 1
+
+        if errors:
+            raise errors[0]
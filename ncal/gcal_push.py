@@ -0,0 +1,259 @@
+"""Receive Google Calendar push notifications, to sync calendars as they change.
+
+GCal can notify a web hook whenever the events on a calendar change (see
+https://developers.google.com/calendar/api/guides/push). `ChannelManager` opens,
+renews and closes a notification channel per calendar, and `NotificationReceiver`
+is a small HTTP server which GCal posts the notifications to.
+
+The receiver can be tried out locally by posting a notification to it by hand,
+using the channel id and token of one of the manager's channels:
+
+```console
+curl -X POST http://localhost:8000/ \\
+    -H "X-Goog-Channel-ID: <channel id>" \\
+    -H "X-Goog-Channel-Token: <token>" \\
+    -H "X-Goog-Resource-State: exists"
+```
+"""
+import logging
+import secrets
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Final, Iterable, Optional
+
+from googleapiclient.errors import HttpError  # type: ignore
+
+# GCal's longest lifetime for an events channel
+MAX_CHANNEL_TTL: Final = 7 * 24 * 60 * 60
+
+
+@dataclass
+class WatchChannel:
+    """A notification channel for the events on a calendar.
+
+    Attributes:
+        calendar_id: GCal calendar id
+        channel_id: The id that GCal sends with each notification
+        resource_id: GCal's id for the watched resource, needed to stop the channel
+        expiration: When GCal will close the channel, in seconds since the epoch
+    """
+
+    calendar_id: str
+    channel_id: str
+    resource_id: str
+    expiration: float
+
+
+class ChannelManager:
+    """Open and renew a GCal notification channel for each calendar.
+
+    Thread safe, so that the receiver can look up channels while they are renewed.
+    Calendars that GCal refused to watch are tried again by `renew_expiring`.
+
+    Attributes:
+        service: A Google Calendar API Client
+        address: The public HTTPS URL that GCal sends notifications to
+        token: A secret that GCal sends with each notification, to verify them
+        ttl: How many seconds each channel is asked to last for
+    """
+
+    def __init__(
+        self,
+        service,
+        address: str,
+        token: Optional[str] = None,
+        ttl: int = MAX_CHANNEL_TTL,
+        clock: Callable[[], float] = time.time,
+    ) -> None:
+        """Set up the manager, without opening any channels."""
+        self.service = service
+        self.address = address
+        self.token = token or secrets.token_urlsafe(32)
+        self.ttl = ttl
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._channels: dict[str, WatchChannel] = {}
+        self._unwatched: set[str] = set()
+
+    def channels(self) -> list[WatchChannel]:
+        """Get the open channels."""
+        with self._lock:
+            return list(self._channels.values())
+
+    def unwatched(self) -> set[str]:
+        """Get the calendars whose last attempt to open a channel failed."""
+        with self._lock:
+            return set(self._unwatched)
+
+    def calendar_for(self, channel_id: str, token: Optional[str]) -> Optional[str]:
+        """Get the calendar that a notification is for, if it is genuine."""
+        if token is None or not secrets.compare_digest(token, self.token):
+            return None
+        with self._lock:
+            channel = self._channels.get(channel_id)
+        return channel.calendar_id if channel is not None else None
+
+    def watch(self, calendar_id: str) -> Optional[WatchChannel]:
+        """Open a channel for a calendar.
+
+        Returns:
+            The channel, or None if GCal refused to open it
+        """
+        body = {
+            "id": str(uuid.uuid4()),
+            "type": "web_hook",
+            "address": self.address,
+            "token": self.token,
+            "params": {"ttl": str(self.ttl)},
+        }
+        try:
+            response = (
+                self.service.events().watch(calendarId=calendar_id, body=body).execute()
+            )
+        except HttpError as e:
+            logging.error(f"Failed to watch calendar {calendar_id}: {e}")
+            with self._lock:
+                self._unwatched.add(calendar_id)
+            return None
+        if "expiration" in response:
+            expiration = int(response["expiration"]) / 1000
+        else:
+            expiration = self._clock() + self.ttl
+        channel = WatchChannel(
+            calendar_id, response["id"], response["resourceId"], expiration
+        )
+        with self._lock:
+            self._channels[channel.channel_id] = channel
+            self._unwatched.discard(calendar_id)
+        logging.info(f"Watching calendar {calendar_id} on channel {channel.channel_id}")
+        return channel
+
+    def watch_all(self, calendar_ids: Iterable[str]) -> None:
+        """Open a channel for each calendar."""
+        for calendar_id in calendar_ids:
+            self.watch(calendar_id)
+
+    def stop(self, channel: WatchChannel) -> None:
+        """Close a channel."""
+        with self._lock:
+            self._channels.pop(channel.channel_id, None)
+        try:
+            self.service.channels().stop(
+                body={"id": channel.channel_id, "resourceId": channel.resource_id}
+            ).execute()
+        except HttpError as e:
+            logging.warning(f"Failed to stop channel {channel.channel_id}: {e}")
+
+    def stop_all(self) -> None:
+        """Close every channel."""
+        for channel in self.channels():
+            self.stop(channel)
+
+    def renew_expiring(self, margin: float = 60 * 60) -> list[WatchChannel]:
+        """Replace the channels that will expire within `margin` seconds.
+
+        The new channel is opened before the old one is closed, so no notifications
+        are missed. If it can't be opened, the old channel is kept until it expires.
+        Channels which have already expired are reopened too, and so are the
+        calendars that couldn't be watched last time (see `unwatched`).
+
+        Returns:
+            The new channels
+        """
+        renewed = []
+        retries = self.unwatched()
+        now = self._clock()
+        for channel in self.channels():
+            if channel.expiration <= now + margin:
+                new_channel = self.watch(channel.calendar_id)
+                if new_channel is not None:
+                    renewed.append(new_channel)
+                if new_channel is not None or channel.expiration <= now:
+                    self.stop(channel)
+        watched = {channel.calendar_id for channel in self.channels()}
+        for calendar_id in sorted(retries - watched):
+            new_channel = self.watch(calendar_id)
+            if new_channel is not None:
+                renewed.append(new_channel)
+        return renewed
+
+
+class NotificationReceiver:
+    """An HTTP server which receives GCal push notifications.
+
+    `on_change` is called with the calendar id of every genuine notification that
+    the events of a calendar have changed. It is called from the server's threads.
+
+    Attributes:
+        channels: Used to check notifications, and work out their calendars
+        on_change: Called with the id of each calendar that has changed
+        server: The underlying HTTP server
+    """
+
+    def __init__(
+        self,
+        channels: ChannelManager,
+        on_change: Callable[[str], None],
+        host: str = "",
+        port: int = 8000,
+    ) -> None:
+        """Set up the server, without starting it."""
+        self.channels = channels
+        self.on_change = on_change
+        self.server = ThreadingHTTPServer((host, port), self._make_handler())
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def port(self) -> int:
+        """Get the port that the server is listening on."""
+        return self.server.server_address[1]
+
+    def _make_handler(self) -> type[BaseHTTPRequestHandler]:
+        receiver = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self) -> None:
+                self.send_response(receiver.handle(self.headers))
+                self.end_headers()
+
+            def log_message(self, format: str, *args) -> None:
+                logging.debug(format % args)
+
+        return Handler
+
+    def handle(self, headers) -> int:
+        """Handle the headers of a notification.
+
+        Returns:
+            The HTTP status code to respond with
+        """
+        channel_id = headers.get("X-Goog-Channel-ID")
+        if channel_id is None:
+            return 400
+        calendar_id = self.channels.calendar_for(
+            channel_id, headers.get("X-Goog-Channel-Token")
+        )
+        if calendar_id is None:
+            logging.warning(f"Ignoring notification for unknown channel {channel_id}")
+            return 404
+        # "sync" is only sent to say that the channel is open
+        if headers.get("X-Goog-Resource-State") != "sync":
+            logging.info(f"Calendar {calendar_id} has changed")
+            self.on_change(calendar_id)
+        return 200
+
+    def start(self) -> None:
+        """Start serving, in a background thread."""
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        logging.info(f"Listening for GCal notifications on port {self.port}")
+
+    def stop(self) -> None:
+        """Stop serving."""
+        self.server.shutdown()
+        self.server.server_close()
+        if self._thread is not None:
+            self._thread.join()
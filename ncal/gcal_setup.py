@@ -1,31 +1,96 @@
-"""Google Calendar API authorization."""
+"""Google Calendar API authorization.
+
+Only what is needed to use an existing token is imported up front. The OAuth flow
+for getting a new token (and the ``requests`` library that it uses) is only
+imported when a new token is needed, to keep one-shot syncs quick to start.
+"""
+import json
 import logging
 import os.path
-from typing import Any, Final
+import threading
+from pathlib import Path
+from typing import Any, Callable, Final, Optional
 
 import google.auth.exceptions  # type: ignore
-from google.auth.transport.requests import Request  # type: ignore
+import google_auth_httplib2  # type: ignore
+import httplib2  # type: ignore
+from google.auth.credentials import AnonymousCredentials  # type: ignore
 from google.oauth2.credentials import Credentials  # type: ignore
-from google_auth_oauthlib.flow import InstalledAppFlow  # type: ignore
-from googleapiclient.discovery import Resource, build  # type: ignore
+from googleapiclient import discovery_cache  # type: ignore
+from googleapiclient.discovery import Resource, build_from_document  # type: ignore
+from googleapiclient.http import HttpRequest  # type: ignore
+
+from ncal import rate_limit
 
 # If modifying these scopes, delete the file at "token_location".
 SCOPES: Final = ["https://www.googleapis.com/auth/calendar"]
+# where the discovery document is downloaded from, if googleapiclient has no copy
+DISCOVERY_URL: Final = "https://www.googleapis.com/discovery/v1/apis/calendar/v3/rest"
 
 
 def setup_google_api(
-    calendar_id: str, client_secret_file: str, token_file: str
+    calendar_id: str,
+    client_secret_file: str,
+    token_file: str,
+    limiter: Optional[rate_limit.RateLimiter] = None,
+    max_retries: int = rate_limit.MAX_RETRIES,
+    discovery_document: Optional[dict[str, Any]] = None,
+    connections: Optional[threading.local] = None,
+    discovery_cache_file: Optional[Path] = None,
+    root_url: Optional[str] = None,
 ) -> tuple[Resource, Any]:
     """Set up the Google Calendar API interface.
 
+    The service is built from a local copy of the API's discovery document, so
+    nothing is fetched over the network unless the token needs refreshing.
+
     Args:
         calendar_id (str):
         client_secret_file (str):
         token_file (str):
+        limiter: The rate limit for every request made by the service
+        max_retries: How many times throttled requests are retried
+        discovery_document: If given, the service is built from it (see
+            `load_discovery_document`), so that services can share one copy
+        connections: Each thread's http connections, if they are to be shared with
+            other services (see `thread_safe_request_builder`)
+        discovery_cache_file: Where to keep a copy of the discovery document, if
+            googleapiclient doesn't come with one
+        root_url: If given, requests are sent here instead of to Google, without
+            any credentials (e.g. to a fake server, for load testing)
 
     Returns:
         tuple[googleapiclient.discovery.Resource, Any]:
     """
+    credentials: Any
+    if root_url is not None:
+        credentials = AnonymousCredentials()
+    else:
+        credentials = load_credentials(client_secret_file, token_file)
+
+    # Build the service object.
+    request_builder = thread_safe_request_builder(
+        credentials, limiter, max_retries, connections
+    )
+    if discovery_document is None:
+        discovery_document = load_discovery_document(discovery_cache_file)
+    if root_url is not None:
+        discovery_document = with_root_url(discovery_document, root_url)
+    service = build_from_document(
+        discovery_document, credentials=credentials, requestBuilder=request_builder
+    )
+    calendar = service.calendars()
+
+    return (service, calendar)
+
+
+def load_credentials(client_secret_file: str, token_file: str) -> Credentials:
+    """Load the user's credentials, refreshing them or logging in if need be.
+
+    Args:
+        client_secret_file: The gcal API client secrets file
+        token_file: The json file that the user's token is kept in
+    """
     # credentials from json file.
     credentials = None
     if os.path.isfile(token_file):
@@ -34,7 +99,7 @@ def setup_google_api(
         # use refresh token if available
         if credentials and credentials.expired and credentials.refresh_token:
             try:
-                credentials.refresh(Request())
+                credentials.refresh(google_auth_httplib2.Request(httplib2.Http()))
             except google.auth.exceptions.RefreshError:
                 logging.error("Failed to refresh credentials.")
                 credentials = get_new_token(client_secret_file, SCOPES)
@@ -44,12 +109,99 @@ def setup_google_api(
         # Save the credentials for the next run
         with open(token_file, "w") as token:
             token.write(credentials.to_json())
+    return credentials
 
-    # Build the service object.
-    service = build("calendar", "v3", credentials=credentials)
-    calendar = service.calendars()
 
-    return (service, calendar)
+def with_root_url(document: dict[str, Any], root_url: str) -> dict[str, Any]:
+    """Copy a discovery document, pointing its requests (and batches) at a URL.
+
+    ```python
+    >>> document = {"rootUrl": "https://www.googleapis.com/", "servicePath": "v3/"}
+    >>> with_root_url(document, "http://127.0.0.1:8001")["baseUrl"]
+    'http://127.0.0.1:8001/v3/'
+
+    ```
+    """
+    root_url = root_url.rstrip("/") + "/"
+    return {
+        **document,
+        "rootUrl": root_url,
+        "baseUrl": root_url + document["servicePath"],
+    }
+
+
+def thread_safe_request_builder(
+    credentials,
+    limiter: Optional[rate_limit.RateLimiter] = None,
+    max_retries: int = rate_limit.MAX_RETRIES,
+    connections: Optional[threading.local] = None,
+) -> Callable[..., HttpRequest]:
+    """Make a request builder that gives each thread its own http connection.
+
+    httplib2 connections are not thread safe, so this is needed for the service to
+    be used from several threads at once (see `ncal.engine.map_concurrently`). The
+    requests keep to `limiter`, and are retried if they are throttled.
+
+    A thread only sends one request at a time, so its connection can be shared by
+    several services (e.g. for different accounts) by giving them the same
+    `connections`.
+
+    Args:
+        credentials: Google user credentials
+        limiter: The rate limit for every request
+        max_retries: How many times throttled requests are retried
+        connections: Holds each thread's ``httplib2.Http``
+
+    Returns:
+        A function to pass as the ``requestBuilder`` of
+        ``googleapiclient.discovery.build``
+    """
+    local = threading.local()
+    if connections is None:
+        connections = threading.local()
+
+    def build_request(http, *args, **kwargs) -> HttpRequest:
+        if not hasattr(local, "http"):
+            if not hasattr(connections, "http"):
+                connections.http = httplib2.Http()
+            local.http = google_auth_httplib2.AuthorizedHttp(
+                credentials, http=connections.http
+            )
+        request = rate_limit.RateLimitedHttpRequest(local.http, *args, **kwargs)
+        request.limiter = limiter
+        request.max_retries = max_retries
+        return request
+
+    return build_request
+
+
+def load_discovery_document(cache_file: Optional[Path] = None) -> dict[str, Any]:
+    """Load the discovery document for the Google Calendar API.
+
+    The copy that comes with googleapiclient is used if there is one. Otherwise, the
+    copy saved in `cache_file` is used, or failing that the document is downloaded
+    (and saved to `cache_file`).
+
+    Args:
+        cache_file: Where to keep a copy of the document
+
+    Returns:
+        The parsed document
+    """
+    content = discovery_cache.get_static_doc("calendar", "v3")
+    if content is None and cache_file is not None and Path(cache_file).is_file():
+        content = Path(cache_file).read_text()
+    if content is None:
+        logging.info(f"Downloading the discovery document from {DISCOVERY_URL}")
+        response, body = httplib2.Http().request(DISCOVERY_URL)
+        if response.status != 200:
+            raise RuntimeError(
+                f"Failed to download the discovery document: {response.status}"
+            )
+        content = body.decode()
+        if cache_file is not None:
+            Path(cache_file).write_text(content)
+    return json.loads(content)
 
 
 def get_new_token(client_secret_file: str, scopes: list[str]):
@@ -62,6 +214,9 @@ def get_new_token(client_secret_file: str, scopes: list[str]):
     Returns:
         credentials: _description_
     """
+    # imported here, as it is slow to import and usually not needed
+    from google_auth_oauthlib.flow import InstalledAppFlow  # type: ignore
+
     flow = InstalledAppFlow.from_client_secrets_file(client_secret_file, scopes)
     credentials = flow.run_local_server(
         host="localhost",
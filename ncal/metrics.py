@@ -0,0 +1,391 @@
+"""Metrics of the syncs and API requests, served in the Prometheus text format.
+
+The metrics are always kept, in this process, and are served while a
+`MetricsServer` is running. `ncal sync` starts one on `settings.metrics_port`, if
+it is set:
+
+```console
+curl http://localhost:9090/metrics
+```
+
+- ``ncal_sync_duration_seconds``: how long each sync pass took
+- ``ncal_sync_overruns_total``: scheduled syncs which took longer than the
+  interval between them (see `ncal.scheduler.Scheduler`)
+- ``ncal_phase_duration_seconds{phase}``: how long each phase took
+  (see `ncal.phases`)
+- ``ncal_phase_changes_total{phase}``: pages and events changed by each phase
+- ``ncal_api_requests_total{api, endpoint, outcome}``: requests sent to each
+  endpoint, and whether they succeeded (``ok``) or not (``error``)
+- ``ncal_api_request_duration_seconds{api, endpoint}``: how long each request
+  took to answer (requests sent in a GCal batch are timed as one ``batch``
+  request)
+- ``ncal_api_retries_total{api, endpoint}``: throttled or failed requests which
+  were sent again
+
+The phases of a sharded sync (see `ncal.sharding`) run in worker processes, so
+only the changes that they make, and not how long they or their requests take,
+are measured.
+"""
+import abc
+import bisect
+import logging
+import math
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Final, Iterable, Iterator, Optional, TypeVar
+
+# the labels of a sample, and its value
+Sample = tuple[str, dict[str, str], float]
+
+M = TypeVar("M", bound="Metric")
+
+CONTENT_TYPE: Final = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def format_labels(labels: dict[str, str]) -> str:
+    r"""Format the labels of a sample.
+
+    ```python
+    >>> format_labels({"phase": "new N->G", "le": "0.5"})
+    '{phase="new N->G",le="0.5"}'
+    >>> format_labels({"path": 'a "b"\\c'})
+    '{path="a \\"b\\"\\\\c"}'
+    >>> format_labels({})
+    ''
+
+    ```
+    """
+    if not labels:
+        return ""
+    escaped = (
+        value.replace("\\", r"\\").replace("\n", r"\n").replace('"', r"\"")
+        for value in labels.values()
+    )
+    return (
+        "{"
+        + ",".join(f'{name}="{value}"' for name, value in zip(labels, escaped))
+        + "}"
+    )
+
+
+def format_value(value: float) -> str:
+    """Format the value of a sample.
+
+    ```python
+    >>> [format_value(v) for v in (3, 0.25, math.inf)]
+    ['3', '0.25', '+Inf']
+
+    ```
+    """
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Metric(abc.ABC):
+    """A named measurement, with a value for each combination of its labels.
+
+    Thread safe.
+
+    Attributes:
+        name: The name of the metric, e.g. ``ncal_api_requests_total``
+        documentation: What it measures
+        labels: The names of its labels
+    """
+
+    kind = "untyped"
+
+    def __init__(
+        self, name: str, documentation: str, labels: Iterable[str] = ()
+    ) -> None:
+        """Set up the metric, without any values."""
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict[str, str]) -> tuple[str, ...]:
+        if set(labels) != set(self.labels):
+            raise ValueError(f"{self.name} has the labels {self.labels}, not {labels}")
+        return tuple(str(labels[name]) for name in self.labels)
+
+    @abc.abstractmethod
+    def samples(self) -> Iterator[Sample]:
+        """Get the current samples, as (suffix, labels, value)."""
+
+    def render(self) -> str:
+        """Format the metric as Prometheus text."""
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.kind}",
+        ]
+        for suffix, labels, value in self.samples():
+            lines.append(
+                f"{self.name}{suffix}{format_labels(labels)} {format_value(value)}"
+            )
+        return "\n".join(lines) + "\n"
+
+
+class Counter(Metric):
+    """A count that only goes up.
+
+    ```python
+    >>> requests = Counter("requests_total", "Requests sent", ["api"])
+    >>> requests.inc(api="notion")
+    >>> requests.inc(2, api="notion")
+    >>> print(requests.render(), end="")
+    # HELP requests_total Requests sent
+    # TYPE requests_total counter
+    requests_total{api="notion"} 3
+
+    ```
+    """
+
+    kind = "counter"
+
+    def __init__(
+        self, name: str, documentation: str, labels: Iterable[str] = ()
+    ) -> None:
+        """Set up the counter, without any counts."""
+        super().__init__(name, documentation, labels)
+        self._values: dict[tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        """Add to the count for some labels."""
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels: str) -> float:
+        """Get the count for some labels."""
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def samples(self) -> Iterator[Sample]:
+        """Get the current samples, as (suffix, labels, value)."""
+        with self._lock:
+            values = list(self._values.items())
+        for key, value in values:
+            yield "", dict(zip(self.labels, key)), value
+
+
+class Histogram(Metric):
+    """Counts of measurements, by the buckets that they fall into.
+
+    ```python
+    >>> durations = Histogram("duration_seconds", "Durations", buckets=(1, 5))
+    >>> for seconds in (0.5, 2, 9):
+    ...     durations.observe(seconds)
+    >>> print(durations.render(), end="")
+    # HELP duration_seconds Durations
+    # TYPE duration_seconds histogram
+    duration_seconds_bucket{le="1"} 1
+    duration_seconds_bucket{le="5"} 2
+    duration_seconds_bucket{le="+Inf"} 3
+    duration_seconds_sum 11.5
+    duration_seconds_count 3
+
+    ```
+
+    Attributes:
+        buckets: The upper bounds of the buckets, in order
+    """
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labels: Iterable[str] = (),
+        buckets: Iterable[float] = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+    ) -> None:
+        """Set up the histogram, without any measurements."""
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+        # for each combination of labels: count in each bucket (+ overflow), sum
+        self._values: dict[tuple[str, ...], tuple[list[int], float]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        """Add a measurement."""
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * (len(self.buckets) + 1), 0))
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            self._values[key] = (counts, total + value)
+
+    def count(self, **labels: str) -> int:
+        """Get the number of measurements for some labels."""
+        with self._lock:
+            counts, _ = self._values.get(self._key(labels), ([], 0))
+            return sum(counts)
+
+    def samples(self) -> Iterator[Sample]:
+        """Get the current samples, as (suffix, labels, value)."""
+        with self._lock:
+            values = [
+                (key, (list(counts), total))
+                for key, (counts, total) in self._values.items()
+            ]
+        for key, (counts, total) in values:
+            labels = dict(zip(self.labels, key))
+            cumulative = 0
+            for bound, count in zip((*self.buckets, math.inf), counts):
+                cumulative += count
+                yield "_bucket", {**labels, "le": format_value(bound)}, cumulative
+            yield "_sum", labels, total
+            yield "_count", labels, cumulative
+
+
+class Registry:
+    """The metrics that are served together."""
+
+    def __init__(self) -> None:
+        """Set up an empty registry."""
+        self.metrics: list[Metric] = []
+
+    def register(self, metric: M) -> M:
+        """Add a metric, and return it."""
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        """Format every metric as Prometheus text."""
+        return "".join(metric.render() for metric in self.metrics)
+
+
+REGISTRY: Final = Registry()
+
+# long enough for the first sync of a large database
+SYNC_BUCKETS: Final = (0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800)
+
+SYNC_SECONDS: Final = REGISTRY.register(
+    Histogram(
+        "ncal_sync_duration_seconds",
+        "How long each sync pass took",
+        buckets=SYNC_BUCKETS,
+    )
+)
+SYNC_OVERRUNS: Final = REGISTRY.register(
+    Counter(
+        "ncal_sync_overruns_total",
+        "Scheduled syncs which took longer than the interval between them",
+    )
+)
+PHASE_SECONDS: Final = REGISTRY.register(
+    Histogram(
+        "ncal_phase_duration_seconds",
+        "How long each sync phase took",
+        ["phase"],
+        buckets=SYNC_BUCKETS,
+    )
+)
+PHASE_CHANGES: Final = REGISTRY.register(
+    Counter(
+        "ncal_phase_changes_total",
+        "Pages and events changed by each sync phase",
+        ["phase"],
+    )
+)
+API_REQUESTS: Final = REGISTRY.register(
+    Counter(
+        "ncal_api_requests_total",
+        "Requests sent to each API endpoint",
+        ["api", "endpoint", "outcome"],
+    )
+)
+API_SECONDS: Final = REGISTRY.register(
+    Histogram(
+        "ncal_api_request_duration_seconds",
+        "How long each API request took to answer",
+        ["api", "endpoint"],
+    )
+)
+API_RETRIES: Final = REGISTRY.register(
+    Counter(
+        "ncal_api_retries_total",
+        "Throttled or failed API requests which were sent again",
+        ["api", "endpoint"],
+    )
+)
+
+
+def notion_endpoint(method: str, path: str) -> str:
+    """Name a Notion endpoint, leaving out the ids in its path.
+
+    ```python
+    >>> notion_endpoint("POST", "databases/0123abcd/query")
+    'POST databases/{id}/query'
+    >>> notion_endpoint("GET", "pages/0123abcd/properties/title")
+    'GET pages/{id}/properties/{id}'
+    >>> notion_endpoint("POST", "pages")
+    'POST pages'
+
+    ```
+    """
+    segments = path.strip("/").split("/")
+    return " ".join(
+        (
+            method.upper(),
+            "/".join(
+                "{id}" if i % 2 else segment for i, segment in enumerate(segments)
+            ),
+        )
+    )
+
+
+class MetricsServer:
+    """An HTTP server which serves the metrics at ``/metrics``.
+
+    Attributes:
+        registry: The metrics to serve
+        server: The underlying HTTP server
+    """
+
+    def __init__(
+        self, registry: Registry = REGISTRY, host: str = "", port: int = 9090
+    ) -> None:
+        """Set up the server, without starting it."""
+        self.registry = registry
+        self.server = ThreadingHTTPServer((host, port), self._make_handler())
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def port(self) -> int:
+        """Get the port that the server is listening on."""
+        return self.server.server_address[1]
+
+    def _make_handler(self) -> type[BaseHTTPRequestHandler]:
+        metrics_server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self) -> None:
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = metrics_server.registry.render().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", CONTENT_TYPE)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format: str, *args) -> None:
+                logging.debug(format % args)
+
+        return Handler
+
+    def start(self) -> None:
+        """Start serving, in a background thread."""
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        logging.info(f"Serving metrics on port {self.port}")
+
+    def stop(self) -> None:
+        """Stop serving."""
+        self.server.shutdown()
+        self.server.server_close()
+        if self._thread is not None:
+            self._thread.join()
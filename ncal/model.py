@@ -0,0 +1,352 @@
+"""Compact, decoded Notion pages and GCal events, shared by every sync phase.
+
+The Notion API returns each page as a deeply nested dictionary, with far more in
+it than a sync needs. A `PageDecoder` picks out the properties named in the
+settings, once per page, into a `SyncPage`, and the raw response is then dropped:
+
+```python
+>>> decoder = PageDecoder({"title": "Name", "on_gcal": "On GCal?"})
+>>> page = decoder.decode(
+...     {
+...         "id": "page-1",
+...         "last_edited_time": "2022-01-01T10:00:00.000Z",
+...         "properties": {
+...             "Name": {"title": [{"plain_text": "Write report"}]},
+...             "On GCal?": {"checkbox": False},
+...         },
+...     }
+... )
+>>> page.title, page.on_gcal
+('Write report', False)
+
+```
+
+Changes written to a page (see `ncal.write_buffer`) are decoded into it too, with
+`SyncPage.apply`, so that the later phases of a pass see them:
+
+```python
+>>> page.apply({"On GCal?": {"checkbox": True}})
+>>> page.on_gcal
+True
+
+```
+
+Likewise, `SyncEvent.decode` parses the dates of a GCal event once.
+"""
+import datetime
+from typing import Any, Callable, Final, Optional
+
+from ncal import config, dates
+
+# picks the values of some `SyncPage` fields out of a property
+PropertyDecoder = Callable[[dict[str, Any]], tuple[Any, ...]]
+
+
+def decode_title(page_property: dict[str, Any]) -> tuple[str]:
+    """Join up the text of a title property."""
+    return (
+        "".join(
+            item.get("plain_text", item.get("text", {}).get("content", ""))
+            for item in page_property.get("title") or []
+        ),
+    )
+
+
+def decode_text(page_property: dict[str, Any]) -> tuple[Optional[str]]:
+    """Get the text of the first item in a rich text property, if there is one."""
+    items = page_property.get("rich_text") or []
+    return (items[0]["text"]["content"] if items else None,)
+
+
+def decode_checkbox(page_property: dict[str, Any]) -> tuple[bool]:
+    """Get the value of a checkbox, or checkbox formula, property."""
+    if "formula" in page_property:
+        return (bool(page_property["formula"].get("boolean")),)
+    return (bool(page_property.get("checkbox")),)
+
+
+def decode_select(page_property: dict[str, Any]) -> tuple[Optional[str]]:
+    """Get the name of the option chosen in a select property."""
+    return ((page_property.get("select") or {}).get("name"),)
+
+
+def decode_relation(page_property: dict[str, Any]) -> tuple[Optional[str]]:
+    """Get the id of the first page in a relation property."""
+    relation = page_property.get("relation") or []
+    return (relation[0]["id"] if relation else None,)
+
+
+def decode_date(page_property: dict[str, Any]) -> tuple[Optional[str], Optional[str]]:
+    """Get the start and end of a date property."""
+    date = page_property.get("date")
+    return (date["start"], date.get("end")) if date else (None, None)
+
+
+def decode_date_start(page_property: dict[str, Any]) -> tuple[Optional[str]]:
+    """Get the start of a date property."""
+    return decode_date(page_property)[:1]
+
+
+# field: how to decode its property, and the `SyncPage` fields that it fills in
+FIELDS: Final[dict[str, tuple[PropertyDecoder, tuple[str, ...]]]] = {
+    "title": (decode_title, ("title",)),
+    "date": (decode_date, ("start", "end")),
+    "initiative": (decode_relation, ("initiative",)),
+    "extra_info": (decode_text, ("extra_info",)),
+    "on_gcal": (decode_checkbox, ("on_gcal",)),
+    "need_gcal_update": (decode_checkbox, ("need_gcal_update",)),
+    "gcal_event_id": (decode_text, ("gcal_event_id",)),
+    "last_updated_time": (decode_date_start, ("last_updated_time",)),
+    "calendar": (decode_select, ("calendar_name",)),
+    "current_calendar_id": (decode_text, ("current_calendar_id",)),
+    "done": (decode_checkbox, ("done",)),
+}
+
+
+class SyncPage:
+    """A Notion page, with just the properties that a sync needs.
+
+    Properties which aren't in the page, or aren't decoded, are None (or False,
+    for checkboxes).
+
+    Attributes:
+        id: Notion page id
+        last_edited_time: When the page was last edited, as Notion gives it
+        title: The title of the page (and of its event)
+        start: The start of its date, as an ISO 8601 date or date and time
+        end: The end of its date, if it has one
+        initiative: The related page id, or select option, of its initiative
+        extra_info: The description of its event
+        on_gcal: Whether it has an event on GCal
+        need_gcal_update: Whether it has been edited since it was last synced
+        gcal_event_id: The id of its event
+        last_updated_time: When it was last synced
+        calendar_name: The name of the calendar chosen for it
+        current_calendar_id: The id of the calendar its event is on
+        done: Whether it has been marked done
+        decoder: Decodes changes to its properties
+    """
+
+    __slots__ = (
+        "id",
+        "last_edited_time",
+        "title",
+        "start",
+        "end",
+        "initiative",
+        "extra_info",
+        "on_gcal",
+        "need_gcal_update",
+        "gcal_event_id",
+        "last_updated_time",
+        "calendar_name",
+        "current_calendar_id",
+        "done",
+        "decoder",
+    )
+
+    def __init__(
+        self,
+        id: str,
+        last_edited_time: Optional[str] = None,
+        decoder: Optional["PageDecoder"] = None,
+        **values: Any,
+    ) -> None:
+        """Make a page, with any of its fields."""
+        self.id = id
+        self.last_edited_time = last_edited_time
+        self.decoder = decoder
+        self.title = ""
+        self.start: Optional[str] = None
+        self.end: Optional[str] = None
+        self.initiative: Optional[str] = None
+        self.extra_info: Optional[str] = None
+        self.on_gcal = False
+        self.need_gcal_update = False
+        self.gcal_event_id: Optional[str] = None
+        self.last_updated_time: Optional[str] = None
+        self.calendar_name: Optional[str] = None
+        self.current_calendar_id: Optional[str] = None
+        self.done = False
+        for name, value in values.items():
+            setattr(self, name, value)
+
+    def __repr__(self) -> str:
+        """Show the page's id and title."""
+        return f"SyncPage(id={self.id!r}, title={self.title!r})"
+
+    def apply(self, properties: dict[str, Any]) -> None:
+        """Decode changes to the page's properties into it.
+
+        Notion works out whether a page needs a GCal update from when it was last
+        synced, so a change to that time also clears `need_gcal_update`, and the
+        page isn't synced again in the same pass.
+
+        Args:
+            properties: The properties that changed, as they are sent to the API
+        """
+        if self.decoder is not None:
+            self.decoder.apply(self, properties)
+            if self.decoder.names.get("last_updated_time") in properties:
+                self.need_gcal_update = False
+
+
+class PageDecoder:
+    """Decode Notion pages into `SyncPage`s.
+
+    Attributes:
+        names: {field of `FIELDS`: the name of its property in the database}
+        initiative_type: Whether the initiative is a relation or a select property
+    """
+
+    def __init__(self, names: dict[str, str], initiative_type: str = "relation"):
+        """Set up the decoder, for the properties with these names."""
+        unknown = set(names) - set(FIELDS)
+        if unknown:
+            raise ValueError(f"Unknown page fields: {', '.join(sorted(unknown))}")
+        self.names = names
+        self.initiative_type = initiative_type
+        # property name: how to decode it, and the fields that it fills in
+        self._decoders = {name: FIELDS[field] for field, name in names.items()}
+        if initiative_type == "select" and "initiative" in names:
+            self._decoders[names["initiative"]] = (decode_select, ("initiative",))
+
+    @classmethod
+    def from_settings(cls, settings: config.Settings) -> "PageDecoder":
+        """Make a decoder for the properties named in the settings."""
+        return cls(
+            {
+                "title": settings.task_notion_name,
+                "date": settings.date_notion_name,
+                "initiative": settings.initiative_notion_name,
+                "extra_info": settings.extrainfo_notion_name,
+                "on_gcal": settings.on_gcal_notion_name,
+                "need_gcal_update": settings.need_gcal_update_notion_name,
+                "gcal_event_id": settings.gcal_event_id_notion_name,
+                "last_updated_time": settings.lastupdatedtime_notion_name,
+                "calendar": settings.calendar_notion_name,
+                "current_calendar_id": settings.current_calendar_id_notion_name,
+                "done": settings.delete_notion_name,
+            },
+            settings.initiative_notion_type,
+        )
+
+    def decode(self, notion_page: dict[str, Any]) -> SyncPage:
+        """Decode a page, as it is returned by the Notion API."""
+        page = SyncPage(notion_page["id"], notion_page.get("last_edited_time"), self)
+        self.apply(page, notion_page.get("properties", {}))
+        return page
+
+    def apply(self, page: SyncPage, properties: dict[str, Any]) -> None:
+        """Decode some properties into a page.
+
+        The properties can be as they are returned by the API, or as they are sent
+        to it.
+        """
+        for name, page_property in properties.items():
+            if name not in self._decoders:
+                continue
+            decode, fields = self._decoders[name]
+            for field, value in zip(fields, decode(page_property)):
+                setattr(page, field, value)
+
+
+class SyncEvent:
+    """A GCal event, with its dates parsed.
+
+    Attributes:
+        id: GCal event id
+        summary: The title of the event
+        description: The description of the event
+        start: When it starts, aware of its timezone (midnight, and naive, for an
+            all day event)
+        end: When it ends, likewise (for an all day event, midnight on the day
+            after it ends, as GCal gives it)
+        all_day: Whether it is an all day event
+        organizer: The email of its organizer, which is the id of the calendar it
+            was made on
+        etag: Its ``etag``, which changes whenever it does
+        updated: When it was last changed
+    """
+
+    __slots__ = (
+        "id",
+        "summary",
+        "description",
+        "start",
+        "end",
+        "all_day",
+        "organizer",
+        "etag",
+        "updated",
+    )
+
+    def __init__(
+        self,
+        id: str,
+        start: datetime.datetime,
+        end: datetime.datetime,
+        all_day: bool = False,
+        summary: str = "",
+        description: Optional[str] = None,
+        organizer: Optional[str] = None,
+        etag: Optional[str] = None,
+        updated: Optional[str] = None,
+    ) -> None:
+        """Make an event."""
+        self.id = id
+        self.start = start
+        self.end = end
+        self.all_day = all_day
+        self.summary = summary
+        self.description = description
+        self.organizer = organizer
+        self.etag = etag
+        self.updated = updated
+
+    def __repr__(self) -> str:
+        """Show the event's id and summary."""
+        return f"SyncEvent(id={self.id!r}, summary={self.summary!r})"
+
+    @classmethod
+    def decode(cls, event: dict[str, Any]) -> "SyncEvent":
+        """Decode an event, as it is returned by the GCal API.
+
+        ```python
+        >>> SyncEvent.decode(
+        ...     {
+        ...         "id": "e1",
+        ...         "start": {"date": "2022-03-01"},
+        ...         "end": {"date": "2022-03-02"},
+        ...     }
+        ... ).end
+        datetime.datetime(2022, 3, 2, 0, 0)
+
+        ```
+        """
+        all_day = "dateTime" not in event["start"]
+        return cls(
+            event["id"],
+            parse_event_time(event["start"]),
+            parse_event_time(event["end"]),
+            all_day,
+            event.get("summary", ""),
+            event.get("description"),
+            event.get("organizer", {}).get("email"),
+            event.get("etag"),
+            event.get("updated"),
+        )
+
+
+def parse_event_time(time: dict[str, str]) -> datetime.datetime:
+    """Parse the start or end of a GCal event.
+
+    ```python
+    >>> parse_event_time({"dateTime": "2022-03-01T10:00:00+01:00"}).utcoffset()
+    datetime.timedelta(seconds=3600)
+    >>> parse_event_time({"date": "2022-03-01"})
+    datetime.datetime(2022, 3, 1, 0, 0)
+
+    ```
+    """
+    return dates.parse(time["dateTime"] if "dateTime" in time else time["date"])
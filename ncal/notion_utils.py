@@ -1,8 +1,85 @@
 """Some utility functions for working with Notion properties etc."""
-from typing import Any, Literal
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Literal, Optional
 
 import notion_client
 
+from ncal import model
+
+
+class RelationTitleCache:
+    """A thread safe TTL/LRU cache of related page id -> page title.
+
+    Entries expire `ttl` seconds after they were fetched, and the least recently
+    used entry is evicted once there are more than `maxsize`. An entry can also be
+    dropped early with `invalidate`.
+
+    The related pages are in another database, which isn't queried. When Notion
+    webhook events are received (see `ncal.notion_webhook`), the titles of the
+    pages that they say have changed are invalidated, so a renamed page's title is
+    fetched again straight away. Otherwise, `ttl` is how stale a title can be.
+
+    Page ids are compared without their dashes.
+
+    Attributes:
+        ttl: Seconds that a title is trusted for
+        maxsize: Most titles kept at once
+    """
+
+    def __init__(
+        self,
+        ttl: float = 3600,
+        maxsize: int = 1024,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        """Set up an empty cache."""
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._clock = clock
+        self._lock = threading.Lock()
+        # page id -> (title, expiry time)
+        self._entries: OrderedDict[str, tuple[str, float]] = OrderedDict()
+
+    def __len__(self) -> int:
+        """Get the number of cached titles."""
+        return len(self._entries)
+
+    def get(self, page_id: str) -> Optional[str]:
+        """Get a cached title, or None if it isn't cached or has expired."""
+        key = page_id.replace("-", "")
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[1] <= self._clock():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def set(self, page_id: str, title: str) -> None:
+        """Cache the title of a page."""
+        key = page_id.replace("-", "")
+        with self._lock:
+            self._entries[key] = (title, self._clock() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, page_id: Optional[str] = None) -> None:
+        """Drop the title of a page, or every title if no page is given."""
+        with self._lock:
+            if page_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(page_id.replace("-", ""), None)
+
+
+# shared by every sync phase, and kept between sync passes
+relation_title_cache = RelationTitleCache()
+
 
 def collapse_rich_text_property(property: list[dict[str, Any]]) -> str:
     """Collapse a Notion Rich Text property into a single string.
@@ -16,20 +93,44 @@ def collapse_rich_text_property(property: list[dict[str, Any]]) -> str:
 
 
 def get_relation_title(
-    notion: notion_client.Client, notion_page: dict[str, Any], relation_name: str
+    notion: notion_client.Client,
+    notion_page: dict[str, Any],
+    relation_name: str,
+    cache: Optional[RelationTitleCache] = relation_title_cache,
 ) -> str:
-    """Get the title of the first page in a relation property."""
+    """Get the title of the first page in a relation property.
+
+    Titles are looked up in `cache` first (pass None to always ask Notion).
+    """
     relation_property: list = notion_page["properties"][relation_name]["relation"]
     if relation_property:
-        relation_id: str = relation_property[0]["id"]
-        relation_title: dict = notion.pages.properties.retrieve(
-            relation_id, "title"
-        )  # type:ignore
-        return relation_title["results"][0]["title"]["plain_text"]
+        return relation_title(notion, relation_property[0]["id"], cache)
     else:
         return ""
 
 
+def relation_title(
+    notion: notion_client.Client,
+    relation_id: str,
+    cache: Optional[RelationTitleCache] = relation_title_cache,
+) -> str:
+    """Get the title of a related page, by its id.
+
+    Titles are looked up in `cache` first (pass None to always ask Notion).
+    """
+    if cache is not None:
+        cached_title = cache.get(relation_id)
+        if cached_title is not None:
+            return cached_title
+    response: dict = notion.pages.properties.retrieve(
+        relation_id, "title"
+    )  # type:ignore
+    title = response["results"][0]["title"]["plain_text"]
+    if cache is not None:
+        cache.set(relation_id, title)
+    return title
+
+
 def get_property_text(
     notion: notion_client.Client,
     notion_page: dict[str, Any],
@@ -50,3 +151,22 @@ def get_property_text(
     else:
         raise ValueError
     return text
+
+
+def initiative_text(
+    notion: notion_client.Client,
+    page: model.SyncPage,
+    initiative_type: Literal["relation", "select"],
+) -> str:
+    """Get the text of a page's initiative, like `get_property_text`.
+
+    The initiative of a decoded page is a related page id, or a select option.
+    """
+    if page.initiative is None:
+        return ""
+    elif initiative_type == "select":
+        return page.initiative
+    elif initiative_type == "relation":
+        return relation_title(notion, page.initiative)
+    else:
+        raise ValueError
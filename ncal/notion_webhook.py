@@ -0,0 +1,271 @@
+"""Receive Notion change events, to sync pages as soon as they change.
+
+Notion can send webhook events when pages change (see
+https://developers.notion.com/reference/webhooks). `NotionWebhookReceiver` is a
+small HTTP server which accepts them, and `DropDirectory` accepts the same events
+as json files dropped into a directory, for when a public endpoint isn't available
+(or to try things out locally):
+
+```console
+echo '{"type": "page.properties_updated", "entity": {"id": "<page id>"}}' \\
+    > <drop directory>/.event.tmp
+mv <drop directory>/.event.tmp <drop directory>/event.json
+```
+
+Files are written under a hidden name and then renamed, so that a half written
+file is never read (see `DropDirectory.drop`).
+
+Either way, the ids of the changed pages are handed on to be synced. The cached
+titles of the changed pages are dropped too, whichever database they are in, so
+that renamed related pages (e.g. projects) show up on GCal at the next sync (see
+`ncal.notion_utils.RelationTitleCache`).
+"""
+import hashlib
+import hmac
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Callable, Final, Optional
+
+from ncal.notion_utils import RelationTitleCache, relation_title_cache
+
+# Notion event types which mean that a page should be synced
+PAGE_EVENT_TYPES: Final = frozenset(
+    {
+        "page.created",
+        "page.properties_updated",
+        "page.content_updated",
+        "page.moved",
+        "page.undeleted",
+        "page.unlocked",
+    }
+)
+
+# where drop files that can't be read are moved to
+UNREADABLE_DIRECTORY: Final = "unreadable"
+
+
+def normalise_id(notion_id: str) -> str:
+    """Remove the dashes from a Notion id, so that ids can be compared.
+
+    ```python
+    >>> normalise_id("1429989f-e8ac-4eff-bc8f-57f56486db54")
+    '1429989fe8ac4effbc8f57f56486db54'
+
+    ```
+    """
+    return notion_id.replace("-", "")
+
+
+def page_ids_from_event(event: Any, database_id: Optional[str] = None) -> list[str]:
+    """Get the ids of the pages that a Notion webhook event says have changed.
+
+    Args:
+        event: The decoded body of the event, or a list of events
+        database_id: If given, pages known to be in other databases are ignored
+
+    Returns:
+        The page ids
+    """
+    if isinstance(event, list):
+        return [
+            page_id for e in event for page_id in page_ids_from_event(e, database_id)
+        ]
+    if not isinstance(event, dict) or event.get("type") not in PAGE_EVENT_TYPES:
+        return []
+    entity = event.get("entity") or {}
+    if entity.get("type", "page") != "page" or "id" not in entity:
+        return []
+    parent = (event.get("data") or {}).get("parent") or {}
+    if (
+        database_id is not None
+        and parent.get("type") == "database"
+        and normalise_id(parent.get("id", "")) != normalise_id(database_id)
+    ):
+        return []
+    return [entity["id"]]
+
+
+def invalidate_titles(event: Any, cache: Optional[RelationTitleCache]) -> None:
+    """Drop the cached titles of every page that an event says has changed."""
+    if cache is not None:
+        for page_id in page_ids_from_event(event):
+            cache.invalidate(page_id)
+
+
+def valid_signature(body: bytes, signature: Optional[str], secret: str) -> bool:
+    """Check the ``X-Notion-Signature`` of an event against the webhook's secret."""
+    expected = "sha256=" + hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+    return signature is not None and hmac.compare_digest(expected, signature)
+
+
+class NotionWebhookReceiver:
+    """An HTTP server which receives Notion webhook events.
+
+    `on_pages` is called with the ids of the pages that each event says have
+    changed. It is called from the server's threads.
+
+    When the webhook is first set up, Notion posts a ``verification_token``; it is
+    logged, so that it can be pasted into Notion (and used as the `secret`).
+
+    Attributes:
+        on_pages: Called with the ids of changed pages
+        secret: If given, events without a valid signature are rejected
+        database_id: Events for pages in other databases are ignored
+        title_cache: Where the titles of changed pages are dropped from (None to
+            leave titles cached)
+        server: The underlying HTTP server
+    """
+
+    def __init__(
+        self,
+        on_pages: Callable[[list[str]], None],
+        secret: Optional[str] = None,
+        database_id: Optional[str] = None,
+        host: str = "",
+        port: int = 8001,
+        title_cache: Optional[RelationTitleCache] = relation_title_cache,
+    ) -> None:
+        """Set up the server, without starting it."""
+        self.on_pages = on_pages
+        self.secret = secret
+        self.database_id = database_id
+        self.title_cache = title_cache
+        self.server = ThreadingHTTPServer((host, port), self._make_handler())
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def port(self) -> int:
+        """Get the port that the server is listening on."""
+        return self.server.server_address[1]
+
+    def _make_handler(self) -> type[BaseHTTPRequestHandler]:
+        receiver = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self) -> None:
+                length = int(self.headers.get("Content-Length") or 0)
+                body = self.rfile.read(length)
+                status = receiver.handle(body, self.headers.get("X-Notion-Signature"))
+                self.send_response(status)
+                self.end_headers()
+
+            def log_message(self, format: str, *args) -> None:
+                logging.debug(format % args)
+
+        return Handler
+
+    def handle(self, body: bytes, signature: Optional[str]) -> int:
+        """Handle the body of an event.
+
+        Returns:
+            The HTTP status code to respond with
+        """
+        try:
+            event = json.loads(body)
+        except ValueError:
+            return 400
+        if isinstance(event, dict) and "verification_token" in event:
+            logging.warning(
+                f"Notion webhook verification token: {event['verification_token']}"
+            )
+            return 200
+        if self.secret is not None and not valid_signature(
+            body, signature, self.secret
+        ):
+            logging.warning("Ignoring Notion event with an invalid signature")
+            return 401
+        invalidate_titles(event, self.title_cache)
+        page_ids = page_ids_from_event(event, self.database_id)
+        if page_ids:
+            self.on_pages(page_ids)
+        return 200
+
+    def start(self) -> None:
+        """Start serving, in a background thread."""
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        logging.info(f"Listening for Notion events on port {self.port}")
+
+    def stop(self) -> None:
+        """Stop serving."""
+        self.server.shutdown()
+        self.server.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+
+class DropDirectory:
+    """A directory of json files, each holding Notion webhook events.
+
+    Hidden files (whose names start with ``.``) are being written, and are left
+    alone until they are renamed. Files which can't be read are moved into the
+    `UNREADABLE_DIRECTORY` subdirectory, rather than deleted.
+
+    Attributes:
+        path: The directory
+        database_id: Events for pages in other databases are ignored
+        title_cache: Where the titles of changed pages are dropped from (None to
+            leave titles cached)
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        database_id: Optional[str] = None,
+        title_cache: Optional[RelationTitleCache] = relation_title_cache,
+    ) -> None:
+        """Create the directory, if it doesn't exist."""
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.database_id = database_id
+        self.title_cache = title_cache
+
+    def drop(self, events: Any) -> Path:
+        """Write an event file, atomically.
+
+        Args:
+            events: A webhook event, or a list of them
+
+        Returns:
+            The file
+        """
+        with tempfile.NamedTemporaryFile(
+            "w", dir=self.path, prefix=".", suffix=".tmp", delete=False
+        ) as temporary:
+            json.dump(events, temporary)
+        event_file = self.path / f"{time.time_ns()}{Path(temporary.name).stem}.json"
+        os.replace(temporary.name, event_file)
+        return event_file
+
+    def drain(self) -> list[str]:
+        """Read and delete every event file.
+
+        Returns:
+            The ids of the pages that the events say have changed
+        """
+        page_ids = []
+        for event_file in sorted(self.path.glob("*.json")):
+            if event_file.name.startswith("."):
+                continue
+            try:
+                event = json.loads(event_file.read_text())
+            except FileNotFoundError:
+                continue
+            except (OSError, ValueError) as e:
+                unreadable = self.path / UNREADABLE_DIRECTORY
+                logging.error(
+                    f"Moving unreadable event file {event_file} to {unreadable}: {e}"
+                )
+                unreadable.mkdir(exist_ok=True)
+                os.replace(event_file, unreadable / event_file.name)
+                continue
+            invalidate_titles(event, self.title_cache)
+            page_ids.extend(page_ids_from_event(event, self.database_id))
+            event_file.unlink(missing_ok=True)
+        return page_ids
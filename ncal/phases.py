@@ -0,0 +1,225 @@
+"""The phases of a sync pass, all called the same way.
+
+Each phase takes the settings and API clients, plus whatever is kept between
+passes, and returns the number of pages and events that it changed:
+
+```python
+changes = PHASES["new N->G"](settings, service, notion, snapshot=snapshot)
+```
+
+They are run in the order of `PHASES` (see `ncal.runner.sync`), by `run`, which
+measures them too.
+"""
+import time
+from typing import Any, Callable, Final, Optional
+
+import arrow
+import notion_client as nc  # type: ignore
+from googleapiclient.discovery import Resource  # type: ignore
+
+from ncal import core, metrics
+from ncal.config import Settings
+from ncal.snapshot import SyncSnapshot
+from ncal.state import StateStore, SyncTokenStore
+
+Phase = Callable[..., int]
+
+
+def new_notion_to_gcal(
+    settings: Settings,
+    service: Resource,
+    notion: nc.Client,
+    snapshot: Optional[SyncSnapshot] = None,
+    state_store: Optional[StateStore] = None,
+    sync_tokens: Optional[SyncTokenStore] = None,
+) -> int:
+    """Add new Notion pages to GCal (see `ncal.core.new_events_notion_to_gcal`)."""
+    return core.new_events_notion_to_gcal(
+        settings.database_id,
+        settings.url_root,
+        settings.default_calendar_name,
+        settings.calendar_dictionary,
+        settings.task_notion_name,
+        settings.date_notion_name,
+        settings.initiative_notion_name,
+        settings.extrainfo_notion_name,
+        settings.on_gcal_notion_name,
+        settings.gcal_event_id_notion_name,
+        settings.lastupdatedtime_notion_name,
+        settings.calendar_notion_name,
+        settings.current_calendar_id_notion_name,
+        settings.delete_notion_name,
+        notion,
+        service,
+        settings=settings,
+        snapshot=snapshot,
+        state_store=state_store,
+    )
+
+
+def modified_notion_to_gcal(
+    settings: Settings,
+    service: Resource,
+    notion: nc.Client,
+    snapshot: Optional[SyncSnapshot] = None,
+    state_store: Optional[StateStore] = None,
+    sync_tokens: Optional[SyncTokenStore] = None,
+) -> int:
+    """Update the events of changed pages.
+
+    See `ncal.core.existing_events_notion_to_gcal`.
+    """
+    return core.existing_events_notion_to_gcal(
+        settings.database_id,
+        settings.url_root,
+        settings.default_calendar_id,
+        settings.default_calendar_name,
+        settings.calendar_dictionary,
+        settings.task_notion_name,
+        settings.date_notion_name,
+        settings.initiative_notion_name,
+        settings.extrainfo_notion_name,
+        settings.on_gcal_notion_name,
+        settings.need_gcal_update_notion_name,
+        settings.gcal_event_id_notion_name,
+        settings.lastupdatedtime_notion_name,
+        settings.calendar_notion_name,
+        settings.current_calendar_id_notion_name,
+        settings.delete_notion_name,
+        notion,
+        arrow.utcnow().isoformat(),
+        service,
+        settings=settings,
+        snapshot=snapshot,
+        state_store=state_store,
+    )
+
+
+def modified_gcal_to_notion(
+    settings: Settings,
+    service: Resource,
+    notion: nc.Client,
+    snapshot: Optional[SyncSnapshot] = None,
+    state_store: Optional[StateStore] = None,
+    sync_tokens: Optional[SyncTokenStore] = None,
+) -> int:
+    """Update the pages of changed events.
+
+    See `ncal.core.existing_events_gcal_to_notion`.
+    """
+    return core.existing_events_gcal_to_notion(
+        settings.database_id,
+        settings.default_calendar_name,
+        settings.calendar_dictionary,
+        settings.date_notion_name,
+        settings.on_gcal_notion_name,
+        settings.need_gcal_update_notion_name,
+        settings.gcal_event_id_notion_name,
+        settings.lastupdatedtime_notion_name,
+        settings.calendar_notion_name,
+        settings.current_calendar_id_notion_name,
+        settings.delete_notion_name,
+        service,
+        notion,
+        arrow.utcnow().isoformat(),
+        settings=settings,
+        snapshot=snapshot,
+        state_store=state_store,
+    )
+
+
+def new_gcal_to_notion(
+    settings: Settings,
+    service: Resource,
+    notion: nc.Client,
+    snapshot: Optional[SyncSnapshot] = None,
+    state_store: Optional[StateStore] = None,
+    sync_tokens: Optional[SyncTokenStore] = None,
+) -> int:
+    """Add new GCal events to Notion (see `ncal.core.new_events_gcal_to_notion`)."""
+    return core.new_events_gcal_to_notion(
+        settings.database_id,
+        settings.calendar_dictionary,
+        settings.task_notion_name,
+        settings.date_notion_name,
+        settings.extrainfo_notion_name,
+        settings.on_gcal_notion_name,
+        settings.gcal_event_id_notion_name,
+        settings.lastupdatedtime_notion_name,
+        settings.calendar_notion_name,
+        settings.current_calendar_id_notion_name,
+        settings.delete_notion_name,
+        service,
+        notion,
+        settings=settings,
+        sync_tokens=sync_tokens,
+        snapshot=snapshot,
+        state_store=state_store,
+    )
+
+
+def delete_done(
+    settings: Settings,
+    service: Resource,
+    notion: nc.Client,
+    snapshot: Optional[SyncSnapshot] = None,
+    state_store: Optional[StateStore] = None,
+    sync_tokens: Optional[SyncTokenStore] = None,
+) -> int:
+    """Delete the events of done pages (see `ncal.core.delete_done_pages`)."""
+    return core.delete_done_pages(
+        notion=notion,
+        database_id=settings.database_id,
+        gcal_event_id_notion_name=settings.gcal_event_id_notion_name,
+        on_gcal_notion_name=settings.on_gcal_notion_name,
+        delete_notion_name=settings.delete_notion_name,
+        delete_option=settings.delete_option,
+        calendar_dictionary=settings.calendar_dictionary,
+        calendar_notion_name=settings.calendar_notion_name,
+        service=service,
+        snapshot=snapshot,
+        batch_size=settings.gcal_batch_size,
+        state_store=state_store,
+        settings=settings,
+    )
+
+
+# in the order that they run; "delete" only runs if `settings.delete_option` is set
+PHASES: Final[dict[str, Phase]] = {
+    "new N->G": new_notion_to_gcal,
+    "modified N->G": modified_notion_to_gcal,
+    "modified G->N": modified_gcal_to_notion,
+    "new G->N": new_gcal_to_notion,
+    "delete": delete_done,
+}
+NOTION_TO_GCAL: Final = ("new N->G", "modified N->G", "delete")
+GCAL_TO_NOTION: Final = ("modified G->N", "new G->N")
+
+
+def run(
+    name: str, settings: Settings, service: Resource, notion: nc.Client, **kwargs: Any
+) -> int:
+    """Run a phase, measuring how long it takes and what it changes.
+
+    See `ncal.metrics`.
+
+    Args:
+        name: The name of the phase, one of `PHASES`
+        settings: Configuration settings
+        service: A Google Calendar API Client
+        notion: A Notion API Client
+        kwargs: Passed on to the phase, e.g. ``snapshot``
+
+    Returns:
+        The number of pages and events that were changed
+    """
+    start = time.perf_counter()
+    changes = PHASES[name](settings, service, notion, **kwargs)
+    metrics.PHASE_SECONDS.observe(time.perf_counter() - start, phase=name)
+    metrics.PHASE_CHANGES.inc(changes, phase=name)
+    return changes
+
+
+def enabled(names: tuple[str, ...], settings: Settings) -> list[str]:
+    """Get the phases out of `names` which the settings say should run."""
+    return [name for name in names if name != "delete" or settings.delete_option]
@@ -0,0 +1,315 @@
+"""Profile each phase of a sync, to find out where its time and memory go.
+
+`ncal sync --profile` runs every full sync with a `PhaseProfiler`, which profiles
+the fetch of the database and each phase in turn, and prints a report after each
+pass:
+
+```console
+fetch: 2.41s, 0.52s on the CPU and 1.89s waiting (on the APIs), 8.3 MiB peak
+      calls     self    total  function
+          1    0.000    2.410  ncal/snapshot.py:60(fetch)
+    ...
+```
+
+For each phase, the report shows:
+
+- the wall time, split into time on the CPU and time spent waiting, which is
+  mostly waiting on the APIs and rate limits
+- the most memory allocated at once while it ran
+- the functions which took the most time, including the functions they called
+- the lines which allocated the most memory still held when it finished
+
+With ``--profile-output``, the full profiles are written too, for each pass:
+
+- ``<pass>-<phase>.pstats``: a `pstats` file, e.g. for ``python -m pstats`` or
+  snakeviz
+- ``<pass>.speedscope.json``: every phase as a flame graph, for
+  https://www.speedscope.app. It is built from the call graph, so the time of a
+  function which is called from several places is split between them in
+  proportion.
+
+cProfile only sees the thread that it runs in, so the phases are profiled one
+page or event at a time, in this process (see `ncal.engine`), and the CPU time is
+that of the whole process.
+"""
+import cProfile
+import json
+import os
+import pstats
+import re
+import time
+import tracemalloc
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Final, Optional, TypeVar
+
+T = TypeVar("T")
+
+# (file, line, function name), as pstats keys functions
+FunctionKey = tuple[str, int, str]
+
+# leave the profiler's own allocations out of the report
+SNAPSHOT_FILTERS: Final = (
+    tracemalloc.Filter(False, __file__),
+    tracemalloc.Filter(False, tracemalloc.__file__),
+)
+
+SPEEDSCOPE_SCHEMA: Final = "https://www.speedscope.app/file-format-schema.json"
+
+
+@dataclass
+class PhaseProfile:
+    """What a phase spent its time and memory on.
+
+    Attributes:
+        phase: The name of the phase
+        wall_seconds: How long it took
+        cpu_seconds: How much of that was spent on the CPU
+        peak_memory: The most bytes allocated at once while it ran, above what was
+            allocated when it started
+        stats: The functions that it called
+        allocations: The lines which allocated the most memory still held at the
+            end, as (line, bytes, number of blocks)
+    """
+
+    phase: str
+    wall_seconds: float
+    cpu_seconds: float
+    peak_memory: int
+    stats: pstats.Stats
+    allocations: list[tuple[str, int, int]] = field(default_factory=list)
+
+    @property
+    def waiting_seconds(self) -> float:
+        """Get the time spent off the CPU, e.g. waiting on the APIs."""
+        return max(0.0, self.wall_seconds - self.cpu_seconds)
+
+
+def function_name(key: FunctionKey) -> str:
+    """Name a function in a profile, with the last parts of its path.
+
+    ```python
+    >>> function_name(("/venv/lib/site-packages/ncal/core.py", 12, "sync"))
+    'ncal/core.py:12(sync)'
+    >>> function_name(("~", 0, "<built-in method time.sleep>"))
+    '<built-in method time.sleep>'
+
+    ```
+    """
+    path, line, name = key
+    if path == "~" and line == 0:
+        return name
+    return f"{short_path(path)}:{line}({name})"
+
+
+def short_path(path: str) -> str:
+    """Shorten a path to its file and the directory that it is in."""
+    return "/".join(path.replace(os.sep, "/").split("/")[-2:])
+
+
+def file_name(phase: str) -> str:
+    """Make the name of a phase safe to use in a file name.
+
+    ```python
+    >>> file_name("modified N->G")
+    'modified-n-g'
+
+    ```
+    """
+    return re.sub(r"\W+", "-", phase).strip("-").lower()
+
+
+def flame_samples(
+    stats: pstats.Stats, min_seconds: float = 1e-4
+) -> list[tuple[list[FunctionKey], float]]:
+    """Rebuild the stacks of a profile from its call graph, for a flame graph.
+
+    Each function's own time is split between the stacks that it was called from,
+    in proportion to the time spent in it from each caller.
+
+    Args:
+        stats: The profile
+        min_seconds: Stacks which took less time than this are left out
+
+    Returns:
+        (stack from the outermost function in, seconds spent in the innermost
+        function itself)
+    """
+    entries: dict[FunctionKey, Any] = stats.stats  # type: ignore
+    callees: dict[FunctionKey, dict[FunctionKey, float]] = {}
+    for function, (_, _, _, _, callers) in entries.items():
+        for caller, (_, _, _, caller_total) in callers.items():
+            callees.setdefault(caller, {})[function] = caller_total
+    roots = [
+        function
+        for function, (_, _, _, _, callers) in entries.items()
+        if not callers or all(caller not in entries for caller in callers)
+    ]
+    samples: list[tuple[list[FunctionKey], float]] = []
+
+    def walk(stack: list[FunctionKey], seconds: float) -> None:
+        function = stack[-1]
+        _, _, own, total, _ = entries[function]
+        share = seconds / total if total > 0 else 0
+        if own * share >= min_seconds:
+            samples.append((list(stack), own * share))
+        for callee, callee_total in callees.get(function, {}).items():
+            # recursion is shown as a single frame
+            if callee not in stack and callee_total * share >= min_seconds:
+                walk([*stack, callee], callee_total * share)
+
+    for root in roots:
+        walk([root], entries[root][3])
+    return samples
+
+
+def speedscope(profiles: list[PhaseProfile], name: str) -> dict[str, Any]:
+    """Make a speedscope file, with a flame graph of each phase."""
+    frames: list[dict[str, Any]] = []
+    frame_indices: dict[FunctionKey, int] = {}
+
+    def frame(key: FunctionKey) -> int:
+        if key not in frame_indices:
+            frame_indices[key] = len(frames)
+            frames.append({"name": function_name(key), "file": key[0], "line": key[1]})
+        return frame_indices[key]
+
+    speedscope_profiles = []
+    for profile in profiles:
+        samples = flame_samples(profile.stats)
+        speedscope_profiles.append(
+            {
+                "type": "sampled",
+                "name": profile.phase,
+                "unit": "seconds",
+                "startValue": 0,
+                "endValue": sum(seconds for _, seconds in samples),
+                "samples": [[frame(key) for key in stack] for stack, _ in samples],
+                "weights": [seconds for _, seconds in samples],
+            }
+        )
+    return {
+        "$schema": SPEEDSCOPE_SCHEMA,
+        "name": name,
+        "exporter": "ncal",
+        "shared": {"frames": frames},
+        "profiles": speedscope_profiles,
+    }
+
+
+class PhaseProfiler:
+    """Profile functions one at a time, and report on them after each sync pass.
+
+    ```python
+    profiler = PhaseProfiler(output=Path("profiles"))
+    snapshot = profiler.wrap("fetch", SyncSnapshot.fetch)(notion, settings)
+    print(profiler.report())
+    ```
+
+    Attributes:
+        output: The directory to write pstats and speedscope files to (None not to
+            write them)
+        top: How many functions, and lines allocating memory, to report on
+        profiles: The profiles of this pass so far
+        passes: The number of passes reported on
+    """
+
+    def __init__(self, output: Optional[Path] = None, top: int = 15) -> None:
+        """Set up the profiler."""
+        self.output = output
+        self.top = top
+        self.profiles: list[PhaseProfile] = []
+        self.passes = 0
+
+    def wrap(self, phase: str, function: Callable[..., T]) -> Callable[..., T]:
+        """Profile each call of a function, as a phase."""
+
+        def profiled(*args: Any, **kwargs: Any) -> T:
+            return self.call(phase, function, *args, **kwargs)
+
+        return profiled
+
+    def call(
+        self, phase: str, function: Callable[..., T], *args: Any, **kwargs: Any
+    ) -> T:
+        """Call a function, profiling it as a phase."""
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+        before = tracemalloc.take_snapshot().filter_traces(SNAPSHOT_FILTERS)
+        tracemalloc.reset_peak()
+        allocated, _ = tracemalloc.get_traced_memory()
+        profile = cProfile.Profile()
+        start = time.perf_counter()
+        cpu_start = time.process_time()
+        profile.enable()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            profile.disable()
+            wall_seconds = time.perf_counter() - start
+            cpu_seconds = time.process_time() - cpu_start
+            _, peak = tracemalloc.get_traced_memory()
+            after = tracemalloc.take_snapshot().filter_traces(SNAPSHOT_FILTERS)
+            allocations = [
+                (
+                    f"{short_path(difference.traceback[0].filename)}:"
+                    f"{difference.traceback[0].lineno}",
+                    difference.size_diff,
+                    difference.count_diff,
+                )
+                for difference in after.compare_to(before, "lineno")[: self.top]
+                if difference.size_diff > 0
+            ]
+            self.profiles.append(
+                PhaseProfile(
+                    phase,
+                    wall_seconds,
+                    cpu_seconds,
+                    max(0, peak - allocated),
+                    pstats.Stats(profile),
+                    allocations,
+                )
+            )
+
+    def format_profile(self, profile: PhaseProfile) -> str:
+        """Format the report on a phase."""
+        lines = [
+            f"{profile.phase}: {profile.wall_seconds:.2f}s, "
+            f"{profile.cpu_seconds:.2f}s on the CPU and "
+            f"{profile.waiting_seconds:.2f}s waiting (on the APIs), "
+            f"{profile.peak_memory / 2**20:.1f} MiB peak",
+            f"{'calls':>11} {'self':>8} {'total':>8}  function",
+        ]
+        entries: dict[FunctionKey, Any] = profile.stats.stats  # type: ignore
+        by_total = sorted(entries.items(), key=lambda item: item[1][3], reverse=True)
+        for key, (_, calls, own, total, _) in by_total[: self.top]:
+            lines.append(f"{calls:>11} {own:8.3f} {total:8.3f}  {function_name(key)}")
+        if profile.allocations:
+            lines.append(f"{'KiB held':>11} {'blocks':>8}  line")
+            for line, size, blocks in profile.allocations:
+                lines.append(f"{size / 2**10:11.1f} {blocks:>8}  {line}")
+        return "\n".join(lines)
+
+    def report(self) -> str:
+        """Report on the pass so far, write its files, and start the next pass.
+
+        Returns:
+            The report on each phase
+        """
+        self.passes += 1
+        profiles, self.profiles = self.profiles, []
+        if self.output is not None:
+            self.output.mkdir(parents=True, exist_ok=True)
+            for profile in profiles:
+                profile.stats.dump_stats(
+                    self.output / f"{self.passes:03}-{file_name(profile.phase)}.pstats"
+                )
+            (self.output / f"{self.passes:03}.speedscope.json").write_text(
+                json.dumps(speedscope(profiles, f"ncal sync pass {self.passes}"))
+            )
+        return "\n\n".join(self.format_profile(profile) for profile in profiles)
+
+    def close(self) -> None:
+        """Stop tracing memory allocations."""
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
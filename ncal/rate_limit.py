@@ -0,0 +1,340 @@
+"""Keep to the Notion and Google Calendar rate limits, and retry throttled requests.
+
+Each API gets a `RateLimiter`: a token bucket that every request takes a token from
+before it is sent. When an API throttles a request, its limiter halves its rate and
+then recovers a little after each successful request, so the sync runs as fast as
+the API currently allows. Throttled and temporarily failed requests are retried by
+`call_with_retry`, waiting for the ``Retry-After`` time the API asks for, or
+otherwise an exponential backoff with full jitter.
+
+A request that fails with a server error or a timeout may still have been carried
+out, so only idempotent requests (reads, updates and deletes) are retried after
+one. Requests that create something, like a Notion page or a GCal event, are only
+retried when they are throttled, so that they aren't created twice.
+"""
+import functools
+import json
+import logging
+import random
+import threading
+import time
+from typing import Any, Callable, Final, Optional, TypeVar
+
+import notion_client as nc  # type: ignore
+from googleapiclient.errors import HttpError  # type: ignore
+from googleapiclient.http import HttpRequest  # type: ignore
+
+from ncal import metrics
+
+T = TypeVar("T")
+
+# Notion asks for an average of 3 requests per second
+NOTION_REQUESTS_PER_SECOND: Final = 3.0
+GCAL_REQUESTS_PER_SECOND: Final = 10.0
+MAX_RETRIES: Final = 5
+
+RETRY_STATUSES: Final = frozenset({429, 500, 502, 503, 504})
+# the statuses that non-idempotent requests are retried after
+THROTTLED_STATUSES: Final = frozenset({429})
+GCAL_RATE_LIMIT_REASONS: Final = frozenset(
+    {"rateLimitExceeded", "userRateLimitExceeded"}
+)
+
+
+class RateLimiter:
+    """A thread safe, adaptive token bucket.
+
+    Attributes:
+        max_rate: The most requests per second
+        rate: The current requests per second, between `min_rate` and `max_rate`
+        min_rate: The slowest that throttling can make the limiter go
+        capacity: The most requests that can be sent in a burst
+    """
+
+    def __init__(
+        self,
+        max_rate: float,
+        capacity: Optional[float] = None,
+        min_rate: Optional[float] = None,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], None] = time.sleep,
+    ) -> None:
+        """Start with a full bucket, at the maximum rate."""
+        self.max_rate = max_rate
+        self.rate = max_rate
+        self.min_rate = min_rate if min_rate is not None else max_rate / 16
+        self.capacity = capacity if capacity is not None else max(1.0, max_rate)
+        self._tokens = self.capacity
+        self._clock = clock
+        self._sleep = sleep
+        self._last = clock()
+        self._lock = threading.Lock()
+
+    def _refill(self) -> None:
+        now = self._clock()
+        self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+        self._last = now
+
+    def acquire(self) -> None:
+        """Wait until a request can be sent, and take a token for it."""
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            self._sleep(wait)
+
+    def throttled(self) -> None:
+        """Slow down, because the API has throttled a request."""
+        with self._lock:
+            self._refill()
+            self.rate = max(self.min_rate, self.rate / 2)
+            self._tokens = min(self._tokens, 0)
+        logging.warning(f"Throttled, slowing to {self.rate:.2f} requests per second")
+
+    def succeeded(self) -> None:
+        """Speed back up towards `max_rate`, after a successful request."""
+        if self.rate < self.max_rate:
+            with self._lock:
+                self._refill()
+                self.rate = min(self.max_rate, self.rate + self.max_rate / 20)
+
+
+def backoff_delay(
+    attempt: int,
+    base: float = 0.5,
+    cap: float = 60,
+    rng: Callable[[float, float], float] = random.uniform,
+) -> float:
+    """Get a "full jitter" exponential backoff delay.
+
+    Args:
+        attempt: The number of the retry, starting at 0
+        base: The longest delay for the first retry, in seconds
+        cap: The longest that any delay can be, in seconds
+        rng: Picks a delay between its two arguments
+    """
+    return rng(0, min(cap, base * 2**attempt))
+
+
+def notion_retry_after(error: Exception, idempotent: bool = True) -> Optional[float]:
+    """Check whether a Notion request should be retried.
+
+    Args:
+        error: What the request raised
+        idempotent: Whether the request can safely be sent twice (see
+            `notion_idempotent`), otherwise it is only retried if it was throttled
+
+    Returns:
+        None if it shouldn't be retried, otherwise the number of seconds that Notion
+        asked to wait for (0 if it didn't say)
+    """
+    if isinstance(error, nc.errors.RequestTimeoutError):
+        return 0 if idempotent else None
+    if isinstance(error, nc.errors.HTTPResponseError):
+        if error.status in (RETRY_STATUSES if idempotent else THROTTLED_STATUSES):
+            return parse_retry_after(error.headers.get("retry-after"))
+    return None
+
+
+def notion_idempotent(method: str, path: str) -> bool:
+    """Check whether a Notion request can safely be sent twice.
+
+    Creating something, or appending blocks, isn't idempotent. Queries and searches
+    are sent as ``POST``, but only read.
+
+    ```python
+    >>> notion_idempotent("POST", "databases/0123abcd/query")
+    True
+    >>> notion_idempotent("PATCH", "pages/0123abcd")
+    True
+    >>> notion_idempotent("POST", "pages")
+    False
+    >>> notion_idempotent("PATCH", "blocks/0123abcd/children")
+    False
+
+    ```
+    """
+    path = path.strip("/")
+    if method.upper() == "POST":
+        return path == "search" or path.endswith("/query")
+    return not (method.upper() == "PATCH" and path.endswith("/children"))
+
+
+def gcal_retry_after(error: Exception, idempotent: bool = True) -> Optional[float]:
+    """Check whether a Google Calendar request should be retried.
+
+    GCal signals rate limiting with either a 429, or a 403 with a reason of
+    ``rateLimitExceeded`` or ``userRateLimitExceeded``.
+
+    Args:
+        error: What the request raised
+        idempotent: Whether the request can safely be sent twice (see
+            `gcal_idempotent`), otherwise it is only retried if it was throttled
+
+    Returns:
+        None if it shouldn't be retried, otherwise the number of seconds that GCal
+        asked to wait for (0 if it didn't say)
+    """
+    if not isinstance(error, HttpError):
+        return None
+    status = error.resp.status
+    if status in (RETRY_STATUSES if idempotent else THROTTLED_STATUSES) or (
+        status == 403 and gcal_error_reasons(error) & GCAL_RATE_LIMIT_REASONS
+    ):
+        return parse_retry_after(error.resp.get("retry-after"))
+    return None
+
+
+def gcal_idempotent(request: HttpRequest) -> bool:
+    """Check whether a GCal request can safely be sent twice.
+
+    Inserting, importing and quick adding create a new event each time they are
+    sent, so they aren't idempotent.
+    """
+    return not gcal_endpoint(request).endswith((".insert", ".import", ".quickAdd"))
+
+
+def gcal_error_reasons(error: HttpError) -> set[str]:
+    """Get the reasons given in the body of a GCal error response."""
+    try:
+        content = json.loads(error.content)
+        return {e.get("reason") for e in content["error"].get("errors", [])}
+    except (ValueError, KeyError, TypeError, AttributeError):
+        return set()
+
+
+def parse_retry_after(value: Optional[str]) -> float:
+    """Parse a ``Retry-After`` header in seconds, treating anything else as 0."""
+    try:
+        return max(0.0, float(value))  # type: ignore
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def call_with_retry(
+    function: Callable[[], T],
+    limiter: Optional[RateLimiter],
+    retry_after: Callable[[Exception], Optional[float]],
+    max_retries: int = MAX_RETRIES,
+    sleep: Callable[[float], None] = time.sleep,
+    api: Optional[str] = None,
+    endpoint: str = "",
+) -> T:
+    """Call `function` within a rate limit, retrying it if it is throttled.
+
+    Args:
+        function: Sends the request
+        limiter: The rate limiter for the API (None for no limit)
+        retry_after: Checks whether an error is worth retrying, and how long the API
+            asked to wait, e.g. `notion_retry_after`
+        max_retries: How many times to retry before giving up and raising the error
+        sleep: Waits for a number of seconds
+        api: If given, each attempt is counted and timed in `ncal.metrics`, under
+            this API and `endpoint`
+
+    Returns:
+        Whatever `function` returns
+    """
+    attempt = 0
+    while True:
+        if limiter is not None:
+            limiter.acquire()
+        start = time.perf_counter()
+        try:
+            result = function()
+        except Exception as e:
+            if api is not None:
+                record_request(api, endpoint, "error", time.perf_counter() - start)
+            wait = retry_after(e)
+            if wait is None or attempt >= max_retries:
+                raise
+            if api is not None:
+                metrics.API_RETRIES.inc(api=api, endpoint=endpoint)
+            if limiter is not None:
+                limiter.throttled()
+            delay = max(wait, backoff_delay(attempt))
+            logging.warning(f"Retrying in {delay:.1f}s after: {e}")
+            sleep(delay)
+            attempt += 1
+        else:
+            if api is not None:
+                record_request(api, endpoint, "ok", time.perf_counter() - start)
+            if limiter is not None:
+                limiter.succeeded()
+            return result
+
+
+def record_request(
+    api: str, endpoint: str, outcome: str, seconds: Optional[float] = None
+) -> None:
+    """Count a request in `ncal.metrics`, and time it if `seconds` is given."""
+    metrics.API_REQUESTS.inc(api=api, endpoint=endpoint, outcome=outcome)
+    if seconds is not None:
+        metrics.API_SECONDS.observe(seconds, api=api, endpoint=endpoint)
+
+
+def gcal_endpoint(request: HttpRequest) -> str:
+    """Name the GCal endpoint of a request, e.g. ``calendar.events.insert``."""
+    return getattr(request, "methodId", None) or "unknown"
+
+
+class RateLimitedNotionClient(nc.Client):
+    """A Notion client which keeps to a rate limit, and retries throttled requests.
+
+    Attributes:
+        limiter: Shared by every request made by the client
+        max_retries: How many times a request is retried
+    """
+
+    def __init__(
+        self,
+        limiter: Optional[RateLimiter] = None,
+        max_retries: int = MAX_RETRIES,
+        **options: Any,
+    ) -> None:
+        """Make the client, passing `options` on to `notion_client.Client`."""
+        super().__init__(**options)
+        self.limiter = (
+            limiter if limiter is not None else RateLimiter(NOTION_REQUESTS_PER_SECOND)
+        )
+        self.max_retries = max_retries
+
+    def request(self, path: str, method: str, *args: Any, **kwargs: Any) -> Any:
+        """Send an HTTP request."""
+        return call_with_retry(
+            lambda: super(RateLimitedNotionClient, self).request(
+                path, method, *args, **kwargs
+            ),
+            self.limiter,
+            functools.partial(
+                notion_retry_after, idempotent=notion_idempotent(method, path)
+            ),
+            self.max_retries,
+            api="notion",
+            endpoint=metrics.notion_endpoint(method, path),
+        )
+
+
+class RateLimitedHttpRequest(HttpRequest):
+    """A GCal request which keeps to a rate limit, and is retried if throttled.
+
+    Requests sent as part of a batch are not sent by `execute`, so they are
+    limited by `ncal.gcal_batch.EventBatch` instead.
+    """
+
+    limiter: Optional[RateLimiter] = None
+    max_retries: int = MAX_RETRIES
+
+    def execute(self, *args: Any, **kwargs: Any) -> Any:
+        """Send the request."""
+        return call_with_retry(
+            lambda: super(RateLimitedHttpRequest, self).execute(*args, **kwargs),
+            self.limiter,
+            functools.partial(gcal_retry_after, idempotent=gcal_idempotent(self)),
+            self.max_retries,
+            api="gcal",
+            endpoint=gcal_endpoint(self),
+        )
@@ -0,0 +1,448 @@
+"""Run sync passes: once, on a schedule, or as changes are pushed.
+
+These are what the `ncal` commands (see `ncal.cli`) run.
+"""
+import asyncio
+import datetime
+import time
+from typing import AsyncContextManager, Callable, Coroutine, Optional, TypeVar
+
+import arrow
+import notion_client as nc  # type: ignore
+import typer
+from googleapiclient.discovery import Resource  # type: ignore
+
+from ncal import metrics, phases
+from ncal.config import Settings
+from ncal.gcal_push import ChannelManager, NotificationReceiver
+from ncal.notion_webhook import DropDirectory, NotionWebhookReceiver
+from ncal.profiling import PhaseProfiler
+from ncal.scheduler import Scheduler
+from ncal.sharding import ShardedSync
+from ncal.snapshot import SnapshotCache, SyncSnapshot
+from ncal.state import StateStore, SyncTokenStore
+
+T = TypeVar("T")
+
+
+async def scheduler(
+    timedelta: datetime.timedelta, function: Callable[..., Coroutine], f_args: dict
+) -> None:
+    """Schedule an async function.
+
+    For more control over the schedule, use `ncal.scheduler.Scheduler`.
+
+    Args:
+        timedelta:
+        function:
+        f_args: arguments to pass to the function
+    """
+    await Scheduler(timedelta.total_seconds()).run(function, **f_args)
+
+
+async def sync(
+    settings: Settings,
+    service: Resource,
+    notion: nc.Client,
+    sync_tokens: Optional[SyncTokenStore] = None,
+    state_store: Optional[StateStore] = None,
+    snapshots: Optional[SnapshotCache] = None,
+    shards: Optional[ShardedSync] = None,
+    profiler: Optional[PhaseProfiler] = None,
+) -> int:
+    """Sync between Google Calendar and Notion.
+
+    Each phase runs in a worker thread, so the event loop isn't blocked while the
+    phase waits on the APIs. If `shards` is given, the phases are run by its worker
+    processes instead, split up by calendar. The pass and its phases are measured
+    in `ncal.metrics`.
+
+    Args:
+        settings: Configuration settings
+        service: A Google Calendar API Client
+        notion: A Notion API Client
+        sync_tokens: GCal sync tokens, used to only fetch changed events
+        state_store: What was last synced, used to skip unchanged pages and events
+        snapshots: Keeps the database between syncs, so that only the pages edited
+            since the last sync are fetched
+        shards: Worker processes to split the sync across
+        profiler: Profiles the fetch of the database and each phase, and reports
+            on them at the end of the pass
+
+    Returns:
+        The number of pages and events that were changed
+    """
+    start = time.perf_counter()
+    steps = phases.enabled(tuple(phases.PHASES), settings)
+
+    def profiled(name: str, function: Callable[..., T]) -> Callable[..., T]:
+        return profiler.wrap(name, function) if profiler is not None else function
+
+    with typer.progressbar(
+        range(len(steps)), label="Synchronising", show_eta=False, show_pos=True
+    ) as progress:
+        # one query of the database, shared by all of the phases
+        snapshot = await asyncio.to_thread(
+            profiled(
+                "fetch", snapshots.get if snapshots is not None else SyncSnapshot.fetch
+            ),
+            notion,
+            settings,
+        )
+        if shards is not None:
+            progress.label = f"{shards.processes} shards"
+            changes = await asyncio.to_thread(shards.run, snapshot, sync_tokens)
+            progress.update(len(steps))
+            typer.echo(f"Synchronised at UTC {arrow.utcnow()}")
+            metrics.SYNC_SECONDS.observe(time.perf_counter() - start)
+            return changes
+
+        changes = 0
+        for name in steps:
+            progress.label = name
+            changes += await asyncio.to_thread(
+                profiled(name, phases.run),
+                name,
+                settings,
+                service,
+                notion,
+                snapshot=snapshot,
+                state_store=state_store,
+                sync_tokens=sync_tokens,
+            )
+            progress.update(1)
+
+        progress.label = "Synchronised"
+        typer.echo(f"Synchronised at UTC {arrow.utcnow()}")
+    if profiler is not None:
+        typer.echo(profiler.report())
+    metrics.SYNC_SECONDS.observe(time.perf_counter() - start)
+    return changes
+
+
+async def sync_calendars(
+    settings: Settings,
+    service: Resource,
+    notion: nc.Client,
+    calendar_ids: set[str],
+    sync_tokens: Optional[SyncTokenStore] = None,
+    state_store: Optional[StateStore] = None,
+    snapshots: Optional[SnapshotCache] = None,
+) -> int:
+    """Bring the changes made to some calendars back to Notion.
+
+    Only the GCal -> Notion phases are run, and only for the given calendars: just
+    their events are listed, and the pages on the other calendars aren't looked up
+    (see `ncal.core.existing_events_gcal_to_notion`).
+
+    Args:
+        settings: Configuration settings
+        service: A Google Calendar API Client
+        notion: A Notion API Client
+        calendar_ids: The GCal calendar ids to sync
+        sync_tokens: GCal sync tokens, used to only fetch changed events
+        state_store: What was last synced, used to skip unchanged pages and events
+        snapshots: Keeps the database between syncs, so that only the pages edited
+            since the last sync are fetched
+
+    Returns:
+        The number of pages that were changed
+    """
+    calendar_dictionary = {
+        name: calendar_id
+        for name, calendar_id in settings.calendar_dictionary.items()
+        if calendar_id in calendar_ids
+    }
+    snapshot = await asyncio.to_thread(
+        snapshots.get if snapshots is not None else SyncSnapshot.fetch,
+        notion,
+        settings,
+    )
+
+    calendar_settings = settings.copy(
+        update={"calendar_dictionary": calendar_dictionary}
+    )
+
+    changes = 0
+    for name in phases.GCAL_TO_NOTION:
+        changes += await asyncio.to_thread(
+            phases.run,
+            name,
+            calendar_settings,
+            service,
+            notion,
+            snapshot=snapshot,
+            state_store=state_store,
+            sync_tokens=sync_tokens,
+        )
+    typer.echo(f"Synchronised {', '.join(calendar_dictionary)} at UTC {arrow.utcnow()}")
+    return changes
+
+
+async def collect_changes(changed: asyncio.Queue, timeout: Optional[float]) -> set:
+    """Wait for a change, then gather up any others that arrive soon after it.
+
+    Args:
+        changed: A queue of changed things, e.g. calendar or page ids
+        timeout: The longest to wait for the first change, in seconds
+
+    Raises:
+        asyncio.TimeoutError: If there were no changes within the timeout
+    """
+    changes = {await asyncio.wait_for(changed.get(), timeout)}
+    # the same change is often notified several times
+    await asyncio.sleep(1)
+    while not changed.empty():
+        changes.add(changed.get_nowait())
+    return changes
+
+
+async def push_sync(
+    settings: Settings,
+    service: Resource,
+    notion: nc.Client,
+    lock: AsyncContextManager,
+    sync_tokens: Optional[SyncTokenStore] = None,
+    state_store: Optional[StateStore] = None,
+    snapshots: Optional[SnapshotCache] = None,
+    renewal_interval: float = 15 * 60,
+) -> None:
+    """Sync each calendar when GCal notifies that it has changed, until cancelled.
+
+    Serves a `NotificationReceiver` on `settings.push_port`, and watches every
+    calendar, renewing the channels before they expire.
+
+    Args:
+        settings: Configuration settings, with a `push_address`
+        service: A Google Calendar API Client
+        notion: A Notion API Client
+        lock: Held while syncing, so that syncs don't overlap
+        sync_tokens: GCal sync tokens, used to only fetch changed events
+        state_store: What was last synced, used to skip unchanged pages and events
+        snapshots: Keeps the database between syncs
+        renewal_interval: Seconds between checks for channels that need renewing
+    """
+    loop = asyncio.get_running_loop()
+    changed: asyncio.Queue[str] = asyncio.Queue()
+    channels = ChannelManager(service, str(settings.push_address), settings.push_token)
+
+    def notify(calendar_id: str) -> None:
+        # called from the receiver's threads
+        loop.call_soon_threadsafe(changed.put_nowait, calendar_id)
+
+    receiver = NotificationReceiver(channels, notify, port=settings.push_port)
+    receiver.start()
+    try:
+        await asyncio.to_thread(
+            channels.watch_all, set(settings.calendar_dictionary.values())
+        )
+        next_renewal = loop.time() + renewal_interval
+        while True:
+            try:
+                calendar_ids = await collect_changes(
+                    changed, max(0, next_renewal - loop.time())
+                )
+                async with lock:
+                    await sync_calendars(
+                        settings,
+                        service,
+                        notion,
+                        calendar_ids,
+                        sync_tokens,
+                        state_store,
+                        snapshots,
+                    )
+            except asyncio.TimeoutError:
+                pass
+            if loop.time() >= next_renewal:
+                await asyncio.to_thread(channels.renew_expiring)
+                next_renewal = loop.time() + renewal_interval
+    finally:
+        receiver.stop()
+        await asyncio.to_thread(channels.stop_all)
+
+
+async def sync_pages(
+    settings: Settings,
+    service: Resource,
+    notion: nc.Client,
+    page_ids: set[str],
+    state_store: Optional[StateStore] = None,
+) -> int:
+    """Bring the changes made to some Notion pages over to GCal.
+
+    Only the Notion -> GCal phases are run, and only for the given pages.
+
+    Args:
+        settings: Configuration settings
+        service: A Google Calendar API Client
+        notion: A Notion API Client
+        page_ids: The Notion page ids to sync
+        state_store: What was last synced, used to skip unchanged pages and events
+
+    Returns:
+        The number of events that were changed
+    """
+    snapshot = await asyncio.to_thread(
+        SyncSnapshot.fetch_pages, notion, settings, page_ids
+    )
+
+    changes = 0
+    for name in phases.enabled(phases.NOTION_TO_GCAL, settings):
+        changes += await asyncio.to_thread(
+            phases.run,
+            name,
+            settings,
+            service,
+            notion,
+            snapshot=snapshot,
+            state_store=state_store,
+        )
+    typer.echo(f"Synchronised {len(snapshot.pages)} pages at UTC {arrow.utcnow()}")
+    return changes
+
+
+async def notion_event_sync(
+    settings: Settings,
+    service: Resource,
+    notion: nc.Client,
+    lock: AsyncContextManager,
+    state_store: Optional[StateStore] = None,
+    drop_interval: float = 1,
+) -> None:
+    """Sync Notion pages as change events arrive for them, until cancelled.
+
+    Events are received by a `NotionWebhookReceiver` on
+    `settings.notion_webhook_port`, and/or read from the files dropped into
+    `settings.notion_drop_directory`.
+
+    Args:
+        settings: Configuration settings
+        service: A Google Calendar API Client
+        notion: A Notion API Client
+        lock: Held while syncing, so that syncs don't overlap
+        state_store: What was last synced, used to skip unchanged pages and events
+        drop_interval: Seconds between checks of the drop directory
+    """
+    loop = asyncio.get_running_loop()
+    changed: asyncio.Queue[str] = asyncio.Queue()
+
+    def notify(page_ids: list[str]) -> None:
+        # called from the receiver's threads
+        for page_id in page_ids:
+            loop.call_soon_threadsafe(changed.put_nowait, page_id)
+
+    receiver = None
+    if settings.notion_webhook_port is not None:
+        receiver = NotionWebhookReceiver(
+            notify,
+            secret=settings.notion_webhook_secret,
+            database_id=settings.database_id,
+            port=settings.notion_webhook_port,
+        )
+        receiver.start()
+    drop_directory = None
+    if settings.notion_drop_directory is not None:
+        drop_directory = DropDirectory(
+            settings.notion_drop_directory, settings.database_id
+        )
+    try:
+        while True:
+            if drop_directory is not None:
+                for page_id in await asyncio.to_thread(drop_directory.drain):
+                    changed.put_nowait(page_id)
+            try:
+                page_ids = await collect_changes(
+                    changed, drop_interval if drop_directory is not None else None
+                )
+            except asyncio.TimeoutError:
+                continue
+            async with lock:
+                await sync_pages(settings, service, notion, page_ids, state_store)
+    finally:
+        if receiver is not None:
+            receiver.stop()
+
+
+async def continuous_sync(
+    interval: datetime.timedelta,
+    settings: Settings,
+    service: Resource,
+    notion: nc.Client,
+    sync_tokens: Optional[SyncTokenStore] = None,
+    state_store: Optional[StateStore] = None,
+    lock: Optional[AsyncContextManager] = None,
+    shards: Optional[ShardedSync] = None,
+    profiler: Optional[PhaseProfiler] = None,
+):
+    """Call sync continuously.
+
+    The schedule is set by the `sync_overlap`, `sync_jitter` and `max_sync_interval`
+    settings. If `push_address` is set, calendars are also synced as soon as GCal
+    notifies that they have changed (see `push_sync`). Likewise, if Notion change
+    events are set up, pages are synced as soon as they change (see
+    `notion_event_sync`). Either way, the full sync becomes a safety net that runs at
+    most every `push_poll_interval` seconds.
+
+    Args:
+        interval (datetime.timedelta):
+        settings (Settings):
+        service (Resource):
+        notion (nc.Client):
+        sync_tokens (Optional[SyncTokenStore]):
+        state_store (Optional[StateStore]):
+        lock (Optional[AsyncContextManager]): Held while syncing, so that syncs
+            don't overlap (a new lock if not given)
+        shards (Optional[ShardedSync]): Worker processes to split full syncs across
+        profiler (Optional[PhaseProfiler]): Profiles the phases of each full sync
+    """
+    notion_events = (
+        settings.notion_webhook_port is not None
+        or settings.notion_drop_directory is not None
+    )
+    if settings.push_address is not None or notion_events:
+        interval = max(
+            interval, datetime.timedelta(seconds=settings.push_poll_interval)
+        )
+    schedule = Scheduler(
+        interval.total_seconds(),
+        overlap=settings.sync_overlap,
+        jitter=settings.sync_jitter,
+        max_interval=settings.max_sync_interval,
+    )
+    sync_lock = lock if lock is not None else asyncio.Lock()
+
+    snapshots = SnapshotCache(settings.full_query_interval)
+
+    async def full_sync() -> int:
+        async with sync_lock:
+            return await sync(
+                settings,
+                service,
+                notion,
+                sync_tokens,
+                state_store,
+                snapshots,
+                shards,
+                profiler,
+            )
+
+    schedule.adapt(await full_sync())
+    tasks = [schedule.run(full_sync)]
+    if settings.push_address is not None:
+        tasks.append(
+            push_sync(
+                settings,
+                service,
+                notion,
+                sync_lock,
+                sync_tokens,
+                state_store,
+                snapshots,
+            )
+        )
+    if notion_events:
+        tasks.append(
+            notion_event_sync(settings, service, notion, sync_lock, state_store)
+        )
+    await asyncio.gather(*tasks)
@@ -0,0 +1,123 @@
+"""Run a sync pass repeatedly, on a schedule."""
+import asyncio
+import logging
+import random
+import time
+from typing import Any, Callable, Coroutine, Literal, Optional
+
+from ncal import metrics
+
+OverlapPolicy = Literal["skip", "queue", "coalesce"]
+
+
+class Scheduler:
+    """Call an async function at a fixed (or adaptive) interval.
+
+    Runs are due on a grid of deadlines, one `interval` apart, and the scheduler
+    sleeps until the next one rather than polling, so the schedule doesn't drift.
+    If a run is still going when later deadlines pass, `overlap` decides what
+    happens to them:
+
+    - ``"skip"``: they are dropped, and the next run waits for the next deadline
+    - ``"queue"``: there is one run for each of them, back to back
+    - ``"coalesce"``: there is a single run for all of them, straight away
+
+    Runs which take longer than the interval are counted as overruns in
+    `ncal.metrics`.
+
+    If `max_interval` is given, the interval adapts to how busy the syncs are. The
+    function should return how many changes it made (as `ncal.runner.sync` does). After
+    a run without changes, the interval doubles, up to `max_interval`. After a run
+    with changes, it goes back to `interval`. A result of None leaves it as it is.
+
+    Attributes:
+        interval: Seconds between runs, when there are changes
+        overlap: What to do about deadlines missed while a run was going
+        jitter: Up to this many seconds are added at random to each sleep, so that
+            several instances don't all hit the APIs at the same moment
+        max_interval: The longest the interval can grow to
+        current_interval: The interval being used now
+    """
+
+    def __init__(
+        self,
+        interval: float,
+        overlap: OverlapPolicy = "skip",
+        jitter: float = 0,
+        max_interval: Optional[float] = None,
+        clock: Callable[[], float] = time.monotonic,
+        rng: Callable[[float, float], float] = random.uniform,
+    ) -> None:
+        """Set up the schedule."""
+        if interval <= 0:
+            raise ValueError("interval must be positive")
+        if overlap not in ("skip", "queue", "coalesce"):
+            raise ValueError(f"Unknown overlap policy: {overlap}")
+        self.interval = interval
+        self.overlap = overlap
+        self.jitter = jitter
+        self.max_interval = max(interval, max_interval or interval)
+        self.current_interval = interval
+        self._clock = clock
+        self._rng = rng
+
+    def adapt(self, changes: Optional[int]) -> None:
+        """Change `current_interval` based on the number of changes in a run."""
+        if changes is None:
+            return
+        if changes > 0:
+            self.current_interval = self.interval
+        else:
+            self.current_interval = min(self.max_interval, self.current_interval * 2)
+
+    def next_deadline(self, deadline: float, now: float) -> float:
+        """Work out when the next run is due, after the run due at `deadline`.
+
+        Args:
+            deadline: When the run that has just finished was due
+            now: When the run finished
+        """
+        deadline += self.current_interval
+        if deadline > now or self.overlap == "queue":
+            return deadline
+        # deadlines were missed: move to the last of them, or past it
+        missed = int((now - deadline) // self.current_interval)
+        deadline += missed * self.current_interval
+        if self.overlap == "coalesce":
+            return deadline
+        return deadline + self.current_interval
+
+    async def run(
+        self,
+        function: Callable[..., Coroutine],
+        *args: Any,
+        max_runs: Optional[int] = None,
+        **kwargs: Any,
+    ) -> None:
+        """Call ``function(*args, **kwargs)`` on the schedule.
+
+        Args:
+            function: The async function to call
+            max_runs: Stop after this many runs (None to run forever)
+        """
+        runs = 0
+        deadline = self._clock() + self.current_interval
+        while max_runs is None or runs < max_runs:
+            delay = deadline - self._clock()
+            if delay > 0:
+                if self.jitter:
+                    delay += self._rng(0, self.jitter)
+                logging.info(f"next run in {delay:.1f}s")
+                await asyncio.sleep(delay)
+            started = self._clock()
+            changes = await function(*args, **kwargs)
+            runs += 1
+            took = self._clock() - started
+            if took > self.current_interval:
+                logging.warning(
+                    f"run took {took:.1f}s, longer than the {self.current_interval}s "
+                    "interval"
+                )
+                metrics.SYNC_OVERRUNS.inc()
+            self.adapt(changes)
+            deadline = self.next_deadline(deadline, self._clock())
@@ -0,0 +1,337 @@
+"""Split the syncs of very large databases across processes, by calendar.
+
+Most of a sync is spent waiting on the APIs, but with tens of thousands of pages
+the work in between (decoding responses, parsing dates and building events) keeps
+a core busy. With the `sync_processes` setting, `ShardedSync` runs each pass in
+several worker processes instead:
+
+- The database is still fetched once, by the main process.
+- The calendars are split into shards, balanced by how many pages each has.
+- Each worker syncs one shard, with its own API clients. It sends the shard's
+  pages to GCal, and brings the events on the shard's calendars back to Notion.
+- The change counts and GCal sync tokens from each worker are merged back
+  together.
+
+The workers share the rate limits out between them, and write to the same state
+database. Each of them commits its changes to it as it makes them, so that none
+holds the database locked while it waits on the APIs.
+"""
+import datetime
+import logging
+import multiprocessing
+from concurrent.futures import Future, ProcessPoolExecutor
+from dataclasses import dataclass, field
+from typing import Optional
+
+import notion_client as nc  # type: ignore
+from googleapiclient.discovery import Resource  # type: ignore
+
+from ncal import core, metrics, phases
+from ncal.config import Settings
+from ncal.model import SyncPage
+from ncal.snapshot import SyncSnapshot
+from ncal.state import StateStore, SyncTokenStore
+
+# how long a worker waits for the others to finish writing to the state database
+STATE_TIMEOUT = 10 * 60
+
+
+def page_calendar_id(page: SyncPage, settings: Settings) -> str:
+    """Get the id of the calendar that a page's event belongs on.
+
+    Pages without a (known) calendar go on the default calendar.
+    """
+    name = page.calendar_name or settings.default_calendar_name
+    return settings.calendar_dictionary.get(
+        name, settings.calendar_dictionary[settings.default_calendar_name]
+    )
+
+
+def partition_calendars(
+    pages: list[SyncPage], settings: Settings, shards: int
+) -> list[set[str]]:
+    """Split the calendars into shards with about the same number of pages.
+
+    ```python
+    >>> settings = Settings(
+    ...     notion_api_token="a",
+    ...     database_id="b",
+    ...     url_root="c",
+    ...     default_calendar_name="Work",
+    ...     calendar_dictionary={"Work": "w", "Home": "h", "Gym": "g"},
+    ... )
+    >>> pages = [
+    ...     SyncPage(str(i), calendar_name=name)
+    ...     for i, name in enumerate(["Work", "Work", "Home", "Gym"])
+    ... ]
+    >>> [sorted(shard) for shard in partition_calendars(pages, settings, 2)]
+    [['w'], ['g', 'h']]
+
+    ```
+
+    Args:
+        pages: Every page in the database
+        settings: Configuration settings
+        shards: The most shards to make
+
+    Returns:
+        The calendar ids in each shard (every calendar is in exactly one)
+    """
+    counts = {calendar_id: 0 for calendar_id in settings.calendar_dictionary.values()}
+    for page in pages:
+        counts[page_calendar_id(page, settings)] += 1
+    partition: list[set[str]] = [set() for _ in range(min(shards, len(counts)))]
+    loads = [0] * len(partition)
+    # the busiest calendars first, each to the least loaded shard
+    for calendar_id in sorted(counts, key=counts.__getitem__, reverse=True):
+        shard = loads.index(min(loads))
+        partition[shard].add(calendar_id)
+        loads[shard] += counts[calendar_id]
+    return partition
+
+
+@dataclass
+class ShardResult:
+    """What a worker did when it synced a shard.
+
+    Attributes:
+        calendar_ids: The calendars in the shard
+        changes: The number of pages and events changed by each phase
+        sync_tokens: The shard's GCal sync tokens, by calendar id
+    """
+
+    calendar_ids: set[str]
+    changes: dict[str, int] = field(default_factory=dict)
+    sync_tokens: dict[str, str] = field(default_factory=dict)
+
+
+@dataclass
+class _Worker:
+    settings: Settings
+    service: Resource
+    notion: nc.Client
+    state_store: StateStore
+
+
+# set up in each worker process by `_start_worker`
+_worker: Optional[_Worker] = None
+
+
+def _start_worker(settings: Settings) -> None:
+    """Set up the API clients and state store of a worker process."""
+    global _worker
+    service, _, notion = core.setup_api_connections(
+        default_calendar_id=settings.default_calendar_id,
+        credentials_location=settings.credentials_location,
+        notion_api_token=settings.notion_api_token,
+        client_secret_location=settings.client_secret_location,
+        notion_requests_per_second=settings.notion_requests_per_second,
+        gcal_requests_per_second=settings.gcal_requests_per_second,
+        max_retries=settings.max_retries,
+        discovery_cache_location=settings.discovery_cache_location,
+        notion_api_url=settings.notion_api_url,
+        gcal_api_url=settings.gcal_api_url,
+    )
+    state_store = StateStore(
+        settings.state_location, timeout=STATE_TIMEOUT, autocommit=True
+    )
+    _worker = _Worker(settings, service, notion, state_store)
+
+
+def sync_shard(
+    pages: list[SyncPage],
+    calendar_ids: set[str],
+    sync_tokens: dict[str, str],
+    settings: Settings,
+    service: Resource,
+    notion: nc.Client,
+    state_store: Optional[StateStore] = None,
+) -> ShardResult:
+    """Sync one shard of the database.
+
+    The Notion -> GCal phases only see the shard's pages. The GCal -> Notion phases
+    only look at the shard's calendars, but see every page, so that events which
+    have been moved between calendars are still matched up with their pages. Only
+    the events of pages last seen on the shard's calendars are looked up one by
+    one, when they aren't found by the list of the calendars' events (see
+    `ncal.core.existing_events_gcal_to_notion`), so the shards don't repeat each
+    other's lookups.
+
+    Args:
+        pages: Every page in the database
+        calendar_ids: The calendars in the shard
+        sync_tokens: The GCal sync tokens of the shard's calendars
+        settings: Configuration settings
+        service: A Google Calendar API Client
+        notion: A Notion API Client
+        state_store: What was last synced
+
+    Returns:
+        What was changed, and the new sync tokens
+    """
+    shard_pages = [p for p in pages if page_calendar_id(p, settings) in calendar_ids]
+    # both snapshots share the page objects, so the later phases see the changes
+    snapshot = SyncSnapshot(shard_pages, settings)
+    calendar_settings = settings.copy(
+        update={
+            "calendar_dictionary": {
+                name: calendar_id
+                for name, calendar_id in settings.calendar_dictionary.items()
+                if calendar_id in calendar_ids
+            }
+        }
+    )
+    calendar_snapshot = SyncSnapshot(pages, calendar_settings)
+    tokens = SyncTokenStore(None)
+    for calendar_id, token in sync_tokens.items():
+        tokens.set(calendar_id, token)
+    result = ShardResult(calendar_ids)
+
+    for name in phases.enabled(tuple(phases.PHASES), settings):
+        # the GCal -> Notion phases only look at the shard's calendars
+        if name in phases.GCAL_TO_NOTION:
+            result.changes[name] = phases.PHASES[name](
+                calendar_settings,
+                service,
+                notion,
+                snapshot=calendar_snapshot,
+                state_store=state_store,
+                sync_tokens=tokens,
+            )
+        else:
+            result.changes[name] = phases.PHASES[name](
+                settings, service, notion, snapshot=snapshot, state_store=state_store
+            )
+    result.sync_tokens = tokens.tokens()
+    return result
+
+
+def _sync_shard_in_worker(
+    pages: list[SyncPage], calendar_ids: set[str], sync_tokens: dict[str, str]
+) -> ShardResult:
+    assert _worker is not None, "the worker process hasn't been set up"
+    return sync_shard(
+        pages,
+        calendar_ids,
+        sync_tokens,
+        _worker.settings,
+        _worker.service,
+        _worker.notion,
+        _worker.state_store,
+    )
+
+
+class ShardedSync:
+    """A pool of worker processes that each sync pass is split across.
+
+    The workers are started by the first pass, and kept for the passes after it.
+
+    Attributes:
+        settings: Configuration settings
+        processes: The number of worker processes
+    """
+
+    def __init__(self, settings: Settings, processes: Optional[int] = None) -> None:
+        """Set up the pool, without starting any workers.
+
+        Args:
+            settings: Configuration settings
+            processes: The number of workers (`settings.sync_processes` by default)
+        """
+        self.settings = settings
+        self.processes = processes if processes is not None else settings.sync_processes
+        if self.processes < 1:
+            raise ValueError("processes must be at least 1")
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    def _worker_settings(self) -> Settings:
+        # the workers share the rate limits between them
+        return self.settings.copy(
+            update={
+                "notion_requests_per_second": self.settings.notion_requests_per_second
+                / self.processes,
+                "gcal_requests_per_second": self.settings.gcal_requests_per_second
+                / self.processes,
+            }
+        )
+
+    def _start(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # spawned rather than forked, as the main process has threads running
+            self._executor = ProcessPoolExecutor(
+                self.processes,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_start_worker,
+                initargs=(self._worker_settings(),),
+            )
+        return self._executor
+
+    def run(
+        self, snapshot: SyncSnapshot, sync_tokens: Optional[SyncTokenStore] = None
+    ) -> int:
+        """Sync every shard, each in a worker process.
+
+        Args:
+            snapshot: The whole database
+            sync_tokens: GCal sync tokens, updated with the workers' new tokens and
+                saved
+
+        Returns:
+            The number of pages and events that were changed
+
+        Raises:
+            Exception: The first error from a worker, once the others have finished
+        """
+        started = datetime.datetime.now()
+        executor = self._start()
+        futures: list[Future[ShardResult]] = []
+        for calendar_ids in partition_calendars(
+            snapshot.pages, self.settings, self.processes
+        ):
+            tokens = {}
+            if sync_tokens is not None:
+                for calendar_id in calendar_ids:
+                    token = sync_tokens.get(calendar_id)
+                    if token is not None:
+                        tokens[calendar_id] = token
+            futures.append(
+                executor.submit(
+                    _sync_shard_in_worker, snapshot.pages, calendar_ids, tokens
+                )
+            )
+
+        changes = 0
+        error: Optional[BaseException] = None
+        for future in futures:
+            try:
+                result = future.result()
+            except Exception as e:
+                logging.error(f"A sync shard failed: {e}")
+                error = error or e
+                continue
+            logging.info(
+                f"Synced shard {sorted(result.calendar_ids)}: {result.changes}"
+            )
+            changes += sum(result.changes.values())
+            for name, phase_changes in result.changes.items():
+                metrics.PHASE_CHANGES.inc(phase_changes, phase=name)
+            if sync_tokens is not None:
+                for calendar_id in result.calendar_ids:
+                    if calendar_id in result.sync_tokens:
+                        sync_tokens.set(calendar_id, result.sync_tokens[calendar_id])
+                    else:
+                        sync_tokens.drop(calendar_id)
+        if sync_tokens is not None:
+            sync_tokens.save()
+        if error is not None:
+            raise error
+        logging.info(
+            f"Synced {len(futures)} shards in {datetime.datetime.now() - started}"
+        )
+        return changes
+
+    def close(self) -> None:
+        """Stop the worker processes."""
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
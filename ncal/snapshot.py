@@ -0,0 +1,234 @@
+"""A single fetch of the Notion database, shared by every phase of a sync pass."""
+import datetime
+import logging
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Iterable, Optional
+
+import arrow
+import notion_client as nc  # type: ignore
+
+from ncal import config, dates, engine, model
+
+
+def latest_edit(pages: Iterable[model.SyncPage]) -> Optional[str]:
+    """Get the latest ``last_edited_time`` of some pages (None if there are none)."""
+    return max(
+        (page.last_edited_time for page in pages if page.last_edited_time),
+        default=None,
+    )
+
+
+@dataclass
+class SyncSnapshot:
+    """Every page in the database, partitioned in memory for each sync phase.
+
+    Only the pages in the sync window (see `ncal.config.sync_window`) are in the
+    partitions, though `gcal_event_ids` covers every page.
+
+    The partitions are worked out when they are asked for, so changes that one phase
+    makes to the pages (see `ncal.core.update_page`) are seen by the later phases.
+
+    The pages are decoded into `ncal.model.SyncPage`s as they are fetched, and the
+    raw responses are dropped.
+
+    Attributes:
+        pages: All of the pages in the database
+        settings: Configuration settings
+        high_water_mark: The latest ``last_edited_time`` of the pages, which `refresh`
+            fetches the pages edited since
+    """
+
+    pages: list[model.SyncPage]
+    settings: config.Settings
+    high_water_mark: Optional[str] = None
+
+    def __post_init__(self) -> None:
+        """Work out the high water mark, if it wasn't given."""
+        if self.high_water_mark is None:
+            self.high_water_mark = latest_edit(self.pages)
+
+    @classmethod
+    def fetch(cls, notion: nc.Client, settings: config.Settings) -> "SyncSnapshot":
+        """Query the whole database once."""
+        # imported here to avoid a circular import
+        from ncal.core import iter_database_query
+
+        decoder = model.PageDecoder.from_settings(settings)
+        return cls(
+            [
+                decoder.decode(page)
+                for page in iter_database_query(notion, settings.database_id)
+            ],
+            settings,
+        )
+
+    def refresh(self, notion: nc.Client) -> int:
+        """Bring the pages up to date, fetching only those edited since the last fetch.
+
+        Notion only gives ``last_edited_time`` to the minute, so the pages edited
+        in the same minute as the high water mark are fetched again. Pages which
+        have been deleted are not noticed, so a full `fetch` is still needed now
+        and then (see `SnapshotCache`).
+
+        Returns:
+            The number of pages fetched
+        """
+        if self.high_water_mark is None:
+            self.pages = SyncSnapshot.fetch(notion, self.settings).pages
+            self.high_water_mark = latest_edit(self.pages)
+            return len(self.pages)
+        from ncal.core import iter_database_query
+
+        decoder = model.PageDecoder.from_settings(self.settings)
+        edited = [
+            decoder.decode(page)
+            for page in iter_database_query(
+                notion,
+                self.settings.database_id,
+                filter={
+                    "timestamp": "last_edited_time",
+                    "last_edited_time": {"on_or_after": self.high_water_mark},
+                },
+                sorts=[{"timestamp": "last_edited_time", "direction": "ascending"}],
+            )
+        ]
+        pages = {page.id: page for page in self.pages}
+        pages.update((page.id, page) for page in edited)
+        self.pages = list(pages.values())
+        self.high_water_mark = latest_edit(edited) or self.high_water_mark
+        logging.info(f"Fetched {len(edited)} pages edited since {self.high_water_mark}")
+        return len(edited)
+
+    @classmethod
+    def fetch_pages(
+        cls, notion: nc.Client, settings: config.Settings, page_ids: Iterable[str]
+    ) -> "SyncSnapshot":
+        """Retrieve just some pages, e.g. the ones that a Notion webhook said changed.
+
+        Pages which have been archived, can't be found, or aren't in the database are
+        left out.
+        """
+        database_id = settings.database_id.replace("-", "")
+        decoder = model.PageDecoder.from_settings(settings)
+
+        def retrieve(page_id: str) -> Optional[model.SyncPage]:
+            try:
+                page: dict[str, Any] = notion.pages.retrieve(page_id)  # type: ignore
+            except nc.APIResponseError as e:
+                logging.warning(f"Couldn't retrieve page {page_id}: {e}")
+                return None
+            parent_id = page.get("parent", {}).get("database_id") or ""
+            if page.get("archived") or parent_id.replace("-", "") != database_id:
+                return None
+            return decoder.decode(page)
+
+        pages = engine.map_concurrently(
+            retrieve, list(dict.fromkeys(page_ids)), settings.concurrency_limit
+        )
+        return cls([p for p in pages if p is not None], settings)
+
+    def in_window(self) -> Callable[[model.SyncPage], bool]:
+        """Make a check for whether a page is in the sync window (by its start date).
+
+        See `ncal.config.sync_window`. Pages without a date are always in it.
+        """
+        utc = datetime.timezone.utc
+        start, end = (
+            arrow.get(t).datetime if t is not None else None
+            for t in config.sync_window(self.settings)
+        )
+
+        def check(page: model.SyncPage) -> bool:
+            if page.start is None or (start is None and end is None):
+                return True
+            page_start = dates.parse(page.start, utc)
+            return (start is None or page_start >= start) and (
+                end is None or page_start <= end
+            )
+
+        return check
+
+    def new_pages(self) -> list[model.SyncPage]:
+        """Pages which are not on GCal yet, and aren't done."""
+        in_window = self.in_window()
+        return [p for p in self.pages if not p.on_gcal and not p.done and in_window(p)]
+
+    def no_calendar_pages(self) -> list[model.SyncPage]:
+        """Pages without a calendar selected, which aren't done."""
+        in_window = self.in_window()
+        return [
+            p
+            for p in self.pages
+            if p.calendar_name is None and not p.done and in_window(p)
+        ]
+
+    def need_update_pages(self) -> list[model.SyncPage]:
+        """Pages on GCal which have been changed in Notion, and aren't done."""
+        in_window = self.in_window()
+        return [
+            p
+            for p in self.pages
+            if p.need_gcal_update and p.on_gcal and not p.done and in_window(p)
+        ]
+
+    def synced_pages(self) -> list[model.SyncPage]:
+        """Pages on GCal which haven't been changed in Notion, and aren't done."""
+        in_window = self.in_window()
+        return [
+            p
+            for p in self.pages
+            if not p.need_gcal_update and p.on_gcal and not p.done and in_window(p)
+        ]
+
+    def gcal_event_ids(self) -> list[str]:
+        """GCal event ids of all of the pages that have one."""
+        return [p.gcal_event_id for p in self.pages if p.gcal_event_id]
+
+    def done_pages(self) -> list[model.SyncPage]:
+        """Pages on GCal which are done."""
+        in_window = self.in_window()
+        return [
+            p
+            for p in self.pages
+            if p.gcal_event_id and p.on_gcal and p.done and in_window(p)
+        ]
+
+
+class SnapshotCache:
+    """Keep a snapshot of the database between sync passes.
+
+    Each pass only fetches the pages edited since the last one (see
+    `SyncSnapshot.refresh`), so its cost depends on how much has changed rather
+    than on the size of the database. The whole database is fetched again every
+    `full_query_interval` seconds, to notice deleted pages.
+
+    Attributes:
+        full_query_interval: Seconds between fetches of the whole database
+        snapshot: The cached snapshot
+    """
+
+    def __init__(
+        self,
+        full_query_interval: float = 60 * 60,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        """Start without a snapshot."""
+        self.full_query_interval = full_query_interval
+        self.snapshot: Optional[SyncSnapshot] = None
+        self._clock = clock
+        self._fetched_at = 0.0
+
+    def get(self, notion: nc.Client, settings: config.Settings) -> SyncSnapshot:
+        """Get an up to date snapshot."""
+        now = self._clock()
+        if (
+            self.snapshot is None
+            or self.snapshot.settings != settings
+            or now - self._fetched_at >= self.full_query_interval
+        ):
+            self.snapshot = SyncSnapshot.fetch(notion, settings)
+            self._fetched_at = now
+        else:
+            self.snapshot.refresh(notion)
+        return self.snapshot
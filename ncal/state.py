@@ -0,0 +1,226 @@
+"""Local state that ncal keeps between synchronisation passes."""
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+from dataclasses import dataclass, fields
+from pathlib import Path
+from typing import Any, Final, Optional, Union
+
+from ncal import model
+
+
+class SyncTokenStore:
+    """Persist Google Calendar ``nextSyncToken`` values, one per calendar.
+
+    Tokens are held in memory until `save` is called, so a pass that fails part way
+    through does not advance the stored tokens.
+
+    Attributes:
+        path: json file that the tokens are stored in (None to only keep them in
+            memory)
+    """
+
+    def __init__(self, path: Optional[Path]) -> None:
+        """Load any existing tokens from `path`."""
+        self.path = Path(path) if path is not None else None
+        self._tokens: dict[str, str] = {}
+        if self.path is not None and self.path.is_file():
+            try:
+                self._tokens = json.loads(self.path.read_text())
+            except json.JSONDecodeError:
+                logging.error(f"Ignoring unreadable sync token file: {self.path}")
+
+    def get(self, calendar_id: str) -> Optional[str]:
+        """Get the sync token for a calendar, if there is one."""
+        return self._tokens.get(calendar_id)
+
+    def set(self, calendar_id: str, token: str) -> None:
+        """Set the sync token for a calendar."""
+        self._tokens[calendar_id] = token
+
+    def drop(self, calendar_id: str) -> None:
+        """Forget the sync token for a calendar, forcing a full resync."""
+        self._tokens.pop(calendar_id, None)
+
+    def tokens(self) -> dict[str, str]:
+        """Get a copy of every token, by calendar id."""
+        return dict(self._tokens)
+
+    def save(self) -> None:
+        """Write the tokens to disk."""
+        if self.path is not None:
+            self.path.write_text(json.dumps(self._tokens))
+
+
+@dataclass
+class PageState:
+    """What ncal last synchronised for a Notion page.
+
+    Attributes:
+        page_id: Notion page id
+        event_id: GCal event id
+        last_edited_time: The page's ``last_edited_time`` after it was last synced
+        event_etag: The event's ``etag`` after it was last synced
+        event_updated: The event's ``updated`` time after it was last synced
+        content_hash: Hash of the event body that was last sent to GCal
+        page_hash: Hash of the page's synced properties after it was last synced
+            (see `page_hash`)
+    """
+
+    page_id: str
+    event_id: Optional[str] = None
+    last_edited_time: Optional[str] = None
+    event_etag: Optional[str] = None
+    event_updated: Optional[str] = None
+    content_hash: Optional[str] = None
+    page_hash: Optional[str] = None
+
+
+PAGE_STATE_FIELDS: Final = tuple(f.name for f in fields(PageState))
+
+# the properties of a page that are synced with its event
+PAGE_HASH_FIELDS: Final = (
+    "title",
+    "start",
+    "end",
+    "initiative",
+    "extra_info",
+    "on_gcal",
+    "calendar_name",
+    "done",
+)
+
+
+def content_hash(event: dict[str, Any]) -> str:
+    """Hash a GCal event body, to tell whether it has changed."""
+    return hashlib.sha256(json.dumps(event, sort_keys=True).encode()).hexdigest()
+
+
+def page_hash(page: model.SyncPage) -> str:
+    """Hash the properties of a page that are synced, to tell whether they changed.
+
+    Notion only gives ``last_edited_time`` to the minute, so an edit made in the
+    same minute as ncal's own write to a page can't be told apart by it.
+    """
+    return content_hash({name: getattr(page, name) for name in PAGE_HASH_FIELDS})
+
+
+class StateStore:
+    """SQLite store of the page <-> event mappings and what was last synced.
+
+    The sync phases use this to skip pages and events which haven't changed since
+    they were last synced. It is safe to use from several threads at once. Changes
+    are only written to disk by `commit`, unless the store is opened with
+    `autocommit`.
+
+    Attributes:
+        path: The SQLite database file (or ``":memory:"``)
+    """
+
+    def __init__(
+        self, path: Union[Path, str], timeout: float = 5.0, autocommit: bool = False
+    ) -> None:
+        """Open (and if needed, create) the database.
+
+        Args:
+            path: The database file
+            timeout: How many seconds to wait for another process to finish
+                writing to the database
+            autocommit: Write each change to disk as it is made, rather than
+                holding the database's write lock until `commit`, for when several
+                processes share the database
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(
+            str(path),
+            timeout=timeout,
+            check_same_thread=False,
+            isolation_level=None if autocommit else "DEFERRED",
+        )
+        with self._lock:
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS pages ("
+                "page_id TEXT PRIMARY KEY, event_id TEXT, last_edited_time TEXT, "
+                "event_etag TEXT, event_updated TEXT, content_hash TEXT, "
+                "page_hash TEXT)"
+            )
+            # databases made by older versions don't have the newer columns
+            columns = {
+                row[1] for row in self._connection.execute("PRAGMA table_info(pages)")
+            }
+            for column in PAGE_STATE_FIELDS:
+                if column not in columns:
+                    self._connection.execute(
+                        f"ALTER TABLE pages ADD COLUMN {column} TEXT"
+                    )
+            self._connection.commit()
+
+    def get(self, page_id: str) -> Optional[PageState]:
+        """Get the stored state of a page."""
+        with self._lock:
+            row = self._connection.execute(
+                f"SELECT {', '.join(PAGE_STATE_FIELDS)} FROM pages WHERE page_id = ?",
+                (page_id,),
+            ).fetchone()
+        return PageState(*row) if row else None
+
+    def record(self, page_id: str, **values: Optional[str]) -> None:
+        """Record some of the state of a page, leaving the rest as it was.
+
+        Args:
+            page_id: Notion page id
+            **values: Any of the other `PageState` fields
+        """
+        if not set(values) <= set(PAGE_STATE_FIELDS[1:]):
+            raise ValueError(f"Unknown page state fields: {set(values)}")
+        columns = ", ".join(["page_id", *values])
+        placeholders = ", ".join("?" * (len(values) + 1))
+        updates = (
+            ", ".join(f"{k} = excluded.{k}" for k in values) or "page_id = page_id"
+        )
+        with self._lock:
+            self._connection.execute(
+                f"INSERT INTO pages ({columns}) VALUES ({placeholders}) "
+                f"ON CONFLICT (page_id) DO UPDATE SET {updates}",
+                (page_id, *values.values()),
+            )
+
+    def forget(self, page_id: str) -> None:
+        """Remove everything stored about a page."""
+        with self._lock:
+            self._connection.execute("DELETE FROM pages WHERE page_id = ?", (page_id,))
+
+    def page_unchanged(self, page: model.SyncPage) -> bool:
+        """Check whether a page hasn't changed since it was last synced.
+
+        Its synced properties are compared (see `page_hash`), rather than its
+        ``last_edited_time``.
+        """
+        page_state = self.get(page.id)
+        return (
+            page_state is not None
+            and page_state.page_hash is not None
+            and page_state.page_hash == page_hash(page)
+        )
+
+    def event_unchanged(self, page_id: str, event: model.SyncEvent) -> bool:
+        """Check whether the event for a page hasn't changed since it was synced."""
+        page_state = self.get(page_id)
+        return (
+            page_state is not None
+            and page_state.event_etag is not None
+            and page_state.event_etag == event.etag
+        )
+
+    def commit(self) -> None:
+        """Write any changes to disk."""
+        with self._lock:
+            self._connection.commit()
+
+    def close(self) -> None:
+        """Commit any changes and close the database."""
+        self.commit()
+        self._connection.close()
@@ -0,0 +1,74 @@
+"""Merge the Notion property changes made to each page into a single write."""
+import logging
+import threading
+from typing import Any
+
+import notion_client as nc  # type: ignore
+
+from ncal import engine, model
+
+
+class PageWriteBuffer:
+    """Collect property changes per page, and write each page once.
+
+    Changes are decoded into the local page (see `ncal.model.SyncPage.apply`) as soon
+    as they are staged, so later reads (and any `ncal.snapshot.SyncSnapshot` holding
+    the page) see them straight away. Nothing is sent to Notion until `flush`, which
+    sends a single ``pages.update`` per page with every staged property merged
+    together; a property staged twice keeps its latest value.
+
+    ```python
+    writes = PageWriteBuffer(notion)
+    writes.stage(page, {"On GCal?": {"checkbox": True}})
+    writes.stage(page, {"GCal Event Id": {"rich_text": [...]}})
+    writes.flush()  # one request
+    ```
+
+    Staging is safe from several threads at once.
+
+    Attributes:
+        notion: A Notion API Client
+    """
+
+    def __init__(self, notion: nc.Client) -> None:
+        """Set up an empty buffer."""
+        self.notion = notion
+        self._lock = threading.Lock()
+        # page id -> (page, merged properties)
+        self._pending: dict[str, tuple[model.SyncPage, dict[str, Any]]] = {}
+
+    def __len__(self) -> int:
+        """Get the number of pages with changes waiting to be written."""
+        return len(self._pending)
+
+    def stage(self, page: model.SyncPage, properties: dict[str, Any]) -> None:
+        """Queue changes to the properties of a page.
+
+        Args:
+            page: The page
+            properties: The properties to update, as they would be passed to the API
+        """
+        with self._lock:
+            _, pending = self._pending.setdefault(page.id, (page, {}))
+            pending.update(properties)
+            page.apply(properties)
+
+    def flush(self, concurrency_limit: int = 1) -> None:
+        """Write every page with staged changes.
+
+        Each page's ``last_edited_time`` is set to the one after its write.
+
+        Args:
+            concurrency_limit: How many pages to write at once
+        """
+        with self._lock:
+            pending, self._pending = list(self._pending.values()), {}
+
+        def write(item: tuple[model.SyncPage, dict[str, Any]]) -> None:
+            page, properties = item
+            response = self.notion.pages.update(page_id=page.id, properties=properties)
+            page.last_edited_time = response["last_edited_time"]  # type: ignore
+
+        if pending:
+            logging.info(f"Writing changes to {len(pending)} Notion pages")
+        engine.map_concurrently(write, pending, concurrency_limit)
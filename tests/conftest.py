@@ -0,0 +1,31 @@
+"""Test helpers shared by the test modules."""
+import pytest
+
+
+class FakeClock:
+    """A clock which only moves when it is slept on, or told to.
+
+    Attributes:
+        now: The time
+        sleeps: How long each sleep was
+    """
+
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+    async def async_sleep(self, seconds):
+        self.sleep(seconds)
+
+
+@pytest.fixture
+def clock():
+    """Make a fake clock, starting at 0."""
+    return FakeClock()
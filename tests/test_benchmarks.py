@@ -0,0 +1,87 @@
+"""Test the benchmarks, and the fake APIs that they use."""
+import asyncio
+import json
+
+from typer.testing import CliRunner
+
+from benchmarks import dates, run, servers
+from benchmarks.workspace import make_workspace
+from ncal import core, runner
+
+
+def test_sync_against_fakes():
+    """Test that a sync brings a fake workspace into line with its calendars."""
+    workspace = make_workspace(pages=50, calendars=2)
+    settings, notion, calendar = (
+        workspace.settings,
+        workspace.notion,
+        workspace.calendar,
+    )
+    asyncio.run(runner.sync(settings, calendar, notion))
+
+    events = {
+        event["id"]: calendar_id
+        for calendar_id in settings.calendar_dictionary.values()
+        for event in calendar.all_events(calendar_id)
+    }
+    pages = notion.all_pages()
+    synced = {}
+    for page in pages:
+        properties = page["properties"]
+        if properties[settings.delete_notion_name]["checkbox"]:
+            continue
+        assert properties[settings.on_gcal_notion_name]["checkbox"]
+        event_id = properties[settings.gcal_event_id_notion_name]["rich_text"][0][
+            "plain_text"
+        ]
+        calendar_name = properties[settings.calendar_notion_name]["select"]["name"]
+        assert events[event_id] == settings.calendar_dictionary[calendar_name]
+        synced[event_id] = page["id"]
+    # done pages' events are deleted, and events made on GCal are added to Notion
+    assert set(synced) == set(events)
+    assert len(pages) > 50
+
+
+def test_benchmark_json_output():
+    """Test that every scenario is measured."""
+    result = CliRunner().invoke(
+        run.app, ["--pages", "50", "--calendars", "2", "--no-memory", "--json"]
+    )
+    assert result.exit_code == 0, result.output
+    results = [json.loads(line) for line in result.output.splitlines()]
+    assert [r["scenario"] for r in results] == list(run.SCENARIOS)
+    assert all(r["calls"] and r["changes"] and r["seconds"] > 0 for r in results)
+
+
+def test_sync_through_fake_servers():
+    """Test that a sync through ncal's own clients retries the failed requests."""
+    faults = servers.Faults(throttle_rate={"*": 0.1}, error_rate={"*": 0.05})
+    with servers.FakeServers(make_workspace(pages=30, calendars=2), faults) as fake:
+        settings = fake.settings(
+            notion_requests_per_second=1000, gcal_requests_per_second=1000
+        )
+        service, _, notion = core.setup_api_connections(
+            default_calendar_id=settings.default_calendar_id,
+            credentials_location=settings.credentials_location,
+            notion_api_token=settings.notion_api_token,
+            client_secret_location=settings.client_secret_location,
+            notion_requests_per_second=settings.notion_requests_per_second,
+            gcal_requests_per_second=settings.gcal_requests_per_second,
+            notion_api_url=settings.notion_api_url,
+            gcal_api_url=settings.gcal_api_url,
+        )
+        changes = asyncio.run(runner.sync(settings, service, notion))
+        failures = fake.failures()
+
+    # the same changes as without the servers
+    assert changes == run.measure("sync", 30, 2, memory=False).changes
+    assert failures
+
+
+def test_date_parsing_benchmark():
+    """Test that every parser is timed on every form."""
+    result = CliRunner().invoke(dates.app, ["--number", "10", "--json"])
+    assert result.exit_code == 0, result.output
+    results = [json.loads(line) for line in result.output.splitlines()]
+    assert len(results) == len(dates.FORMS) * len(dates.PARSERS)
+    assert all(r["seconds"] > 0 for r in results)
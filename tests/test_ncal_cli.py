@@ -0,0 +1,48 @@
+"""Test the command line interface."""
+import subprocess
+import sys
+
+from typer.testing import CliRunner
+
+from ncal import cli, runner
+
+# only imported by the commands that need them
+HEAVY_MODULES = (
+    "arrow",
+    "asyncio",
+    "googleapiclient",
+    "httpx",
+    "notion_client",
+    "pydantic",
+    "ncal.core",
+)
+
+
+def test_cli_imports_lazily():
+    """Test that importing the CLI doesn't import the API clients."""
+    imported = subprocess.run(
+        [
+            sys.executable,
+            "-c",
+            "import sys, ncal.cli; print(*sys.modules, sep='\\n')",
+        ],
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout.split()
+
+    assert "ncal.cli" in imported
+    assert not [name for name in imported if name.startswith(HEAVY_MODULES)]
+
+
+def test_version():
+    """Test the version probe."""
+    result = CliRunner().invoke(cli.app, ["--version"])
+    assert result.exit_code == 0
+    assert result.output.startswith("ncal version: ")
+
+
+def test_sync_functions_can_be_imported_from_cli():
+    """Test that the functions moved to ncal.runner are still in ncal.cli."""
+    assert cli.sync is runner.sync
+    assert cli.continuous_sync is runner.continuous_sync
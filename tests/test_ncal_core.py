@@ -1,9 +1,12 @@
 """Test core functionality module."""
+import asyncio
 from unittest import mock
 
 import pytest
 
-from ncal import core
+from benchmarks.workspace import make_workspace
+from ncal import core, phases, runner
+from ncal.snapshot import SyncSnapshot
 
 
 @pytest.mark.parametrize("property_type", ("relation", "other"))
@@ -29,3 +32,270 @@ def test_get_property_text(mock_notion_client, property_type):
     else:
         with pytest.raises(ValueError):
             core.get_property_text(client, example_page, property_name, property_type)
+
+
+def test_list_calendar_events_incremental(tmp_path):
+    """Test that a stored sync token is used, and falls back to a full sync."""
+    import httplib2  # type: ignore
+    from googleapiclient.errors import HttpError  # type: ignore
+
+    from ncal import state
+
+    sync_tokens = state.SyncTokenStore(tmp_path / "tokens.json")
+    sync_tokens.set("cal", "old-token")
+    event = {"id": "1", "status": "confirmed", "end": {"date": "2100-01-01"}}
+    cancelled = {"id": "2", "status": "cancelled"}
+
+    service = mock.MagicMock()
+    service.events.return_value.list.return_value.execute.side_effect = [
+        HttpError(httplib2.Response({"status": 410}), b"Gone"),
+        {"items": [event], "nextPageToken": "page-2"},
+        {"items": [cancelled], "nextSyncToken": "new-token"},
+    ]
+
+    events = core.list_calendar_events(
+        service, "cal", "2022-01-01T00:00:00+00:00", sync_tokens
+    )
+
+    assert events == [event]
+    assert sync_tokens.get("cal") == "new-token"
+    calls = service.events.return_value.list.call_args_list
+    assert calls[0].kwargs["syncToken"] == "old-token"
+    assert "syncToken" not in calls[1].kwargs
+    assert calls[2].kwargs["pageToken"] == "page-2"
+
+
+def test_new_events_gcal_to_notion_skips_known_events():
+    """Test that only GCal events which aren't in Notion yet get a new page."""
+    from ncal import config, model, snapshot
+
+    settings = config.Settings(
+        notion_api_token="asdf", database_id="asdf", url_root="a", concurrency_limit=2
+    )
+    calendar_id = settings.default_calendar_id
+
+    def event(event_id):
+        return {
+            "id": event_id,
+            "summary": event_id,
+            "organizer": {"email": calendar_id},
+            "start": {"dateTime": "2100-01-01T10:00:00+00:00"},
+            "end": {"dateTime": "2100-01-01T11:00:00+00:00"},
+        }
+
+    known_page = model.SyncPage("page", gcal_event_id="known")
+    service = mock.MagicMock()
+    service.events.return_value.list.return_value.execute.return_value = {
+        "items": [event("known"), event("new")]
+    }
+    notion = mock.MagicMock()
+
+    core.new_events_gcal_to_notion(
+        settings.database_id,
+        settings.calendar_dictionary,
+        settings.task_notion_name,
+        settings.date_notion_name,
+        settings.extrainfo_notion_name,
+        settings.on_gcal_notion_name,
+        settings.gcal_event_id_notion_name,
+        settings.lastupdatedtime_notion_name,
+        settings.calendar_notion_name,
+        settings.current_calendar_id_notion_name,
+        settings.delete_notion_name,
+        service,
+        notion,
+        settings=settings,
+        snapshot=snapshot.SyncSnapshot([known_page], settings),
+    )
+
+    notion.databases.query.assert_not_called()
+    notion.pages.create.assert_called_once()
+    properties = notion.pages.create.call_args.kwargs["properties"]
+    assert properties[settings.gcal_event_id_notion_name]["rich_text"] == [
+        {"text": {"content": "new"}}
+    ]
+
+
+def test_failed_inserts_are_not_checked_off():
+    """Test that a page is only marked On GCal once its event has been inserted."""
+    import httplib2  # type: ignore
+    from googleapiclient.errors import HttpError  # type: ignore
+
+    from ncal import config, model, snapshot
+
+    settings = config.Settings(
+        notion_api_token="asdf", database_id="asdf", url_root="a", gcal_batch_size=1
+    )
+    pages = [
+        model.PageDecoder.from_settings(settings).decode(
+            {
+                "id": page_id,
+                "properties": {
+                    settings.date_notion_name: {
+                        "date": {"start": "2100-01-01", "end": None}
+                    }
+                },
+            }
+        )
+        for page_id in ["fails", "inserted"]
+    ]
+    service = mock.MagicMock()
+    service.events.return_value.insert.return_value.execute.side_effect = [
+        HttpError(httplib2.Response({"status": 400}), b"Bad Request"),
+        {
+            "id": "event",
+            "start": {"date": "2100-01-01"},
+            "end": {"date": "2100-01-02"},
+        },
+    ]
+    notion = mock.MagicMock()
+    notion.pages.update.return_value = {"last_edited_time": "later"}
+
+    inserted = core.new_events_notion_to_gcal(
+        settings.database_id,
+        settings.url_root,
+        settings.default_calendar_name,
+        settings.calendar_dictionary,
+        settings.task_notion_name,
+        settings.date_notion_name,
+        settings.initiative_notion_name,
+        settings.extrainfo_notion_name,
+        settings.on_gcal_notion_name,
+        settings.gcal_event_id_notion_name,
+        settings.lastupdatedtime_notion_name,
+        settings.calendar_notion_name,
+        settings.current_calendar_id_notion_name,
+        settings.delete_notion_name,
+        notion,
+        service,
+        settings,
+        snapshot=snapshot.SyncSnapshot(pages, settings),
+    )
+
+    assert inserted == 1
+    notion.pages.update.assert_called_once()
+    assert notion.pages.update.call_args.kwargs["page_id"] == "inserted"
+    assert [(p.on_gcal, p.gcal_event_id) for p in pages] == [
+        (False, None),
+        (True, "event"),
+    ]
+
+
+def test_index_calendar_events():
+    """Test that one paginated list per calendar builds the event index."""
+    service = mock.MagicMock()
+    service.events.return_value.list.return_value.execute.side_effect = [
+        {
+            "items": [{"id": "a", "status": "confirmed"}],
+            "nextPageToken": "page-2",
+        },
+        {"items": [{"id": "b", "status": "cancelled"}]},
+        {"items": [{"id": "a", "status": "confirmed", "summary": "moved"}]},
+    ]
+
+    event_index = core.index_calendar_events(
+        service, {"First": "first@calendar", "Second": "second@calendar"}
+    )
+
+    assert event_index == {
+        "a": ("Second", {"id": "a", "status": "confirmed", "summary": "moved"})
+    }
+    assert service.events.return_value.list.call_count == 3
+    service.events.return_value.get.assert_not_called()
+
+
+def test_find_calendar_events():
+    """Test that events are looked for on their last calendar, then the others."""
+    import httplib2  # type: ignore
+    from googleapiclient.errors import HttpError  # type: ignore
+
+    def not_found():
+        return HttpError(httplib2.Response({"status": 404}), b"Not Found")
+
+    service = mock.MagicMock()
+    get = service.events.return_value.get
+    get.return_value.execute.side_effect = [
+        {"id": "moved", "status": "confirmed"},
+        not_found(),
+        {"id": "deleted", "status": "cancelled"},
+        not_found(),
+        not_found(),
+    ]
+
+    found = core.find_calendar_events(
+        service,
+        {"First": "first@calendar", "Second": "second@calendar"},
+        {"moved": "second@calendar", "lost": None, "deleted": "first@calendar"},
+        batch_size=1,
+    )
+
+    assert found == {"moved": ("Second", {"id": "moved", "status": "confirmed"})}
+    assert [call.kwargs for call in get.call_args_list] == [
+        {"calendarId": "second@calendar", "eventId": "moved"},
+        {"calendarId": "first@calendar", "eventId": "lost"},
+        {"calendarId": "first@calendar", "eventId": "deleted"},
+        {"calendarId": "second@calendar", "eventId": "lost"},
+        {"calendarId": "second@calendar", "eventId": "deleted"},
+    ]
+
+
+def test_only_pages_on_the_synced_calendars_are_looked_for():
+    """Test that a sync of some calendars doesn't look for other calendars' events."""
+    workspace = make_workspace(pages=100, calendars=4)
+    settings, notion, calendar = (
+        workspace.settings,
+        workspace.notion,
+        workspace.calendar,
+    )
+    asyncio.run(runner.sync(settings, calendar, notion))
+    name, calendar_id = next(iter(settings.calendar_dictionary.items()))
+    deleted = calendar.all_events(calendar_id)[0]
+    calendar.events().delete(calendarId=calendar_id, eventId=deleted["id"]).execute()
+    calendar_settings = settings.copy(
+        update={"calendar_dictionary": {name: calendar_id}}
+    )
+    calendar.calls.reset()
+
+    phases.PHASES["modified G->N"](
+        calendar_settings,
+        calendar,
+        notion,
+        snapshot=SyncSnapshot.fetch(notion, settings),
+    )
+
+    # only the page whose event was deleted is looked for, on its own calendar
+    assert calendar.calls.counts().get("gcal.events.get") == 1
+
+
+def fake_database(batches):
+    """Make a Notion client whose database query returns `batches` of results."""
+    notion = mock.MagicMock()
+
+    def query(database_id, start_cursor=None, **query):
+        i = int(start_cursor or 0)
+        next_cursor = str(i + 1) if i + 1 < len(batches) else None
+        return {"results": batches[i], "next_cursor": next_cursor}
+
+    notion.databases.query.side_effect = query
+    return notion
+
+
+@pytest.mark.parametrize("prefetch", [True, False])
+def test_iter_database_query(prefetch):
+    """Test that every page is streamed, following the cursors."""
+    notion = fake_database([[1, 2], [3], [4, 5]])
+    pages = core.iter_database_query(notion, "db", prefetch=prefetch, filter={})
+    assert next(pages) == 1
+    assert list(pages) == [2, 3, 4, 5]
+    assert notion.databases.query.call_count == 3
+    assert core.paginated_database_query(notion, "db") == [1, 2, 3, 4, 5]
+
+
+def test_aiter_database_query():
+    """Test that every page is streamed asynchronously."""
+    notion = fake_database([[1, 2], [3]])
+
+    async def collect():
+        return [page async for page in core.aiter_database_query(notion, "db")]
+
+    assert asyncio.run(collect()) == [1, 2, 3]
@@ -0,0 +1,52 @@
+"""Test the date parsing module."""
+import datetime
+
+import dateutil.parser
+import pytest
+
+from ncal import dates
+
+UTC = datetime.timezone.utc
+
+
+@pytest.mark.parametrize(
+    "value",
+    [
+        "2022-03-01T10:00:00.000+01:00",
+        "2022-03-01T10:00:00+01:00",
+        "2022-03-01T10:00:00-0530",
+        "2022-03-01T10:00:00.123456789Z",
+        "2022-03-01T10:00:00.5+00:00",
+        "2022-03-01T10:00",
+        "2022-03-01 10:00:00",
+        "2022-03-01",
+        "20220301T1000",
+    ],
+)
+def test_parse_agrees_with_isoparse(value):
+    """Test that each form parses to the same time as dateutil parses it to."""
+    expected = dateutil.parser.isoparse(value)
+    parsed = dates.parse(value)
+    assert parsed == expected
+    assert parsed.utcoffset() == expected.utcoffset()
+
+
+def test_naive_times_can_be_given_a_timezone():
+    """Test that dates, and times without an offset, can be made aware."""
+    assert dates.parse("2022-03-01", UTC) == datetime.datetime(2022, 3, 1, tzinfo=UTC)
+    assert dates.parse("2022-03-01T10:00:00+01:00", UTC).utcoffset() == (
+        datetime.timedelta(hours=1)
+    )
+
+
+@pytest.mark.parametrize("value", ["", "tomorrow", "2022-13-01", "2022-03-01T25:00"])
+def test_invalid_values(value):
+    """Test that values which aren't dates are rejected."""
+    with pytest.raises(ValueError):
+        dates.parse(value)
+
+
+def test_results_are_memoised():
+    """Test that parsing the same string again reuses the result."""
+    value = "2031-07-04T08:15:00.000+02:00"
+    assert dates.parse(value) is dates.parse(value)
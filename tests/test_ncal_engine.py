@@ -0,0 +1,26 @@
+"""Test the concurrent sync engine."""
+import threading
+import time
+
+from ncal import engine
+
+
+def test_map_concurrently_order_and_limit():
+    """Test that results keep their order and the limit is respected."""
+    running = 0
+    max_running = 0
+    lock = threading.Lock()
+
+    def work(item):
+        nonlocal running, max_running
+        with lock:
+            running += 1
+            max_running = max(max_running, running)
+        time.sleep(0.01)
+        with lock:
+            running -= 1
+        return item * 2
+
+    assert engine.map_concurrently(work, range(10), 3) == [i * 2 for i in range(10)]
+    assert 1 < max_running <= 3
+    assert engine.map_concurrently(work, [1, 2], 1) == [2, 4]
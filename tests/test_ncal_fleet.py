@@ -0,0 +1,136 @@
+"""Test the fleet module."""
+import asyncio
+from pathlib import Path
+from unittest import mock
+
+import pytest
+from google.oauth2.credentials import Credentials  # type: ignore
+
+from ncal import fleet, gcal_setup
+
+
+def test_load_profiles(tmp_path):
+    """Test loading a file of several profiles, and a file of one."""
+    (tmp_path / "team.toml").write_text(
+        """
+url_root = "https://www.notion.so/"
+notion_api_token = "shared"
+
+[[profiles]]
+name = "work"
+database_id = "a"
+
+[[profiles]]
+database_id = "b"
+notion_api_token = "own"
+state_location = "b.sqlite3"
+"""
+    )
+    (tmp_path / "home.toml").write_text(
+        'notion_api_token = "c"\ndatabase_id = "c"\nurl_root = "u"\n'
+    )
+
+    profiles = fleet.load_profiles([tmp_path / "team.toml", tmp_path / "home.toml"])
+
+    assert list(profiles) == ["work", "team-1", "home"]
+    assert profiles["work"].notion_api_token == "shared"
+    assert profiles["work"].state_location == Path("ncal_state.work.sqlite3")
+    assert profiles["team-1"].notion_api_token == "own"
+    assert profiles["team-1"].state_location == Path("b.sqlite3")
+    assert profiles["home"].sync_token_location == Path("sync_tokens.home.json")
+
+    with pytest.raises(ValueError):
+        fleet.load_profiles([tmp_path / "home.toml", tmp_path / "home.toml"])
+
+
+def test_push_enabled_profiles_need_their_own_endpoints(tmp_path):
+    """Test that two tenants can't serve push notifications on the same port."""
+    profile = """
+url_root = "u"
+notion_api_token = "t"
+
+[[profiles]]
+name = "work"
+database_id = "a"
+push_address = "https://example.com/work"
+
+[[profiles]]
+name = "home"
+database_id = "b"
+push_address = "https://example.com/home"
+"""
+    (tmp_path / "shared.toml").write_text(profile)
+    with pytest.raises(ValueError, match="'work' and 'home' both use the port 8000"):
+        fleet.load_profiles([tmp_path / "shared.toml"])
+
+    (tmp_path / "own.toml").write_text(profile + "push_port = 8002\n")
+    profiles = fleet.load_profiles([tmp_path / "own.toml"])
+    assert [s.push_port for s in profiles.values()] == [8000, 8002]
+
+
+def test_tenant_lock_shares_slots():
+    """Test that only so many tenants sync at once, and each tenant one at a time."""
+    running = []
+    most_running = 0
+
+    async def sync(lock, name):
+        nonlocal most_running
+        async with lock:
+            running.append(name)
+            most_running = max(most_running, len(running))
+            # a tenant's own syncs never overlap
+            assert running.count(name) == 1
+            await asyncio.sleep(0.01)
+            running.remove(name)
+
+    async def main():
+        slots = asyncio.Semaphore(2)
+        locks = [fleet.TenantLock(slots) for _ in range(4)]
+        await asyncio.gather(
+            *(sync(lock, i) for i, lock in enumerate(locks) for _ in range(2))
+        )
+
+    asyncio.run(main())
+    assert most_running == 2
+
+
+def test_connect_shares_connections(tmp_path):
+    """Test that tenants are connected with the same pools and discovery document."""
+    profiles = {
+        name: fleet.profile_settings(
+            name,
+            {
+                "notion_api_token": "a",
+                "database_id": name,
+                "url_root": "u",
+                "state_location": tmp_path / f"{name}.sqlite3",
+            },
+        )
+        for name in ("one", "two")
+    }
+    the_fleet = fleet.Fleet(profiles)
+    setup = mock.Mock(return_value=(mock.Mock(), mock.Mock(), mock.Mock()))
+    with mock.patch.object(fleet.core, "setup_api_connections", setup):
+        tenants = the_fleet.connect()
+    the_fleet.close()
+
+    assert [tenant.name for tenant in tenants] == ["one", "two"]
+    first, second = (call.kwargs for call in setup.call_args_list)
+    for key in ("notion_transport", "gcal_connections", "discovery_document"):
+        assert first[key] is second[key]
+    assert first["discovery_document"]["name"] == "calendar"
+
+
+def test_request_builders_share_connections():
+    """Test that services given the same connections share each thread's Http."""
+    connections = gcal_setup.threading.local()
+    builders = [
+        gcal_setup.thread_safe_request_builder(Credentials(token), None, 0, connections)
+        for token in ("a", "b")
+    ]
+    requests = [
+        build_request(None, mock.Mock(), "https://example.com", method="GET")
+        for build_request in builders
+    ]
+    assert requests[0].http is not requests[1].http
+    assert requests[0].http.http is requests[1].http.http
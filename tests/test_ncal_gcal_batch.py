@@ -0,0 +1,146 @@
+"""Test the GCal request batching module."""
+from unittest import mock
+
+import httplib2  # type: ignore
+import pytest
+from googleapiclient.errors import HttpError  # type: ignore
+
+from ncal import gcal_batch
+
+
+class FakeBatch:
+    """Stands in for googleapiclient.http.BatchHttpRequest."""
+
+    def __init__(self, sent):
+        """Record each batch that is executed in `sent`."""
+        self.sent = sent
+        self.requests = []
+
+    def add(self, request, callback):
+        """Queue a request (which here is its response or error, or makes one)."""
+        self.requests.append((request, callback))
+
+    def execute(self):
+        """Call the callbacks like the real batch would."""
+        self.sent.append(len(self.requests))
+        for i, (request, callback) in enumerate(self.requests):
+            if callable(request):
+                request = request()
+            if isinstance(request, HttpError):
+                callback(str(i), None, request)
+            else:
+                callback(str(i), request, None)
+
+
+@pytest.fixture
+def service():
+    """Make a GCal service that records the batches it sends."""
+    service = mock.MagicMock()
+    service.sent = []
+    service.new_batch_http_request.side_effect = lambda: FakeBatch(service.sent)
+    return service
+
+
+def test_event_batch_sends_in_batches(service):
+    """Test that requests are split into batches, and callbacks get responses."""
+    responses = []
+    with gcal_batch.EventBatch(service) as batch:
+        for i in range(120):
+            batch.add({"id": i}, callback=responses.append)
+
+    assert service.sent == [50, 50, 20]
+    assert responses == [{"id": i} for i in range(120)]
+
+
+def test_event_batch_errors(service):
+    """Test that failures go to the errback, or are raised once sent."""
+    error = HttpError(httplib2.Response({"status": 404}), b"Not Found")
+    errors = []
+    responses = []
+
+    batch = gcal_batch.EventBatch(service)
+    batch.add(error, errback=errors.append)
+    batch.add({"id": 1}, callback=responses.append)
+    batch.flush()
+    assert errors == [error]
+    assert responses == [{"id": 1}]
+
+    batch.add(error)
+    batch.add({"id": 2}, callback=responses.append)
+    with pytest.raises(HttpError):
+        batch.flush()
+    assert responses == [{"id": 1}, {"id": 2}]
+
+
+def test_event_batch_size_one(service):
+    """Test that a batch size of 1 executes each request on its own."""
+    request = mock.MagicMock()
+    request.execute.return_value = {"id": 1}
+    responses = []
+
+    with gcal_batch.EventBatch(service, batch_size=1) as batch:
+        batch.add(request, callback=responses.append)
+
+    service.new_batch_http_request.assert_not_called()
+    assert responses == [{"id": 1}]
+
+
+def test_event_batch_retries_throttled_requests(service, monkeypatch):
+    """Test that rate limited requests are sent again in a later batch."""
+    monkeypatch.setattr(gcal_batch.time, "sleep", lambda seconds: None)
+    throttled = HttpError(
+        httplib2.Response({"status": 403}),
+        b'{"error": {"errors": [{"reason": "rateLimitExceeded"}]}}',
+    )
+    attempts = iter([throttled, {"id": 1}])
+    responses = []
+
+    with gcal_batch.EventBatch(service) as batch:
+        batch.add(lambda: next(attempts), callback=responses.append)
+        batch.add({"id": 2}, callback=responses.append)
+
+    assert service.sent == [2, 1]
+    assert responses == [{"id": 2}, {"id": 1}]
+
+
+def test_event_batch_retries_throttled_batches(service, monkeypatch):
+    """Test that a batch which fails as a whole is sent again."""
+    monkeypatch.setattr(gcal_batch.time, "sleep", lambda seconds: None)
+    unavailable = HttpError(httplib2.Response({"status": 503}), b"Backend Error")
+    failures = iter([unavailable])
+
+    def new_batch():
+        batch = FakeBatch(service.sent)
+        execute = batch.execute
+
+        def execute_or_fail():
+            error = next(failures, None)
+            if error is not None:
+                raise error
+            execute()
+
+        batch.execute = execute_or_fail
+        return batch
+
+    service.new_batch_http_request.side_effect = new_batch
+    responses = []
+    with gcal_batch.EventBatch(service) as batch:
+        batch.add({"id": 1}, callback=responses.append)
+
+    assert responses == [{"id": 1}]
+
+
+def test_event_batch_max_retries(service, monkeypatch):
+    """Test that throttled requests are only retried `max_retries` times."""
+    monkeypatch.setattr(gcal_batch.time, "sleep", lambda seconds: None)
+    throttled = HttpError(
+        httplib2.Response({"status": 403}),
+        b'{"error": {"errors": [{"reason": "rateLimitExceeded"}]}}',
+    )
+    errors = []
+
+    with gcal_batch.EventBatch(service, max_retries=1) as batch:
+        batch.add(lambda: throttled, errback=errors.append)
+
+    assert service.sent == [1, 1]
+    assert errors == [throttled]
@@ -0,0 +1,111 @@
+"""Test the GCal push notification module."""
+import urllib.error
+import urllib.request
+from unittest import mock
+
+import httplib2  # type: ignore
+import pytest
+from googleapiclient.errors import HttpError  # type: ignore
+
+from ncal import gcal_push
+
+
+@pytest.fixture
+def channels():
+    """Make a channel manager, with a GCal service that opens channels."""
+    service = mock.MagicMock()
+    service.events().watch.side_effect = lambda calendarId, body: mock.Mock(
+        execute=lambda: {
+            "id": body["id"],
+            "resourceId": f"resource-{calendarId}",
+            "expiration": "100000",
+        }
+    )
+    return gcal_push.ChannelManager(
+        service, "https://example.com/notify", token="secret", clock=lambda: 0
+    )
+
+
+def post(port, headers):
+    """Post a notification to the receiver, and get the response status."""
+    request = urllib.request.Request(
+        f"http://127.0.0.1:{port}/", data=b"", headers=headers, method="POST"
+    )
+    try:
+        with urllib.request.urlopen(request) as response:
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+
+
+def test_channels_are_renewed_before_they_expire(channels):
+    """Test that expiring channels are replaced, and the old ones stopped."""
+    channel = channels.watch("cal")
+    assert channel.expiration == 100
+    assert channels.calendar_for(channel.channel_id, "secret") == "cal"
+    assert channels.calendar_for(channel.channel_id, "wrong") is None
+
+    assert channels.renew_expiring(margin=10) == []
+    (renewed,) = channels.renew_expiring(margin=100)
+    assert renewed.channel_id != channel.channel_id
+    assert channels.channels() == [renewed]
+    channels.service.channels().stop.assert_called_with(
+        body={"id": channel.channel_id, "resourceId": "resource-cal"}
+    )
+
+
+def test_failed_watches_are_retried(channels):
+    """Test that calendars which couldn't be watched are watched on renewal."""
+    watch = channels.service.events().watch.side_effect
+    channels.service.events().watch.side_effect = HttpError(
+        httplib2.Response({"status": 503}), b"Unavailable"
+    )
+    channels.watch_all(["a", "b"])
+    assert channels.channels() == []
+    assert channels.unwatched() == {"a", "b"}
+
+    channels.service.events().watch.side_effect = watch
+    renewed = channels.renew_expiring(margin=10)
+    assert [channel.calendar_id for channel in renewed] == ["a", "b"]
+    assert channels.unwatched() == set()
+
+
+def test_channels_are_kept_if_they_cant_be_renewed(channels):
+    """Test that an old channel isn't stopped until there is a new one."""
+    channel = channels.watch("cal")
+    channels.service.events().watch.side_effect = HttpError(
+        httplib2.Response({"status": 503}), b"Unavailable"
+    )
+    assert channels.renew_expiring(margin=100) == []
+    assert channels.channels() == [channel]
+    assert channels.unwatched() == {"cal"}
+    channels.service.channels().stop.assert_not_called()
+
+
+def test_receiver_triggers_on_change(channels):
+    """Test posting synthetic notifications to the receiver."""
+    channel = channels.watch("cal")
+    changed = []
+    receiver = gcal_push.NotificationReceiver(
+        channels, changed.append, host="127.0.0.1", port=0
+    )
+    receiver.start()
+    try:
+        headers = {
+            "X-Goog-Channel-ID": channel.channel_id,
+            "X-Goog-Channel-Token": "secret",
+            "X-Goog-Resource-State": "sync",
+        }
+        assert post(receiver.port, headers) == 200
+        assert changed == []
+
+        headers["X-Goog-Resource-State"] = "exists"
+        assert post(receiver.port, headers) == 200
+        assert changed == ["cal"]
+
+        headers["X-Goog-Channel-Token"] = "wrong"
+        assert post(receiver.port, headers) == 404
+        assert post(receiver.port, {}) == 400
+        assert changed == ["cal"]
+    finally:
+        receiver.stop()
@@ -0,0 +1,50 @@
+"""Test the Google Calendar setup module."""
+import json
+import subprocess
+import sys
+from unittest import mock
+
+from ncal import gcal_setup
+
+
+def test_load_bundled_discovery_document():
+    """Test that the copy of the discovery document in googleapiclient is used."""
+    with mock.patch.object(gcal_setup.httplib2, "Http") as http:
+        document = gcal_setup.load_discovery_document()
+    assert document["name"] == "calendar"
+    http.assert_not_called()
+
+
+def test_discovery_document_is_downloaded_once(tmp_path):
+    """Test that a downloaded discovery document is kept for next time."""
+    cache_file = tmp_path / "discovery.json"
+    http = mock.Mock()
+    http.return_value.request.return_value = (
+        mock.Mock(status=200),
+        json.dumps({"name": "calendar"}).encode(),
+    )
+    with mock.patch.object(
+        gcal_setup.discovery_cache, "get_static_doc", return_value=None
+    ), mock.patch.object(gcal_setup.httplib2, "Http", http):
+        assert gcal_setup.load_discovery_document(cache_file) == {"name": "calendar"}
+        assert gcal_setup.load_discovery_document(cache_file) == {"name": "calendar"}
+
+    assert http.return_value.request.call_count == 1
+    assert json.loads(cache_file.read_text()) == {"name": "calendar"}
+
+
+def test_oauth_flow_is_imported_lazily():
+    """Test that the OAuth flow isn't imported until a new token is needed."""
+    output = subprocess.run(
+        [
+            sys.executable,
+            "-c",
+            "import sys, ncal.gcal_setup; "
+            "print('google_auth_oauthlib.flow' in sys.modules, "
+            "'requests' in sys.modules)",
+        ],
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    assert output.split() == ["False", "False"]
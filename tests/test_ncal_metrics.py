@@ -0,0 +1,110 @@
+"""Test the metrics module."""
+import asyncio
+import urllib.error
+import urllib.request
+from unittest import mock
+
+import httpx
+import notion_client as nc
+import pytest
+
+from ncal import metrics, phases, rate_limit, scheduler
+
+
+@pytest.fixture
+def server():
+    """Serve a registry with a single counter, on a free port."""
+    registry = metrics.Registry()
+    registry.register(metrics.Counter("things_total", "Things", ["kind"])).inc(kind="a")
+    metrics_server = metrics.MetricsServer(registry, host="127.0.0.1", port=0)
+    metrics_server.start()
+    yield metrics_server
+    metrics_server.stop()
+
+
+def test_metrics_are_served(server):
+    """Test that the metrics are served in the Prometheus text format."""
+    url = f"http://127.0.0.1:{server.port}/metrics"
+    with urllib.request.urlopen(url) as response:
+        assert response.headers["Content-Type"] == metrics.CONTENT_TYPE
+        assert response.read().decode() == (
+            "# HELP things_total Things\n"
+            "# TYPE things_total counter\n"
+            'things_total{kind="a"} 1\n'
+        )
+    with pytest.raises(urllib.error.HTTPError) as error:
+        urllib.request.urlopen(f"http://127.0.0.1:{server.port}/")
+    assert error.value.code == 404
+
+
+def test_labels_must_match():
+    """Test that a metric can't be given labels it doesn't have."""
+    counter = metrics.Counter("things_total", "Things", ["kind"])
+    with pytest.raises(ValueError):
+        counter.inc(colour="red")
+
+
+def test_metrics_must_have_samples():
+    """Test that a kind of metric without samples can't be made."""
+
+    class Gauge(metrics.Metric):
+        kind = "gauge"
+
+    with pytest.raises(TypeError):
+        Gauge("things", "Things")
+
+
+def test_requests_and_retries_are_counted():
+    """Test that each attempt at a request is counted, timed, and retried."""
+    labels = {"api": "test", "endpoint": "GET things"}
+    throttled = nc.errors.APIResponseError(httpx.Response(429), "error", "rate_limited")
+    function = mock.Mock(side_effect=[throttled, "done"])
+    ok = metrics.API_REQUESTS.value(outcome="ok", **labels)
+    errors = metrics.API_REQUESTS.value(outcome="error", **labels)
+    retries = metrics.API_RETRIES.value(**labels)
+    timed = metrics.API_SECONDS.count(**labels)
+
+    result = rate_limit.call_with_retry(
+        function,
+        None,
+        rate_limit.notion_retry_after,
+        sleep=lambda seconds: None,
+        **labels,
+    )
+
+    assert result == "done"
+    assert metrics.API_REQUESTS.value(outcome="ok", **labels) == ok + 1
+    assert metrics.API_REQUESTS.value(outcome="error", **labels) == errors + 1
+    assert metrics.API_RETRIES.value(**labels) == retries + 1
+    assert metrics.API_SECONDS.count(**labels) == timed + 2
+
+
+def test_phases_are_measured(monkeypatch):
+    """Test that running a phase records its duration and changes."""
+    monkeypatch.setitem(phases.PHASES, "test", mock.Mock(return_value=3))
+    changes = metrics.PHASE_CHANGES.value(phase="test")
+    timed = metrics.PHASE_SECONDS.count(phase="test")
+
+    assert phases.run("test", mock.Mock(), mock.Mock(), mock.Mock()) == 3
+    assert metrics.PHASE_CHANGES.value(phase="test") == changes + 3
+    assert metrics.PHASE_SECONDS.count(phase="test") == timed + 1
+
+
+def test_overruns_are_counted(monkeypatch):
+    """Test that a run longer than the interval is counted as an overrun."""
+    now = [0.0]
+
+    async def sleep(seconds):
+        now[0] += seconds
+
+    async def work(seconds):
+        now[0] += seconds
+
+    monkeypatch.setattr(scheduler.asyncio, "sleep", sleep)
+    schedule = scheduler.Scheduler(10, clock=lambda: now[0])
+    overruns = metrics.SYNC_OVERRUNS.value()
+
+    asyncio.run(schedule.run(work, 5, max_runs=2))
+    assert metrics.SYNC_OVERRUNS.value() == overruns
+    asyncio.run(schedule.run(work, 15, max_runs=2))
+    assert metrics.SYNC_OVERRUNS.value() == overruns + 2
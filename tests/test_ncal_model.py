@@ -0,0 +1,151 @@
+"""Test the page and event model."""
+import datetime
+import pickle
+
+import pytest
+
+from ncal import config, model
+
+
+@pytest.fixture
+def settings():
+    """Generate some sample settings."""
+    return config.Settings(notion_api_token="asdf", database_id="asdf", url_root="a")
+
+
+def notion_page(settings):
+    """Make a Notion page, as the API returns it."""
+    return {
+        "id": "page",
+        "last_edited_time": "2022-01-01T10:00:00.000Z",
+        "archived": False,
+        "properties": {
+            settings.task_notion_name: {
+                "title": [{"plain_text": "Write "}, {"plain_text": "report"}]
+            },
+            settings.date_notion_name: {
+                "date": {"start": "2022-03-01T10:00:00.000+01:00", "end": None}
+            },
+            settings.initiative_notion_name: {"relation": [{"id": "project"}]},
+            settings.extrainfo_notion_name: {"rich_text": []},
+            settings.on_gcal_notion_name: {"checkbox": True},
+            settings.need_gcal_update_notion_name: {"formula": {"boolean": False}},
+            settings.gcal_event_id_notion_name: {
+                "rich_text": [{"text": {"content": "event"}}]
+            },
+            settings.lastupdatedtime_notion_name: {"date": None},
+            settings.calendar_notion_name: {"select": {"name": "Work"}},
+            settings.current_calendar_id_notion_name: {"rich_text": []},
+            settings.delete_notion_name: {"checkbox": False},
+            "Unused": {"number": 3},
+        },
+    }
+
+
+def test_pages_are_decoded(settings):
+    """Test that each property named in the settings is decoded."""
+    page = model.PageDecoder.from_settings(settings).decode(notion_page(settings))
+
+    assert page.id == "page"
+    assert page.last_edited_time == "2022-01-01T10:00:00.000Z"
+    assert page.title == "Write report"
+    assert (page.start, page.end) == ("2022-03-01T10:00:00.000+01:00", None)
+    assert page.initiative == "project"
+    assert page.extra_info is None
+    assert page.on_gcal and not page.need_gcal_update and not page.done
+    assert page.gcal_event_id == "event"
+    assert page.last_updated_time is None
+    assert page.calendar_name == "Work"
+    assert page.current_calendar_id is None
+    assert not hasattr(page, "__dict__")
+
+
+def test_changes_are_applied(settings):
+    """Test that properties sent to the API are decoded into the page."""
+    page = model.PageDecoder.from_settings(settings).decode(notion_page(settings))
+
+    page.apply(
+        {
+            settings.calendar_notion_name: {"select": {"name": "Home"}},
+            settings.current_calendar_id_notion_name: {
+                "rich_text": [{"text": {"content": "home@calendar"}}]
+            },
+            settings.lastupdatedtime_notion_name: {
+                "date": {"start": "2022-01-02T00:00:00+00:00", "end": None}
+            },
+        }
+    )
+    assert page.calendar_name == "Home"
+    assert page.current_calendar_id == "home@calendar"
+    assert page.last_updated_time == "2022-01-02T00:00:00+00:00"
+
+
+def test_syncing_clears_need_gcal_update(settings):
+    """Test that a page synced earlier in a pass isn't synced again."""
+    raw_page = notion_page(settings)
+    raw_page["properties"][settings.need_gcal_update_notion_name] = {
+        "formula": {"boolean": True}
+    }
+    page = model.PageDecoder.from_settings(settings).decode(raw_page)
+    assert page.need_gcal_update
+
+    page.apply({settings.on_gcal_notion_name: {"checkbox": True}})
+    assert page.need_gcal_update
+    page.apply(
+        {
+            settings.lastupdatedtime_notion_name: {
+                "date": {"start": "2022-01-02T00:00:00+00:00", "end": None}
+            }
+        }
+    )
+    assert not page.need_gcal_update
+
+
+def test_select_initiative(settings):
+    """Test that an initiative can be a select property."""
+    settings.initiative_notion_type = "select"
+    raw_page = notion_page(settings)
+    raw_page["properties"][settings.initiative_notion_name] = {
+        "select": {"name": "Hiring"}
+    }
+
+    page = model.PageDecoder.from_settings(settings).decode(raw_page)
+    assert page.initiative == "Hiring"
+
+
+def test_unknown_fields():
+    """Test that a decoder can't be given fields that pages don't have."""
+    with pytest.raises(ValueError):
+        model.PageDecoder({"colour": "Colour"})
+
+
+def test_pages_can_be_pickled(settings):
+    """Test that pages can be sent to worker processes (see ncal.sharding)."""
+    page = model.PageDecoder.from_settings(settings).decode(notion_page(settings))
+
+    copy = pickle.loads(pickle.dumps(page))
+    assert (copy.id, copy.title, copy.calendar_name) == ("page", "Write report", "Work")
+    copy.apply({settings.on_gcal_notion_name: {"checkbox": False}})
+    assert not copy.on_gcal
+
+
+def test_events_are_decoded():
+    """Test that the dates and details of a GCal event are decoded once."""
+    event = model.SyncEvent.decode(
+        {
+            "id": "event",
+            "etag": '"1"',
+            "summary": "Meeting",
+            "organizer": {"email": "work@calendar"},
+            "start": {"dateTime": "2022-03-01T10:00:00Z"},
+            "end": {"dateTime": "2022-03-01T11:00:00Z"},
+        }
+    )
+
+    assert event.start == datetime.datetime(
+        2022, 3, 1, 10, tzinfo=datetime.timezone.utc
+    )
+    assert event.end - event.start == datetime.timedelta(hours=1)
+    assert not event.all_day
+    assert (event.summary, event.description) == ("Meeting", None)
+    assert (event.organizer, event.etag) == ("work@calendar", '"1"')
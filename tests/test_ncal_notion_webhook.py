@@ -0,0 +1,96 @@
+"""Test the Notion webhook module."""
+import hashlib
+import hmac
+import json
+import urllib.error
+import urllib.request
+
+from ncal import notion_utils, notion_webhook
+
+
+def event(page_id, event_type="page.properties_updated", database_id="db"):
+    """Make a Notion webhook event."""
+    return {
+        "type": event_type,
+        "entity": {"id": page_id, "type": "page"},
+        "data": {"parent": {"id": database_id, "type": "database"}},
+    }
+
+
+def post(port, body, headers=None):
+    """Post an event to the receiver, and get the response status."""
+    request = urllib.request.Request(
+        f"http://127.0.0.1:{port}/", data=body, headers=headers or {}, method="POST"
+    )
+    try:
+        with urllib.request.urlopen(request) as response:
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+
+
+def test_page_ids_from_event():
+    """Test that only page changes in the synced database are picked out."""
+    events = [
+        event("a"),
+        event("b", event_type="page.deleted"),
+        event("c", database_id="other"),
+        {"type": "comment.created", "entity": {"id": "d", "type": "comment"}},
+    ]
+    assert notion_webhook.page_ids_from_event(events, "db") == ["a"]
+    assert notion_webhook.page_ids_from_event("junk") == []
+
+
+def test_receiver_checks_signatures():
+    """Test posting synthetic events to the receiver."""
+    changed = []
+    receiver = notion_webhook.NotionWebhookReceiver(
+        changed.extend, secret="secret", database_id="db", host="127.0.0.1", port=0
+    )
+    receiver.start()
+    try:
+        body = json.dumps(event("a")).encode()
+        signature = hmac.new(b"secret", body, hashlib.sha256).hexdigest()
+
+        assert post(receiver.port, body) == 401
+        assert post(receiver.port, b"not json") == 400
+        assert changed == []
+        headers = {"X-Notion-Signature": f"sha256={signature}"}
+        assert post(receiver.port, body, headers) == 200
+        assert changed == ["a"]
+    finally:
+        receiver.stop()
+
+
+def test_drop_directory(tmp_path):
+    """Test that dropped event files are read once, and unreadable ones are kept."""
+    drop_directory = notion_webhook.DropDirectory(tmp_path / "events", "db")
+    (drop_directory.path / "1.json").write_text(json.dumps(event("a")))
+    (drop_directory.path / "2.json").write_text(json.dumps([event("b"), event("c")]))
+    (drop_directory.path / "3.json").write_text("{")
+    (drop_directory.path / ".4.json").write_text("{")
+    drop_directory.drop(event("d"))
+
+    assert sorted(drop_directory.drain()) == ["a", "b", "c", "d"]
+    assert drop_directory.drain() == []
+    assert sorted(p.name for p in drop_directory.path.iterdir()) == [
+        ".4.json",
+        notion_webhook.UNREADABLE_DIRECTORY,
+    ]
+    unreadable = drop_directory.path / notion_webhook.UNREADABLE_DIRECTORY
+    assert [p.name for p in unreadable.iterdir()] == ["3.json"]
+
+
+def test_changed_related_pages_titles_are_dropped(tmp_path):
+    """Test that a related page's title is fetched again once it has changed."""
+    cache = notion_utils.RelationTitleCache()
+    cache.set("project-1", "Old name")
+    cache.set("project-2", "Unchanged")
+    drop_directory = notion_webhook.DropDirectory(
+        tmp_path / "events", "db", title_cache=cache
+    )
+    drop_directory.drop(event("project1", database_id="projects"))
+
+    assert drop_directory.drain() == []
+    assert cache.get("project-1") is None
+    assert cache.get("project-2") == "Unchanged"
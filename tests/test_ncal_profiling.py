@@ -0,0 +1,70 @@
+"""Test the phase profiler."""
+import json
+import time
+
+import pytest
+
+from ncal import profiling
+
+
+def slow_phase(n):
+    """Allocate some memory, and wait for a while."""
+    numbers = [str(i) for i in range(n)]
+    time.sleep(0.05)
+    return len(numbers)
+
+
+@pytest.fixture
+def profiler(tmp_path):
+    """Make a profiler which writes its files to a temporary directory."""
+    profiler = profiling.PhaseProfiler(tmp_path, top=5)
+    yield profiler
+    profiler.close()
+
+
+def test_phases_are_profiled(profiler):
+    """Test that the time, memory and functions of a phase are measured."""
+    assert profiler.wrap("slow", slow_phase)(100_000) == 100_000
+
+    [profile] = profiler.profiles
+    assert profile.phase == "slow"
+    assert profile.wall_seconds >= 0.05
+    assert profile.waiting_seconds >= 0.04
+    assert profile.peak_memory > 100_000
+    report = profiler.report()
+    assert report.startswith("slow: ")
+    assert "(slow_phase)" in report
+    assert "<built-in method time.sleep>" in report
+    assert profiler.profiles == []
+
+
+def test_profiles_are_written(profiler, tmp_path):
+    """Test that each pass writes a pstats file per phase, and a speedscope file."""
+    profiler.call("new N->G", slow_phase, 10)
+    profiler.call("delete", slow_phase, 10)
+    profiler.report()
+
+    assert sorted(p.name for p in tmp_path.iterdir()) == [
+        "001-delete.pstats",
+        "001-new-n-g.pstats",
+        "001.speedscope.json",
+    ]
+    speedscope = json.loads((tmp_path / "001.speedscope.json").read_text())
+    assert [p["name"] for p in speedscope["profiles"]] == ["new N->G", "delete"]
+    frames = speedscope["shared"]["frames"]
+    for profile in speedscope["profiles"]:
+        assert len(profile["samples"]) == len(profile["weights"])
+        # the time asleep is under the phase
+        slept = [
+            weight
+            for stack, weight in zip(profile["samples"], profile["weights"])
+            if frames[stack[-1]]["name"] == "<built-in method time.sleep>"
+        ]
+        assert sum(slept) == pytest.approx(0.05, abs=0.03)
+
+
+def test_errors_are_profiled_too(profiler):
+    """Test that a phase which fails is still profiled."""
+    with pytest.raises(ZeroDivisionError):
+        profiler.call("broken", lambda: 1 / 0)
+    assert [profile.phase for profile in profiler.profiles] == ["broken"]
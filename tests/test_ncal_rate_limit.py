@@ -0,0 +1,106 @@
+"""Test the rate limiting module."""
+import httplib2  # type: ignore
+import httpx
+import notion_client as nc
+import pytest
+from googleapiclient.errors import HttpError  # type: ignore
+
+from ncal import rate_limit
+
+
+def notion_error(status, headers=None):
+    """Make an error like the ones the Notion client raises."""
+    response = httpx.Response(status, headers=headers or {})
+    return nc.errors.APIResponseError(response, "error", "rate_limited")
+
+
+def test_rate_limiter_spaces_out_requests(clock):
+    """Test that requests after the first burst are sent at the limiter's rate."""
+    limiter = rate_limit.RateLimiter(2, capacity=2, clock=clock, sleep=clock.sleep)
+    for _ in range(6):
+        limiter.acquire()
+    assert clock.now == pytest.approx(2)
+
+
+def test_rate_limiter_adapts():
+    """Test that throttling halves the rate, and successes bring it back."""
+    limiter = rate_limit.RateLimiter(10)
+    limiter.throttled()
+    assert limiter.rate == 5
+    for _ in range(20):
+        limiter.succeeded()
+    assert limiter.rate == 10
+
+
+def test_retry_after():
+    """Test which errors are retried, and for how long."""
+    assert rate_limit.notion_retry_after(notion_error(429, {"retry-after": "2"})) == 2
+    assert rate_limit.notion_retry_after(notion_error(400)) is None
+    assert rate_limit.notion_retry_after(ValueError()) is None
+
+    rate_limited = HttpError(
+        httplib2.Response({"status": 403, "retry-after": "3"}),
+        b'{"error": {"errors": [{"reason": "userRateLimitExceeded"}]}}',
+    )
+    forbidden = HttpError(
+        httplib2.Response({"status": 403}),
+        b'{"error": {"errors": [{"reason": "forbidden"}]}}',
+    )
+    assert rate_limit.gcal_retry_after(rate_limited) == 3
+    assert rate_limit.gcal_retry_after(forbidden) is None
+    assert (
+        rate_limit.gcal_retry_after(HttpError(httplib2.Response({"status": 503}), b""))
+        == 0
+    )
+
+
+def test_non_idempotent_requests_are_only_retried_when_throttled():
+    """Test that creates aren't retried after errors they may have succeeded in."""
+    timeout = nc.errors.RequestTimeoutError()
+    assert rate_limit.notion_retry_after(notion_error(502), idempotent=False) is None
+    assert rate_limit.notion_retry_after(timeout, idempotent=False) is None
+    assert rate_limit.notion_retry_after(notion_error(429), idempotent=False) == 0
+    assert rate_limit.notion_retry_after(timeout) == 0
+
+    unavailable = HttpError(httplib2.Response({"status": 503}), b"")
+    throttled = HttpError(httplib2.Response({"status": 429}), b"")
+    assert rate_limit.gcal_retry_after(unavailable, idempotent=False) is None
+    assert rate_limit.gcal_retry_after(throttled, idempotent=False) == 0
+
+    class Request:
+        def __init__(self, method_id):
+            self.methodId = method_id
+
+    assert rate_limit.gcal_idempotent(Request("calendar.events.update"))
+    assert not rate_limit.gcal_idempotent(Request("calendar.events.insert"))
+
+
+def test_call_with_retry():
+    """Test that throttled calls are retried, waiting at least Retry-After."""
+    waits = []
+    attempts = iter([notion_error(429, {"retry-after": "2"}), notion_error(502)])
+
+    def call():
+        error = next(attempts, None)
+        if error is not None:
+            raise error
+        return "done"
+
+    result = rate_limit.call_with_retry(
+        call, None, rate_limit.notion_retry_after, sleep=waits.append
+    )
+    assert result == "done"
+    assert len(waits) == 2
+    assert waits[0] >= 2
+
+    def always_throttled():
+        raise notion_error(429)
+
+    with pytest.raises(nc.errors.APIResponseError):
+        rate_limit.call_with_retry(
+            always_throttled,
+            None,
+            rate_limit.notion_retry_after,
+            max_retries=1,
+            sleep=waits.append,
+        )
@@ -0,0 +1,58 @@
+"""Test the sync runner module."""
+import asyncio
+import contextlib
+import io
+
+import pytest
+
+from benchmarks.workspace import make_workspace
+from ncal import runner
+from ncal.scheduler import Scheduler
+from ncal.snapshot import SnapshotCache
+from ncal.state import StateStore, SyncTokenStore
+
+
+def test_push_sync_of_one_calendar_only_lists_its_events():
+    """Test that a notification for one calendar doesn't look at the others."""
+    workspace = make_workspace(pages=100, calendars=4)
+    settings, notion, calendar = (
+        workspace.settings,
+        workspace.notion,
+        workspace.calendar,
+    )
+    asyncio.run(runner.sync(settings, calendar, notion))
+    calendar.calls.reset()
+
+    calendar_id = next(iter(settings.calendar_dictionary.values()))
+    asyncio.run(runner.sync_calendars(settings, calendar, notion, {calendar_id}))
+
+    # one list of the calendar for each GCal -> Notion phase, and nothing else
+    assert calendar.calls.counts() == {"gcal.events.list": 2}
+
+
+@pytest.mark.parametrize("state", [False, True])
+def test_idle_passes_lengthen_the_interval(state):
+    """Test that passes which change nothing report no changes."""
+    workspace = make_workspace(pages=100, calendars=3)
+    state_store = StateStore(":memory:") if state else None
+    sync_tokens, snapshots = SyncTokenStore(None), SnapshotCache()
+    schedule = Scheduler(10, max_interval=100)
+
+    def sync():
+        with contextlib.redirect_stdout(io.StringIO()):
+            return asyncio.run(
+                runner.sync(
+                    workspace.settings,
+                    workspace.calendar,
+                    workspace.notion,
+                    sync_tokens,
+                    state_store,
+                    snapshots,
+                )
+            )
+
+    schedule.adapt(sync())
+    assert schedule.current_interval == 10
+    schedule.adapt(sync())
+    schedule.adapt(sync())
+    assert schedule.current_interval == 40
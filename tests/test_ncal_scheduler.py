@@ -0,0 +1,45 @@
+"""Test the sync scheduler."""
+import asyncio
+
+import pytest
+
+from ncal import scheduler
+
+
+@pytest.mark.parametrize(
+    "overlap,expected",
+    [("skip", 40.0), ("queue", 20.0), ("coalesce", 30.0)],
+)
+def test_next_deadline_after_overrun(overlap, expected):
+    """Test each overlap policy when a run due at 10s takes until 35s."""
+    schedule = scheduler.Scheduler(10, overlap=overlap)
+    assert schedule.next_deadline(10, 15) == 20
+    assert schedule.next_deadline(10, 35) == expected
+
+
+def test_adaptive_interval():
+    """Test that the interval grows while idle, and resets on changes."""
+    schedule = scheduler.Scheduler(10, max_interval=35)
+    schedule.adapt(0)
+    schedule.adapt(0)
+    assert schedule.current_interval == 35
+    schedule.adapt(None)
+    assert schedule.current_interval == 35
+    schedule.adapt(3)
+    assert schedule.current_interval == 10
+
+
+def test_run_sleeps_until_each_deadline(clock, monkeypatch):
+    """Test that the schedule doesn't drift, however long each run takes."""
+    monkeypatch.setattr(scheduler.asyncio, "sleep", clock.async_sleep)
+    started = []
+
+    async def work():
+        started.append(clock.now)
+        clock.now += 3
+        return 1
+
+    schedule = scheduler.Scheduler(10, clock=clock)
+    asyncio.run(schedule.run(work, max_runs=3))
+    assert started == [10, 20, 30]
+    assert clock.sleeps == [10, 7, 7]
@@ -0,0 +1,118 @@
+"""Test the sharding module."""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+import pytest
+
+from benchmarks.workspace import make_workspace
+from ncal import config, runner, sharding
+from ncal.model import SyncPage
+from ncal.snapshot import SyncSnapshot
+from ncal.state import SyncTokenStore
+
+
+@pytest.fixture
+def settings():
+    """Generate some settings with three calendars."""
+    return config.Settings(
+        notion_api_token="a",
+        database_id="b",
+        url_root="c",
+        default_calendar_name="Work",
+        calendar_dictionary={"Work": "w", "Home": "h", "Gym": "g"},
+    )
+
+
+def page(page_id, calendar):
+    """Make a (partial) Notion page on a calendar."""
+    return SyncPage(page_id, calendar_name=calendar)
+
+
+PHASES = (
+    "new_events_notion_to_gcal",
+    "existing_events_notion_to_gcal",
+    "existing_events_gcal_to_notion",
+    "new_events_gcal_to_notion",
+)
+
+
+def test_sync_shard(settings):
+    """Test that each phase sees the shard's pages or the shard's calendars."""
+    pages = [page("1", "Work"), page("2", None), page("3", "Home"), page("4", "Gym")]
+    phases = {name: mock.Mock(return_value=1) for name in PHASES}
+
+    def new_events(*args, sync_tokens, **kwargs):
+        sync_tokens.set("h", "new token")
+        return 2
+
+    phases["new_events_gcal_to_notion"].side_effect = new_events
+    with mock.patch.multiple(sharding.core, **phases):
+        result = sharding.sync_shard(
+            pages, {"h", "g"}, {"h": "old token"}, settings, mock.Mock(), mock.Mock()
+        )
+
+    assert result.changes == {
+        "new N->G": 1,
+        "modified N->G": 1,
+        "modified G->N": 1,
+        "new G->N": 2,
+    }
+    assert result.sync_tokens == {"h": "new token"}
+    shard_snapshot = phases["new_events_notion_to_gcal"].call_args.kwargs["snapshot"]
+    assert [p.id for p in shard_snapshot.pages] == ["3", "4"]
+    gcal_call = phases["new_events_gcal_to_notion"].call_args
+    assert gcal_call.args[1] == {"Home": "h", "Gym": "g"}
+
+
+def test_shards_dont_repeat_each_others_lookups():
+    """Test that each shard only looks up the missing events of its own pages."""
+    workspace = make_workspace(pages=100, calendars=4)
+    settings, notion, calendar = (
+        workspace.settings,
+        workspace.notion,
+        workspace.calendar,
+    )
+    asyncio.run(runner.sync(settings, calendar, notion))
+    calendar_ids = list(settings.calendar_dictionary.values())
+    deleted = calendar.all_events(calendar_ids[0])[0]
+    calendar.events().delete(
+        calendarId=calendar_ids[0], eventId=deleted["id"]
+    ).execute()
+    pages = SyncSnapshot.fetch(notion, settings).pages
+    calendar.calls.reset()
+
+    for shard in ({calendar_ids[0], calendar_ids[1]}, set(calendar_ids[2:])):
+        sharding.sync_shard(pages, shard, {}, settings, calendar, notion)
+
+    # the deleted event's page is only looked for by its own shard, on both of its
+    # calendars
+    assert calendar.calls.counts().get("gcal.events.get") == 2
+
+
+def test_sharded_sync_merges_results(settings, tmp_path):
+    """Test that the shards' changes and sync tokens are merged."""
+    settings = settings.copy(update={"sync_processes": 2})
+    snapshot = SyncSnapshot([page("1", "Work"), page("2", "Home")], settings)
+    sync_tokens = SyncTokenStore(tmp_path / "tokens.json")
+    sync_tokens.set("w", "old w")
+    sync_tokens.set("g", "old g")
+
+    def sync_shard(pages, calendar_ids, tokens, *args):
+        assert set(tokens) <= calendar_ids
+        # the token for g expired, and wasn't replaced
+        new_tokens = {c: f"new {c}" for c in calendar_ids if c != "g"}
+        return sharding.ShardResult(calendar_ids, {"new N->G": 1}, new_tokens)
+
+    shards = sharding.ShardedSync(settings)
+    with ThreadPoolExecutor() as executor, mock.patch.object(
+        shards, "_start", return_value=executor
+    ), mock.patch.object(sharding, "sync_shard", sync_shard), mock.patch.object(
+        sharding, "_worker", mock.Mock()
+    ):
+        assert shards.run(snapshot, sync_tokens) == 2
+
+    assert SyncTokenStore(tmp_path / "tokens.json").tokens() == {
+        "w": "new w",
+        "h": "new h",
+    }
@@ -0,0 +1,151 @@
+"""Test the sync snapshot module."""
+from unittest import mock
+
+import arrow
+import pytest
+
+from ncal import config, core, model, snapshot
+
+
+@pytest.fixture
+def settings():
+    """Generate some sample settings."""
+    return config.Settings(notion_api_token="asdf", database_id="asdf", url_root="a")
+
+
+def make_page(settings, page_id, on_gcal, need_update, done, event_id, calendar):
+    """Make a (partial) Notion page, decoded."""
+    return model.PageDecoder.from_settings(settings).decode(
+        {
+            "id": page_id,
+            "properties": {
+                settings.on_gcal_notion_name: {"type": "checkbox", "checkbox": on_gcal},
+                settings.need_gcal_update_notion_name: {
+                    "type": "formula",
+                    "formula": {"type": "boolean", "boolean": need_update},
+                },
+                settings.delete_notion_name: {"type": "checkbox", "checkbox": done},
+                settings.gcal_event_id_notion_name: {
+                    "rich_text": [{"text": {"content": event_id}}] if event_id else []
+                },
+                settings.calendar_notion_name: {
+                    "select": {"name": calendar} if calendar else None
+                },
+            },
+        }
+    )
+
+
+def test_snapshot_partitions(settings):
+    """Test that pages are partitioned like the database queries would."""
+    pages = [
+        make_page(settings, "new", False, False, False, None, None),
+        make_page(settings, "changed", True, True, False, "e1", "Cal"),
+        make_page(settings, "synced", True, False, False, "e2", "Cal"),
+        make_page(settings, "done", True, False, True, "e3", "Cal"),
+    ]
+    sync_snapshot = snapshot.SyncSnapshot(pages, settings)
+
+    def ids(pages):
+        return [p.id for p in pages]
+
+    assert ids(sync_snapshot.new_pages()) == ["new"]
+    assert ids(sync_snapshot.no_calendar_pages()) == ["new"]
+    assert ids(sync_snapshot.need_update_pages()) == ["changed"]
+    assert ids(sync_snapshot.synced_pages()) == ["synced"]
+    assert ids(sync_snapshot.done_pages()) == ["done"]
+    assert sync_snapshot.gcal_event_ids() == ["e1", "e2", "e3"]
+
+
+def test_update_page_reflected_in_snapshot(settings):
+    """Test that core.update_page keeps the snapshot in step with Notion."""
+    page = make_page(settings, "new", False, False, False, None, None)
+    sync_snapshot = snapshot.SyncSnapshot([page], settings)
+    notion = mock.MagicMock()
+
+    core.update_page(
+        notion,
+        page,
+        {
+            settings.on_gcal_notion_name: {"checkbox": True},
+            settings.gcal_event_id_notion_name: {
+                "rich_text": [{"text": {"content": "e1"}}]
+            },
+        },
+    )
+
+    notion.pages.update.assert_called_once()
+    assert sync_snapshot.new_pages() == []
+    assert sync_snapshot.gcal_event_ids() == ["e1"]
+
+
+def test_fetch_pages_keeps_pages_in_the_database(settings):
+    """Test that only live pages from the synced database are kept."""
+    pages = {
+        "a": {"id": "a", "parent": {"database_id": "asdf"}, "archived": False},
+        "b": {"id": "b", "parent": {"database_id": "other"}, "archived": False},
+        "c": {"id": "c", "parent": {"database_id": "asdf"}, "archived": True},
+    }
+    notion = mock.MagicMock()
+    notion.pages.retrieve.side_effect = pages.__getitem__
+
+    sync_snapshot = snapshot.SyncSnapshot.fetch_pages(
+        notion, settings, ["a", "b", "c", "a"]
+    )
+    assert [p.id for p in sync_snapshot.pages] == ["a"]
+    assert notion.pages.retrieve.call_count == 3
+
+
+def test_snapshot_cache_only_fetches_edited_pages(settings):
+    """Test that later passes only ask for pages edited since the last one."""
+    now = 0.0
+    notion = mock.MagicMock()
+    notion.databases.query.return_value = {
+        "results": [
+            {"id": "a", "last_edited_time": "2022-01-01T10:00:00.000Z"},
+            {"id": "b", "last_edited_time": "2022-01-01T11:00:00.000Z"},
+        ],
+        "next_cursor": None,
+    }
+    snapshots = snapshot.SnapshotCache(full_query_interval=60, clock=lambda: now)
+    sync_snapshot = snapshots.get(notion, settings)
+    assert sync_snapshot.high_water_mark == "2022-01-01T11:00:00.000Z"
+
+    edited = {"id": "a", "last_edited_time": "2022-01-01T12:00:00.000Z"}
+    notion.databases.query.return_value = {"results": [edited], "next_cursor": None}
+    now = 30
+    assert snapshots.get(notion, settings) is sync_snapshot
+    assert [(p.id, p.last_edited_time) for p in sync_snapshot.pages] == [
+        ("a", "2022-01-01T12:00:00.000Z"),
+        ("b", "2022-01-01T11:00:00.000Z"),
+    ]
+    assert sync_snapshot.high_water_mark == "2022-01-01T12:00:00.000Z"
+    query = notion.databases.query.call_args.kwargs
+    assert query["filter"]["last_edited_time"] == {
+        "on_or_after": "2022-01-01T11:00:00.000Z"
+    }
+
+    now = 60
+    assert [p.id for p in snapshots.get(notion, settings).pages] == ["a"]
+    assert "filter" not in notion.databases.query.call_args.kwargs
+
+
+def test_snapshot_sync_window(settings):
+    """Test that pages outside of the sync window are left out of the partitions."""
+    today = arrow.utcnow()
+    settings.sync_window_past = 7
+    settings.sync_window_future = 30
+    pages = []
+    for page_id, start in [
+        ("old", today.shift(days=-8).format("YYYY-MM-DD")),
+        ("soon", today.shift(days=1).isoformat()),
+        ("later", today.shift(days=31).format("YYYY-MM-DD")),
+        ("undated", None),
+    ]:
+        page = make_page(settings, page_id, True, False, False, page_id, "Cal")
+        page.start = start
+        pages.append(page)
+    sync_snapshot = snapshot.SyncSnapshot(pages, settings)
+
+    assert [p.id for p in sync_snapshot.synced_pages()] == ["soon", "undated"]
+    assert sync_snapshot.gcal_event_ids() == ["old", "soon", "later", "undated"]
@@ -0,0 +1,103 @@
+"""Test the local state module."""
+import datetime
+import sqlite3
+
+from ncal import model, state
+
+
+def test_sync_token_store(tmp_path):
+    """Test that sync tokens are only persisted once saved."""
+    path = tmp_path / "tokens.json"
+    sync_tokens = state.SyncTokenStore(path)
+    assert sync_tokens.get("cal") is None
+
+    sync_tokens.set("cal", "token")
+    assert state.SyncTokenStore(path).get("cal") is None
+    sync_tokens.save()
+    assert state.SyncTokenStore(path).get("cal") == "token"
+
+    sync_tokens.drop("cal")
+    sync_tokens.save()
+    assert state.SyncTokenStore(path).get("cal") is None
+
+
+def event(etag):
+    """Make a GCal event with an etag."""
+    start = datetime.datetime(2022, 1, 1)
+    return model.SyncEvent("event", start, start, etag=etag)
+
+
+def test_state_store(tmp_path):
+    """Test that page state is upserted field by field and persisted on commit."""
+    path = tmp_path / "state.sqlite3"
+    state_store = state.StateStore(path)
+    assert state_store.get("page") is None
+
+    state_store.record("page", event_id="event", last_edited_time="t1")
+    state_store.record("page", event_etag='"1"')
+    assert state_store.get("page") == state.PageState(
+        "page", event_id="event", last_edited_time="t1", event_etag='"1"'
+    )
+    assert state_store.event_unchanged("page", event('"1"'))
+    assert not state_store.event_unchanged("page", event('"2"'))
+
+    page = model.SyncPage("page", "t1", title="Report", start="2022-01-01")
+    assert not state_store.page_unchanged(page)
+    state_store.record("page", page_hash=state.page_hash(page))
+    assert state_store.page_unchanged(page)
+    assert not state_store.page_unchanged(model.SyncPage("other", "t1"))
+
+    state_store.close()
+    state_store = state.StateStore(path)
+    assert state_store.get("page").event_id == "event"
+    state_store.forget("page")
+    assert state_store.get("page") is None
+
+
+def test_page_changes_in_the_same_minute():
+    """Test that an edit is noticed even when the last edited time is the same."""
+    page = model.SyncPage("page", "2022-01-01T10:00:00.000Z", title="Report")
+    edited = model.SyncPage("page", "2022-01-01T10:00:00.000Z", title="Report v2")
+    synced_again = model.SyncPage(
+        "page", "2022-01-01T10:05:00.000Z", title="Report", last_updated_time="now"
+    )
+    assert state.page_hash(page) != state.page_hash(edited)
+    assert state.page_hash(page) == state.page_hash(synced_again)
+
+
+def test_older_databases_are_upgraded(tmp_path):
+    """Test that the columns added since a database was made are added to it."""
+    path = tmp_path / "state.sqlite3"
+    connection = sqlite3.connect(path)
+    connection.execute(
+        "CREATE TABLE pages (page_id TEXT PRIMARY KEY, event_id TEXT, "
+        "last_edited_time TEXT, event_etag TEXT, event_updated TEXT, "
+        "content_hash TEXT)"
+    )
+    connection.execute("INSERT INTO pages (page_id, event_id) VALUES ('p', 'e')")
+    connection.commit()
+    connection.close()
+
+    state_store = state.StateStore(path)
+    state_store.record("p", page_hash="hash")
+    assert state_store.get("p") == state.PageState("p", "e", page_hash="hash")
+
+
+def test_autocommit_doesnt_hold_the_write_lock(tmp_path):
+    """Test that processes sharing a database don't wait on each other's commits."""
+    path = tmp_path / "state.sqlite3"
+    first = state.StateStore(path, timeout=0, autocommit=True)
+    second = state.StateStore(path, timeout=0, autocommit=True)
+
+    first.record("a", event_id="1")
+    second.record("b", event_id="2")
+    first.record("a", event_etag='"1"')
+
+    assert second.get("a") == state.PageState("a", "1", event_etag='"1"')
+    assert first.get("b") == state.PageState("b", "2")
+
+
+def test_content_hash_ignores_key_order():
+    """Test that equal event bodies hash the same."""
+    assert state.content_hash({"a": 1, "b": 2}) == state.content_hash({"b": 2, "a": 1})
+    assert state.content_hash({"a": 1}) != state.content_hash({"a": 2})
@@ -1,4 +1,6 @@
 """Test notion_utils module."""
+from unittest import mock
+
 import hypothesis
 import pytest
 from hypothesis import strategies as st
@@ -64,3 +66,32 @@ def test_collapse_rich_text_property(test_list):
     assert notion_utils.collapse_rich_text_property(test_list) == "".join(
         i["plain_text"] for i in test_list
     )
+
+
+def test_relation_title_cache_expiry_and_eviction(clock):
+    """Test that titles expire after the ttl, and the oldest is evicted."""
+    cache = notion_utils.RelationTitleCache(ttl=10, maxsize=2, clock=clock)
+    cache.set("a", "A")
+    cache.set("b", "B")
+    assert cache.get("a") == "A"
+    cache.set("c", "C")
+    assert cache.get("b") is None
+    assert len(cache) == 2
+
+    clock.now = 10
+    assert cache.get("a") is None
+    assert cache.get("c") is None
+
+
+def test_get_relation_title_uses_cache():
+    """Test that each related page's title is only fetched once."""
+    notion = mock.MagicMock()
+    notion.pages.properties.retrieve.return_value = {
+        "results": [{"title": {"plain_text": "Project"}}]
+    }
+    page = {"properties": {"Project": {"relation": [{"id": "project-id"}]}}}
+    cache = notion_utils.RelationTitleCache()
+    for _ in range(3):
+        title = notion_utils.get_relation_title(notion, page, "Project", cache=cache)
+        assert title == "Project"
+    notion.pages.properties.retrieve.assert_called_once_with("project-id", "title")
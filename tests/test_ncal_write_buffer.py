@@ -0,0 +1,37 @@
+"""Test the write_buffer module."""
+from unittest import mock
+
+from ncal import model, write_buffer
+
+
+def test_changes_to_a_page_are_written_once():
+    """Test that properties staged for the same page are merged into one write."""
+    notion = mock.MagicMock()
+    notion.pages.update.return_value = {"last_edited_time": "later"}
+    decoder = model.PageDecoder({"on_gcal": "On GCal?", "calendar": "Calendar"})
+    page = model.SyncPage("page", "earlier", decoder)
+    other_page = model.SyncPage("other", "earlier", decoder)
+
+    writes = write_buffer.PageWriteBuffer(notion)
+    writes.stage(page, {"On GCal?": {"checkbox": True}, "Calendar": {"select": None}})
+    writes.stage(page, {"Calendar": {"select": {"name": "Work"}}})
+    writes.stage(other_page, {"On GCal?": {"checkbox": True}})
+    assert len(writes) == 2
+    assert page.on_gcal
+    assert page.calendar_name == "Work"
+    notion.pages.update.assert_not_called()
+
+    writes.flush()
+    assert len(writes) == 0
+    assert notion.pages.update.call_count == 2
+    notion.pages.update.assert_any_call(
+        page_id="page",
+        properties={
+            "On GCal?": {"checkbox": True},
+            "Calendar": {"select": {"name": "Work"}},
+        },
+    )
+    assert page.last_edited_time == "later"
+
+    writes.flush()
+    assert notion.pages.update.call_count == 2